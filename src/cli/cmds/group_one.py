@@ -1,10 +1,14 @@
 import os.path
+import sys
 
 import click
 
-import cli.libs.utils as utils
+from cli.libs import cluster, errors, inventory, journal, output, summary
 from cli.libs.click_config import pass_config
 
+# utils and probe import python-libmaas and aiohttp, so the commands import
+# them when they run instead of `mctl machines --help`
+
 
 @click.group(name="machines")  # type: ignore
 @pass_config
@@ -16,17 +20,110 @@ def group_one(config):
 
 
 @click.command()
+@click.option(
+    "--output",
+    "output_format",
+    type=click.Choice(["text", "json", "ndjson", "csv"]),
+    default="text",
+    help="Output format",
+)
+@click.option(
+    "--fields",
+    default=None,
+    callback=output.parse_fields,
+    help=f"Comma-separated fields to print: {', '.join(output.FIELDS)}",
+)
+@click.option(
+    "--tags",
+    default=None,
+    help="A comma-separated list of tags, machines with any of them are listed",
+)
+@click.option(
+    "--resource-pools",
+    default=None,
+    help="A comma-separated list of resource pools to list machines from",
+)
+@click.option("--owner", default=None, help="List the machines of this owner")
 @pass_config
-def ls(config):
+def ls(config, output_format, fields, tags, resource_pools, owner):
     """
     Lists all machines registered with the MAAS server.
+
+    Machines are written as soon as they are read. Selecting by tags,
+    resource pools or owner needs the whole listing first.
     """
+    from cli.libs import utils
+
     try:
-        machines = config.client.machines.list()
-        for machine in machines:
-            click.echo(machine.hostname)
+        machines = inventory.iter_machines(config)
+        if tags:
+            machines = utils.get_machines_by_tags(list(machines), tags.split(","))
+        if resource_pools:
+            machines = utils.get_machines_by_pool_name(
+                list(machines), resource_pools.split(",")
+            )
+        if owner:
+            machines = utils.get_machines_by_owner(list(machines), owner)
+        output.write_records(machines, output_format, fields)
     except Exception as e:
-        click.echo(f"An error occurred: {e}")
+        click.echo(f"An error occurred: {e}", err=True)
+        sys.exit(1)
+
+
+@click.command(name="summary")
+@click.option(
+    "--by",
+    default="pool,status",
+    callback=summary.parse_dimensions,
+    help=f"Comma-separated dimensions to count machines by: {', '.join(summary.DIMENSIONS)}",
+)
+@click.option(
+    "--tags",
+    default=None,
+    help="A comma-separated list of tags, machines with any of them are counted",
+)
+@click.option(
+    "--resource-pools",
+    default=None,
+    help="A comma-separated list of resource pools to count machines in",
+)
+@click.option("--owner", default=None, help="Count the machines of this owner")
+@click.option(
+    "--status",
+    default=None,
+    help="A comma-separated list of statuses to count machines in (ex. Ready,Released)",
+)
+@click.option(
+    "--output",
+    "output_format",
+    type=click.Choice(["table", "json"]),
+    default="table",
+    help="Output format",
+)
+@pass_config
+def fleet_summary(config, by, tags, resource_pools, owner, status, output_format):
+    """
+    Counts the machines registered with the MAAS server by resource pool,
+    status, tag and owner, and how many of them can be allocated.
+
+    The fleet is read once and counted as it is read, so capacity can be
+    checked before allocating. A machine is counted once for every tag it
+    has.
+    """
+    try:
+        fleet = summary.FleetSummary.from_records(inventory.iter_machines(config))
+        report = summary.summarize(
+            fleet,
+            by,
+            pools=resource_pools.split(",") if resource_pools else None,
+            statuses=status.split(",") if status else None,
+            owners=[owner] if owner else None,
+            tags=tags.split(",") if tags else None,
+        )
+        summary.write_report(report, output_format)
+    except Exception as e:
+        click.echo(f"An error occurred: {e}", err=True)
+        sys.exit(1)
 
 
 @click.command()
@@ -38,44 +135,112 @@ def ls(config):
     help="The tags used to select servers within the pool (ex. T1,R6515)",
 )
 @pass_config
+@inventory.invalidates_cache
 def allocate_from_pool(config, pool_name, tags, count):
     """Print POOL_NAME.
 
     POOL_NAME is the name of the pool where servers should be allocated
     """
-    try:
-        machines = config.client.machines.list()
+    from cli.libs import utils
 
-        pool_machines = utils.get_machines_by_pool_name(machines, [pool_name])
-
-        if tags:
-            pool_machines = utils.get_machines_by_tags(pool_machines, tags.split(","))
-
-        filtered_machines = list(
-            filter(
-                lambda machine: machine.status_name in ["Ready", "Released"],
-                pool_machines,
-            )
+    try:
+        selected_machines = utils.allocate_from_pool(
+            pool_name, count, tags.split(",") if tags else None
         )
-
-        selected_machines = utils.select_random_machines(count, filtered_machines)
-        utils.allocate_machines(selected_machines)
         click.echo(",".join([machine.hostname for machine in selected_machines]))
     except Exception as e:
         click.echo(f"An error occurred: {e}")
 
 
 @click.command()
-@click.argument("machine-name", required=True)
+@click.argument("machine-names", required=False)
+@click.option(
+    "--file",
+    "names_file",
+    type=click.File("r"),
+    default=None,
+    help="A file with one machine name per line, - reads from stdin",
+)
+@click.option(
+    "--tags", default=None, help="A comma-separated list of tags to select machines by"
+)
+@click.option(
+    "--resource-pools",
+    default=None,
+    help="A comma-separated list of resource pools to select machines by",
+)
+@click.option("--owner", default=None, help="Select the machines of this owner")
+@click.option(
+    "--all-ips",
+    is_flag=True,
+    help="Print every address of a machine, not just the first",
+)
+@click.option(
+    "--output",
+    "output_format",
+    type=click.Choice(["text", "json", "csv"]),
+    default="text",
+    help="Output format",
+)
 @pass_config
-def get_ip_address(config, machine_name):
+def get_ip_address(
+    config,
+    machine_names,
+    names_file,
+    tags,
+    resource_pools,
+    owner,
+    all_ips,
+    output_format,
+):
     """
-    Gets the IP address of the machine specified by the machine-name
+    Gets the IP addresses of the machines specified by machine-names
+
+    All machines are resolved from a single listing. With a single machine
+    name only its address is printed, otherwise hostname and address pairs.
 
     Args:
-        machine-name: The name of the machine to retrieve the ip address
+        machine-names: A comma separated list of machine names
     """
-    click.echo(utils.get_ip_address(machine_name))
+    from cli.libs import utils
+
+    names = machine_names.split(",") if machine_names else []
+    if names_file:
+        names += [line.strip() for line in names_file if line.strip()]
+
+    try:
+        if names:
+            machines = utils.get_machines_by_names(
+                inventory.list_machines_by_names(config, names), names
+            )
+        elif tags:
+            machines = utils.get_machines_by_tags(
+                inventory.list_machines(config), tags.split(",")
+            )
+        elif resource_pools:
+            machines = utils.get_machines_by_pool_name(
+                inventory.list_machines(config), resource_pools.split(",")
+            )
+        elif owner:
+            machines = utils.get_machines_by_owner(
+                inventory.list_machines(config), owner
+            )
+        else:
+            raise click.exceptions.UsageError(
+                "Machine names, --file, --tags, --resource-pools or --owner is required"
+            )
+    except click.exceptions.UsageError:
+        raise
+    except Exception as e:
+        click.echo(f"An error occurred: {e}")
+        sys.exit(1)
+
+    addresses = utils.get_ip_addresses(machines, all_ips)
+    if machine_names and len(names) == 1 and not all_ips and output_format == "text":
+        # a single machine prints just its address, as it always has
+        click.echo(next(iter(addresses.values()), None))
+    else:
+        output.write_addresses(addresses, output_format)
 
 
 @click.command()
@@ -93,15 +258,32 @@ def get_ip_address(config, machine_name):
 @click.option(
     "--owner", default=None, help="Owner name for which machines will be released"
 )
+@click.option(
+    "--parallelism",
+    type=click.IntRange(min=1),
+    default=50,
+    help="Maximum number of machines released at the same time",
+)
+@click.option(
+    "--timeout",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Seconds to wait for each machine to be released",
+)
 @click.argument("machine-names", required=False)
 @pass_config
-def release(config, all, tags, resource_pools, owner, machine_names):
+@inventory.invalidates_cache
+def release(
+    config, all, tags, resource_pools, owner, parallelism, timeout, machine_names
+):
     """
     Releases specified or all machines with a "Deployed" status message.
 
     Args:
         machine-names: A comma separted list of machine names that should be released
     """
+    from cli.libs import utils
+
     try:
         machines = config.client.machines.list()
         deployed_machines = [
@@ -136,11 +318,8 @@ def release(config, all, tags, resource_pools, owner, machine_names):
                 "A comma separated list of machine names or the --all flag must be provided."
             )
             return
-        for machine in selected_machines:
-            machine.release()
-            utils.wait_for_machine_status(
-                machine, ["Ready", "Released", "Releasing failed"]
-            )
+        results = utils.release_machines(selected_machines, parallelism, timeout)
+        utils.echo_release_results(results)
     except Exception as e:
         click.echo(f"An error occurred: {e}")
 
@@ -159,17 +338,58 @@ def release(config, all, tags, resource_pools, owner, machine_names):
     help="Comma-separated list of agent machine names",
 )
 @click.option("--token", type=str, default=None, help="RKE token to use for deployment")
+@click.option(
+    "--parallelism",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Maximum number of secondary servers and agents deployed at the same time",
+)
+@click.option(
+    "--timeout",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Seconds to wait for each machine to be deployed",
+)
+@click.option(
+    "--compress-user-data/--no-compress-user-data",
+    default=False,
+    help="Gzip the cloud-init user data sent to each machine",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted or partly failed deployment of the same machines",
+)
 @pass_config
-def deploy_cluster(config, servers, agents, token):
+@inventory.invalidates_cache
+def deploy_cluster(
+    config, servers, agents, token, parallelism, timeout, compress_user_data, resume
+):
     """
     Deploys a cluster of machines with RKE2 using cloud-init.
+
+    The token, the role and the progress of every node are kept in a
+    journal in ~/.cache/mctl until all nodes are deployed. With --resume a
+    rerun with the same --servers and --agents reuses the token and only
+    deploys the nodes that aren't deployed yet.
     """
+    from cli.libs import utils
+
     try:
         if not any([servers, agents]):
             raise click.exceptions.UsageError(
                 "At least one of --servers or --agents must be provided"
             )
 
+        # The fleet is listed once for both roles
+        all_machines = config.client.machines.list()
+        current_user = config.client.users.whoami()
+
+        # Machines an interrupted deployment left behind are usable on resume
+        owned_statuses = ["Allocated"]
+        if resume:
+            owned_statuses += ["Deploying", "Deployed", "Failed deployment"]
+
         # Function to select machines
         def select_machines(server_names):
             names = server_names.split(",") if server_names else []
@@ -177,22 +397,18 @@ def deploy_cluster(config, servers, agents, token):
             if count == 0:
                 return []
 
-            # Get machines and ready machines
-            all_machines = config.client.machines.list()
-
             machines = utils.get_machines_by_names(all_machines, names)
-            current_user = config.client.users.whoami()
             ready_machines = [
                 machine
                 for machine in machines
                 if machine.status_name in ["Ready", "Released"]
                 or (
-                    machine.status_name in ["Allocated"]
+                    machine.status_name in owned_statuses
                     and machine.owner.username == current_user.username
                 )
             ]
             if len(ready_machines) < count:
-                raise utils.MachineAvailabilityError(
+                raise errors.MachineAvailabilityError(
                     f"Not enough machines available. Need {count}, found {len(ready_machines)}."
                 )
                 return []
@@ -202,21 +418,181 @@ def deploy_cluster(config, servers, agents, token):
         selected_servers = select_machines(servers)
         selected_agents = select_machines(agents)
 
+        deploy_journal = journal.DeployJournal(
+            config.maas_url,
+            [machine.hostname for machine in selected_servers],
+            [machine.hostname for machine in selected_agents],
+        )
+        if resume:
+            if not deploy_journal.load():
+                raise click.exceptions.UsageError(
+                    "There is no deployment of these machines to resume"
+                )
+            if token and token != deploy_journal.token:
+                raise click.exceptions.UsageError(
+                    "--token differs from the token of the deployment being resumed"
+                )
+            token = deploy_journal.token
+        else:
+            token = token or utils.get_rke_token()
+            deploy_journal.start(token)
+
         # Deploy servers and agents
-        token = token or utils.get_rke_token()
         all_nodes = selected_servers + selected_agents
         ip_addresses = utils.get_machines_ip_addresses(all_nodes)
-        if servers:
-            utils.deploy_servers(selected_servers, token, ip_addresses)
-        if agents:
-            utils.deploy_agents(selected_agents, token, ip_addresses)
+        results = utils.deploy_cluster(
+            selected_servers,
+            selected_agents,
+            token,
+            ip_addresses,
+            parallelism,
+            timeout,
+            compress_user_data,
+            deploy_journal,
+        )
+        utils.echo_deploy_summary(results)
+        if all(status == "Deployed" for status in results.values()):
+            deploy_journal.clear()
+        else:
+            click.echo("Run the same command with --resume to retry the failed nodes")
 
-    except utils.MachineNotFoundError:
+    except errors.MachineNotFoundError:
         click.echo("One or more machines not found")
     except Exception as e:
         click.echo(f"An error occurred: {e}")
 
 
+def _plan_cluster(config, spec_file, compress=False):
+    spec = cluster.load_spec(spec_file)
+    machines = inventory.list_machines(config)
+    username = config.client.users.whoami().username
+    return cluster.plan(spec, machines, username, compress)
+
+
+@click.command()
+@click.argument("spec-file", type=click.Path(exists=True, dir_okay=False))
+@pass_config
+def plan_cluster(config, spec_file):
+    """
+    Shows what apply-cluster would change to make the machines match a
+    cluster spec.
+
+    The spec is resolved against a single listing of the fleet, and the
+    cloud-init user data of every node to deploy is validated.
+
+    Args:
+        spec-file: A YAML or TOML cluster spec
+    """
+    try:
+        cluster.echo_plan(_plan_cluster(config, spec_file))
+    except Exception as e:
+        click.echo(f"An error occurred: {e}")
+
+
+@click.command()
+@click.argument("spec-file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--parallelism",
+    type=click.IntRange(min=1),
+    default=10,
+    help="Maximum number of nodes deployed at the same time after the primary server",
+)
+@click.option(
+    "--timeout",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Seconds to wait for each machine to be deployed",
+)
+@click.option(
+    "--compress-user-data/--no-compress-user-data",
+    default=False,
+    help="Gzip the cloud-init user data sent to each machine",
+)
+@pass_config
+@inventory.invalidates_cache
+def apply_cluster(config, spec_file, parallelism, timeout, compress_user_data):
+    """
+    Deploys the machines of a cluster spec that aren't deployed yet.
+
+    Machines that are already deployed are kept and failed deployments are
+    redeployed, so applying a spec again after a partial failure only
+    redoes what is missing.
+
+    Args:
+        spec-file: A YAML or TOML cluster spec
+    """
+    from cli.libs import utils
+
+    try:
+        # the plan must reflect the fleet as it is now, not a cached listing
+        config.refresh = True
+        cluster_plan = _plan_cluster(config, spec_file, compress_user_data)
+        cluster.echo_plan(cluster_plan)
+        if cluster_plan.missing:
+            raise errors.MachineAvailabilityError(
+                "Not enough machines available for " + ", ".join(cluster_plan.missing)
+            )
+
+        results = utils.apply_cluster_plan(cluster_plan, parallelism, timeout)
+        if results:
+            utils.echo_deploy_summary(results)
+        else:
+            click.echo("The cluster is up to date")
+    except Exception as e:
+        click.echo(f"An error occurred: {e}")
+
+
+@click.command()
+@click.argument("machine-names", required=True)
+@click.option(
+    "--check",
+    "checks",
+    type=click.Choice(["ssh", "rke2", "tcp"]),
+    multiple=True,
+    default=["ssh"],
+    help="Readiness check to run, can be repeated: ssh banner on port 22, "
+    "RKE2 /readyz on port 6443 (requires anonymous access) or a TCP connect to --port",
+)
+@click.option("--port", type=int, default=None, help="Port for the tcp check")
+@click.option(
+    "--timeout", default=300, help="Seconds to wait for each check to succeed"
+)
+@pass_config
+def wait_ready(config, machine_names, checks, port, timeout):
+    """
+    Waits until the machines specified by machine-names are ready.
+
+    All machines and checks are probed concurrently.
+
+    Args:
+        machine-names: A comma separated list of machine names to probe
+    """
+    from cli.libs import probe, utils
+
+    if "tcp" in checks and port is None:
+        raise click.exceptions.UsageError("--port is required for the tcp check")
+
+    ports = {"ssh": 22, "rke2": 6443, "tcp": port}
+    try:
+        names = machine_names.split(",")
+        machines = utils.get_machines_by_names(
+            inventory.list_machines_by_names(config, names), names
+        )
+        endpoints = [
+            probe.Endpoint(machine.ip_addresses[0], ports[check], check, timeout)
+            for machine in machines
+            for check in checks
+        ]
+        results = utils.wait_until_ready(endpoints)
+        probe.echo_probe_results(results)
+    except Exception as e:
+        click.echo(f"An error occurred: {e}")
+        sys.exit(1)
+
+    if not all(result.ready for result in results):
+        sys.exit(1)
+
+
 @click.command()
 @click.option(
     "--remote-kubeconfig-file",
@@ -247,6 +623,8 @@ def get_kubeconfig(
     Args:
         machine-name: The name of the machine to retrieve the kubeconfig
     """
+    from cli.libs import utils
+
     # get server ip address
     server = utils.get_ip_address(machine_name)
     utils.get_kubeconfig(
@@ -257,9 +635,132 @@ def get_kubeconfig(
     )
 
 
+@click.command()
+@click.argument("remote-files", nargs=-1, required=True)
+@click.option(
+    "--machine-names", default=None, help="A comma-separated list of machine names"
+)
+@click.option(
+    "--tags",
+    default=None,
+    help="A comma-separated list of tags to select machines by",
+)
+@click.option(
+    "--resource-pools",
+    default=None,
+    help="A comma-separated list of resource pools to select machines by",
+)
+@click.option(
+    "--dest",
+    type=click.Path(file_okay=False),
+    default=".",
+    help="Directory to store the files in, one subdirectory per machine",
+)
+@click.option(
+    "--parallelism",
+    type=click.IntRange(min=1),
+    default=10,
+    help="Maximum number of files transferred at the same time",
+)
+@click.option(
+    "--ssh-private-key",
+    type=str,
+    default=None,
+    help="A string containing a private key string or a file location",
+)
+@pass_config
+def fetch(
+    config,
+    remote_files,
+    machine_names,
+    tags,
+    resource_pools,
+    dest,
+    parallelism,
+    ssh_private_key,
+):
+    """
+    Fetches files such as kubeconfigs or logs from many machines at once.
+
+    Each machine is connected to once and its files are copied over the same
+    connection, with transfers to all machines running in parallel. Files are
+    stored as DEST/<machine name>/<file name>, so the remote files must
+    have distinct names. Machines without an IP address are reported as
+    failed.
+
+    Args:
+        remote-files: Paths of the files to fetch from every machine
+    """
+    from cli.libs import utils
+
+    names = [os.path.basename(remote_file) for remote_file in remote_files]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise click.BadParameter(
+            f"files named {', '.join(duplicates)} would overwrite each other",
+            param_hint="REMOTE_FILES",
+        )
+
+    try:
+        if machine_names:
+            names = machine_names.split(",")
+            machines = utils.get_machines_by_names(
+                inventory.list_machines_by_names(config, names), names
+            )
+        elif tags:
+            machines = utils.get_machines_by_tags(
+                inventory.list_machines(config), tags.split(",")
+            )
+        elif resource_pools:
+            machines = utils.get_machines_by_pool_name(
+                inventory.list_machines(config), resource_pools.split(",")
+            )
+        else:
+            click.echo(
+                "One of --machine-names, --tags or --resource-pools is required."
+            )
+            return
+
+        transfers = [
+            (
+                (machine.hostname, machine.ip_addresses[0]),
+                remote_file,
+                os.path.join(dest, machine.hostname, os.path.basename(remote_file)),
+            )
+            for machine in machines
+            if machine.ip_addresses
+            for remote_file in remote_files
+        ]
+        # paramiko is only imported by the commands that use SSH
+        from cli.libs import remote
+
+        with remote.SSHPool(ssh_key=ssh_private_key) as pool:
+            results = remote.fetch_files(pool, transfers, parallelism)
+        results += [
+            remote.FetchResult(
+                machine.hostname, remote_file, None, None, "no IP address"
+            )
+            for machine in machines
+            if not machine.ip_addresses
+            for remote_file in remote_files
+        ]
+        remote.echo_fetch_results(results)
+    except Exception as e:
+        click.echo(f"An error occurred: {e}")
+        sys.exit(1)
+
+    if any(result.error for result in results):
+        sys.exit(1)
+
+
 group_one.add_command(ls)
+group_one.add_command(fleet_summary)
 group_one.add_command(get_ip_address)
 group_one.add_command(allocate_from_pool)
 group_one.add_command(release)
 group_one.add_command(deploy_cluster)
+group_one.add_command(plan_cluster)
+group_one.add_command(apply_cluster)
 group_one.add_command(get_kubeconfig)
+group_one.add_command(wait_ready)
+group_one.add_command(fetch)
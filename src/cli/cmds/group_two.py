@@ -26,16 +26,43 @@ def group_two(config):
     '"arch/subarch eg. amd64/generic".',
 )
 @click.option("--title", required=True, help="Display name of the image in MAAS images")
+@click.option(
+    "--chunk-size",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Size of each uploaded chunk in MiB (default: 8)",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    help="Continue an interrupted upload of the same file where it stopped",
+)
 @pass_config
-def upload(config, resource_file, name, architecture, title):
+def upload(config, resource_file, name, architecture, title, chunk_size, resume):
     """
     Uploads a custom image to the MAAS server.
+
+    The image is streamed in chunks with a progress bar. If the upload is
+    interrupted, running the same command again continues from the last
+    chunk the server received.
     """
+    # the upload imports python-libmaas and aiohttp, which --help doesn't need
+    from cli.libs import aio
+    from cli.libs.upload import DEFAULT_CHUNK_SIZE, upload_boot_resource
+
     try:
-        with open(resource_file, "rb") as f:
-            config.client.boot_resources.create(
-                name=name, architecture=architecture, title=title, content=f
+        client = config.client
+        aio.run(
+            upload_boot_resource(
+                client,
+                resource_file,
+                name,
+                architecture,
+                title,
+                chunk_size=chunk_size << 20 if chunk_size else DEFAULT_CHUNK_SIZE,
+                resume=resume,
             )
+        )
 
         click.echo(f"Successfully uploaded boot resource {name}")
     except Exception as e:
@@ -0,0 +1,31 @@
+import click
+
+from cli.libs import daemon
+from cli.libs.click_config import pass_config
+
+
+@click.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    default=None,
+    help="Unix socket to listen on (default: $MCTL_SOCKET or ~/.cache/mctl/mctl.sock)",
+)
+@click.option(
+    "--refresh-interval",
+    type=click.IntRange(min=1),
+    default=daemon.REFRESH_INTERVAL,
+    help="Seconds between refreshes of the machine inventory",
+)
+@pass_config
+def serve(config, socket_path, refresh_interval):
+    """
+    Runs a local daemon that answers `machines ls`, `machines summary` and
+    `machines get-ip-address` from a connected client and an in-memory
+    inventory.
+
+    While it runs, mctl sends those commands to it instead of starting up,
+    connecting and listing the fleet itself. Commands that change machines
+    make it reload the inventory. Set MCTL_NO_DAEMON=1 to bypass it.
+    """
+    daemon.serve(config, socket_path, refresh_interval)
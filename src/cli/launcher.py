@@ -0,0 +1,17 @@
+import sys
+
+from cli.libs import daemon_client
+
+
+def main():
+    """
+    The mctl entry point. Commands a running `mctl serve` daemon can answer
+    are sent to it, everything else runs in this process.
+    """
+    exit_code = daemon_client.forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    from cli.main import cli
+
+    cli()
@@ -0,0 +1,387 @@
+import asyncio
+import functools
+import random
+from http import HTTPStatus
+
+import click
+from maas.client.bones import CallError
+
+from cli.libs import instrumentation, interfaces, probe
+from cli.libs.errors import MachineAvailabilityError, MachineNotFoundError
+from cli.libs.watcher import (
+    DEPLOY_END_STATES,
+    RELEASE_END_STATES,
+    MachineStatusWatcher,
+    echo_transition,
+)
+
+
+def run(coro):
+    """
+    Runs a coroutine to completion from synchronous code such as a Click
+    command.
+
+    python-libmaas runs its blocking facade on the default event loop, so the
+    same loop is used here. The MAAS client must be connected before calling
+    this; inside the loop libmaas calls return coroutines.
+    """
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+async def get_machines_by_system_ids(client, system_ids):
+    """
+    Returns the machines with the given system_ids using a single API call.
+
+    Raises:
+        MachineNotFoundError: If any of the machines doesn't exist, for
+            example because it was deleted while it was being watched.
+    """
+    system_ids = list(system_ids)
+    origin = client._origin
+    data = await origin.Machines._handler.read(id=system_ids)
+    machines = [origin.Machine(item) for item in data]
+
+    missing_ids = set(system_ids) - {machine.system_id for machine in machines}
+    if missing_ids:
+        raise MachineNotFoundError(
+            f"Could not find machines with system IDs: {', '.join(sorted(missing_ids))}"
+        )
+    return machines
+
+
+class StatusPoller:
+    """
+    Lets any number of tasks wait for machine status changes while sharing a
+    single MachineStatusWatcher, so every pending machine is refreshed with
+    one batched query per tick however many tasks are waiting.
+
+    Args:
+        client: A connected MAAS client.
+        strategy: A polling strategy from cli.libs.polling.
+        budget (RequestBudget): Limits the rate of refreshes, optional.
+        timeout (float): Seconds after which a machine is given up on.
+    """
+
+    def __init__(self, client, strategy=None, budget=None, timeout=None):
+        self.watcher = MachineStatusWatcher(
+            functools.partial(get_machines_by_system_ids, client),
+            strategy=strategy,
+            budget=budget,
+            timeout=timeout,
+        )
+        self._waiters = {}
+        self._task = None
+
+    async def wait(self, machine, end_states):
+        """
+        Waits until machine has a status in end_states, or times out, and
+        returns its final status.
+        """
+        self.watcher.add(machine, end_states)
+        if self.watcher.is_done(machine.system_id):
+            click.echo(f"{machine.status_message} {machine.hostname}")
+            return machine.status_message
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[machine.system_id] = future
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return await future
+
+    async def _run(self):
+        while self._waiters:
+            await instrumentation.sleep(self.watcher.next_delay(), "status poll")
+            await instrumentation.sleep(self.watcher.throttle_delay(), "api rate limit")
+            try:
+                transitions = await self.watcher.poll_async()
+            except Exception as e:
+                for future in self._waiters.values():
+                    future.set_exception(e)
+                self._waiters.clear()
+                return
+
+            for transition in transitions:
+                echo_transition(transition)
+                system_id = transition.machine.system_id
+                if transition.done and system_id in self._waiters:
+                    self._waiters.pop(system_id).set_result(transition.status)
+
+
+class BulkReleaser:
+    """
+    Collects the machines released in the same event loop iteration and
+    releases them with MAAS's bulk release operation when the server
+    provides it. If the bulk call is rejected, for example because one
+    machine cannot be released, each machine is released on its own so the
+    others still go through and every failure has its own error.
+    """
+
+    def __init__(self, client):
+        self.handler = client._origin.Machines._handler
+        self._batch = []
+
+    async def release(self, machine):
+        future = asyncio.get_running_loop().create_future()
+        if not self._batch:
+            asyncio.get_running_loop().call_soon(
+                lambda: asyncio.ensure_future(self._flush())
+            )
+        self._batch.append((machine, future))
+        await future
+
+    async def _flush(self):
+        batch, self._batch = self._batch, []
+        try:
+            await self._release_batch(batch)
+        except BaseException as e:
+            # _flush runs in a task nobody awaits, so the error is delivered
+            # to the callers waiting on the batch instead
+            for _, future in batch:
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    async def _release_batch(self, batch):
+        machines = [machine for machine, _ in batch]
+        if len(machines) > 1 and "release" in dict(self.handler.actions):
+            try:
+                await self.handler.release(
+                    machines=[machine.system_id for machine in machines]
+                )
+            except CallError:
+                pass
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+                return
+
+        results = await asyncio.gather(
+            *(machine.release() for machine in machines), return_exceptions=True
+        )
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(None)
+
+
+async def set_interface_names(machine):
+    """
+    Renames the interface tagged "capture" to capture0.
+    """
+    _, errors = await interfaces.reconcile([machine])
+    if errors:
+        raise RuntimeError(errors[machine.hostname])
+
+
+async def deploy(machine, user_data, poller):
+    """
+    Deploys machine with RKE2 and waits until the deployment has ended.
+
+    Returns:
+        str: The final status of the machine.
+    """
+    await machine.deploy(
+        user_data=user_data,
+        distro_series="rke2-ubuntu-2204",
+        hwe_kernel="generic",
+    )
+    click.echo(f"Starting deployment of {machine.hostname}")
+    return await poller.wait(machine, DEPLOY_END_STATES)
+
+
+async def deploy_machines(client, nodes, parallelism=1, poller=None, on_result=None):
+    """
+    Deploys machines concurrently with at most `parallelism` deployments in
+    progress.
+
+    Args:
+        client: A connected MAAS client.
+        nodes (list): (machine, user_data) tuples, started in order.
+        parallelism (int): The maximum number of concurrent deployments.
+        poller (StatusPoller): Configures how deployments are watched.
+        on_result (callable): Called with the hostname and final status, or
+            error message, of each machine as soon as it is known.
+
+    Returns:
+        dict: The final status of each machine, keyed by hostname. Machines
+            whose deployment could not be started map to the error message.
+    """
+    poller = poller or StatusPoller(client)
+    semaphore = asyncio.Semaphore(parallelism)
+
+    # Interfaces of all machines are renamed up front, concurrently
+    writes, errors = await interfaces.reconcile([machine for machine, _ in nodes])
+    if writes:
+        click.echo(f"Renamed capture interfaces with {writes} API writes")
+
+    async def deploy_one(machine, user_data):
+        if machine.hostname in errors:
+            status = errors[machine.hostname]
+        else:
+            async with semaphore:
+                try:
+                    status = await deploy(machine, user_data, poller)
+                except Exception as e:
+                    click.echo(f"Error deploying {machine.hostname}: {e}")
+                    status = str(e)
+        if on_result is not None:
+            on_result(machine.hostname, status)
+        return machine.hostname, status
+
+    results = await asyncio.gather(*(deploy_one(*node) for node in nodes))
+    return dict(results)
+
+
+async def release_machines(client, machines, parallelism=50, poller=None):
+    """
+    Releases machines concurrently with at most `parallelism` releases in
+    progress and waits until all of them are released.
+
+    Returns:
+        dict: The final status, or error message, of each machine keyed by
+            hostname.
+    """
+    poller = poller or StatusPoller(client)
+    releaser = BulkReleaser(client)
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def release_one(machine):
+        async with semaphore:
+            try:
+                await releaser.release(machine)
+                return machine.hostname, await poller.wait(machine, RELEASE_END_STATES)
+            except Exception as e:
+                return machine.hostname, str(e)
+
+    results = await asyncio.gather(*(release_one(machine) for machine in machines))
+    return dict(results)
+
+
+async def _allocate_one(handler, pool_name, tags):
+    """
+    Asks the MAAS allocator for one Ready machine in pool_name that has any
+    of tags. Returns the allocation data, or None when no machine matches.
+    """
+    constraints = [{"tags": [tag]} for tag in tags] if tags else [{}]
+    for tag_constraint in constraints:
+        try:
+            return await handler.allocate(pool=pool_name, **tag_constraint)
+        except CallError as e:
+            if e.status != HTTPStatus.CONFLICT:
+                raise
+    return None
+
+
+async def _ready_machines(handler, pool_name, tags):
+    """
+    Returns the data of the Ready machines in pool_name that have any of
+    tags, read with one listing filtered by pool.
+    """
+    wanted = {tag.lower() for tag in tags or []}
+    return [
+        data
+        for data in await handler.read(pool=pool_name)
+        if data.get("status_name") == "Ready"
+        and (
+            not wanted or wanted & {tag.lower() for tag in data.get("tag_names") or []}
+        )
+    ]
+
+
+async def allocate(client, pool_name, tags=None, retries=3):
+    """
+    Allocates one machine from a resource pool.
+
+    MAAS answers a conflict both when the pool has no matching Ready machine
+    and when another job acquired the machine it picked first. Only the
+    latter is retried, with a jittered exponential backoff, while the pool
+    still has matching Ready machines.
+    """
+    origin = client._origin
+    handler = origin.Machines._handler
+    for attempt in range(retries + 1):
+        data = await _allocate_one(handler, pool_name, tags)
+        if data is not None:
+            return origin.Machine(data)
+        if attempt == retries or not await _ready_machines(handler, pool_name, tags):
+            return None
+        await instrumentation.sleep(2**attempt + random.random(), "allocate retry")
+    return None
+
+
+async def _select_from_pool(client, pool_name, count, tags):
+    """
+    Returns count distinct Ready machines of a resource pool that have any
+    of tags, without acquiring them.
+    """
+    origin = client._origin
+    ready = await _ready_machines(origin.Machines._handler, pool_name, tags)
+    if len(ready) < count:
+        raise MachineAvailabilityError(
+            f"Unable to allocate {count} machines, only {len(ready)} available"
+        )
+    return [origin.Machine(data) for data in ready[:count]]
+
+
+async def allocate_from_pool(
+    client, pool_name, count, tags=None, retries=3, dry_run=False
+):
+    """
+    Allocates count machines from a resource pool concurrently. If count
+    machines cannot be allocated, the machines allocated so far are released
+    again and MachineAvailabilityError is raised.
+
+    A dry run reads the matching Ready machines instead, since MAAS's dry run
+    allocator acquires nothing and would name the same machine every time.
+    """
+    if dry_run:
+        return await _select_from_pool(client, pool_name, count, tags)
+
+    results = await asyncio.gather(
+        *(allocate(client, pool_name, tags, retries) for _ in range(count)),
+        return_exceptions=True,
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    allocated = [
+        result
+        for result in results
+        if result is not None and not isinstance(result, Exception)
+    ]
+
+    if len(allocated) < count:
+        await asyncio.gather(
+            *(
+                machine.release(comment="mctl allocate-from-pool rollback")
+                for machine in allocated
+            ),
+            return_exceptions=True,
+        )
+        if errors:
+            raise errors[0]
+        raise MachineAvailabilityError(
+            f"Unable to allocate {count} machines, only {len(allocated)} available"
+        )
+
+    return allocated
+
+
+async def wait_for_port(host, port, timeout=60):
+    """
+    Waits until a TCP connection to host:port succeeds.
+
+    Returns:
+        bool: True if the port accepted a connection before timeout.
+    """
+    click.echo(f"Waiting for port {port} connection...")
+    result = await probe.wait_ready(probe.Endpoint(host, port, "tcp", timeout))
+    if result.ready:
+        click.echo(f"Port {port} connection succeeded!")
+    else:
+        click.echo(f"Port {port} connection failed!")
+    return result.ready
@@ -0,0 +1,153 @@
+from collections import defaultdict
+
+
+def _hostname_keys(machine):
+    return [machine.hostname.lower()]
+
+
+def _system_id_keys(machine):
+    return [machine.system_id]
+
+
+def _pool_keys(machine):
+    return [machine.pool.name.lower()] if machine.pool else []
+
+
+def _owner_keys(machine):
+    return [machine.owner.username.lower()] if machine.owner else []
+
+
+def _tag_keys(machine):
+    return [tag.name.lower() for tag in machine.tags]
+
+
+def _status_keys(machine):
+    return [machine.status_name.lower()] if machine.status_name else []
+
+
+class Query:
+    """
+    A selection of machines in a MachineCatalog.
+
+    Queries are combined with ``&`` (machines matching both) and ``|``
+    (machines matching either), e.g.
+    ``pool("dev") & tag("T1", "R6515") & status("Ready", "Released")``.
+    """
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+
+    def resolve(self, catalog):
+        """
+        Returns the positions of the matching machines in the catalog.
+        """
+        return self._resolve(catalog)
+
+    def __and__(self, other):
+        return Query(lambda catalog: self.resolve(catalog) & other.resolve(catalog))
+
+    def __or__(self, other):
+        return Query(lambda catalog: self.resolve(catalog) | other.resolve(catalog))
+
+
+def _field_query(field, values):
+    keys = [value if field == "system_id" else value.lower() for value in values]
+    return Query(lambda catalog: catalog.lookup(field, keys))
+
+
+def hostname(*names):
+    """Machines with any of the hostnames, case-insensitive."""
+    return _field_query("hostname", names)
+
+
+def system_id(*system_ids):
+    """Machines with any of the system IDs."""
+    return _field_query("system_id", system_ids)
+
+
+def pool(*names):
+    """Machines in any of the resource pools, case-insensitive."""
+    return _field_query("pool", names)
+
+
+def owner(*names):
+    """Machines owned by any of the users, case-insensitive."""
+    return _field_query("owner", names)
+
+
+def tag(*names):
+    """Machines with at least one of the tags, case-insensitive."""
+    return _field_query("tag", names)
+
+
+def status(*names):
+    """Machines with any of the status names, case-insensitive."""
+    return _field_query("status", names)
+
+
+class MachineCatalog:
+    """
+    Hash indexes over a machine listing by hostname, system_id, pool, owner,
+    tag and status.
+
+    Each index is built on first use, so a catalog that is only queried by
+    pool never pays for the tag index. Queries return machines in the order
+    of the original listing.
+
+    Args:
+        machines (list): libmaas machines or inventory MachineRecords.
+    """
+
+    FIELDS = {
+        "hostname": _hostname_keys,
+        "system_id": _system_id_keys,
+        "pool": _pool_keys,
+        "owner": _owner_keys,
+        "tag": _tag_keys,
+        "status": _status_keys,
+    }
+
+    def __init__(self, machines):
+        self.machines = list(machines)
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.machines)
+
+    def __iter__(self):
+        return iter(self.machines)
+
+    def index(self, field):
+        """
+        Returns the index of field, mapping each key to a set of positions.
+        """
+        if field not in self._indexes:
+            keys_of = self.FIELDS[field]
+            index = defaultdict(set)
+            for position, machine in enumerate(self.machines):
+                for key in keys_of(machine):
+                    index[key].add(position)
+            self._indexes[field] = index
+        return self._indexes[field]
+
+    def keys(self, field):
+        """
+        Returns the keys present in the index of field.
+        """
+        return set(self.index(field))
+
+    def lookup(self, field, keys):
+        """
+        Returns the positions of the machines matching any of keys in field.
+        """
+        index = self.index(field)
+        positions = set()
+        for key in keys:
+            positions |= index.get(key, set())
+        return positions
+
+    def select(self, query):
+        """
+        Returns the machines matching query.
+        """
+        return [self.machines[position] for position in sorted(query.resolve(self))]
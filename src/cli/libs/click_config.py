@@ -1,12 +1,59 @@
 import click
 
+from cli.libs import polling
+
 
 class Config:
     def __init__(self):
         self.verbose = False
-        self.client = None
+        self.profile = "~/.maas/credentials"
+        self.cache_api_description = False
+        self.cache_ttl = 0
+        self.no_cache = False
+        self.refresh = False
+        self.poll_strategy = "adaptive"
+        self.api_rate = 0
         self.maas_url = None
         self.maas_api_key = None
+        self.inventory = None
+        self._client = None
+        self._request_budget = None
+
+    @property
+    def client(self):
+        """
+        The MAAS client. It is connected on first use, so --help and commands
+        that never talk to MAAS don't pay for the connection.
+        """
+        if self._client is None:
+            from cli.libs import connection
+
+            self._client = connection.connect(self)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @property
+    def request_budget(self):
+        """
+        The status request budget shared by every watcher in the process, or
+        None when the rate is not limited.
+        """
+        if self._request_budget is None and self.api_rate > 0:
+            self._request_budget = polling.RequestBudget(self.api_rate)
+        return self._request_budget
+
+    def status_poll_settings(self, timeout=None):
+        """
+        Returns the keyword arguments for a status watcher or poller.
+        """
+        return {
+            "strategy": polling.make_strategy(self.poll_strategy),
+            "budget": self.request_budget,
+            "timeout": timeout,
+        }
 
 
 # this makes pass_config a singleton, so it's not reset
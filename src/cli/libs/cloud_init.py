@@ -0,0 +1,208 @@
+import base64
+import gzip
+import json
+from string import Template
+
+import yaml
+
+from cli.libs.errors import CloudInitError
+
+# The RKE2 configuration of each role. $token and $primary are the same for
+# the whole cluster and are filled in once per deployment, $labels and
+# $taints once per distinct set of node tags.
+_SERVER_CONFIG = """\
+      token: $token
+      disable-cloud-controller: true
+      write-kubeconfig-mode: 644
+      node-label: $labels
+      node-taint: $taints
+      disable:
+        - "rke2-ingress-nginx"
+"""
+
+_AGENT_CONFIG = """\
+      token: $token
+      write-kubeconfig-mode: 644
+      node-label: $labels
+      node-taint: $taints
+"""
+
+_DOCUMENT = """\
+#cloud-config
+write_files:
+  - path: /etc/rancher/rke2/config.yaml
+    owner: root:root
+    permissions: 0600
+    defer: true
+    content: |
+{config}
+runcmd:
+ - 'sudo bash -c "/opt/setup.sh {command} | tee /tmp/setup.log"'
+"""
+
+TEMPLATES = {
+    "primary": Template(
+        _DOCUMENT.format(
+            config="      bind-address: $primary\n" + _SERVER_CONFIG, command="server"
+        )
+    ),
+    "secondary": Template(
+        _DOCUMENT.format(
+            config="      server: https://$primary:9345\n" + _SERVER_CONFIG,
+            command="server",
+        )
+    ),
+    "agent": Template(
+        _DOCUMENT.format(
+            config="      server: https://$primary:9345\n" + _AGENT_CONFIG,
+            command="agent",
+        )
+    ),
+}
+
+
+def node_labels(tag_names):
+    """
+    Returns the Kubernetes node labels of the LABEL_<name>_<value> tags.
+    """
+    labels = []
+    for tag_name in tag_names:
+        if tag_name.startswith("LABEL_"):
+            _, label_name, label_value = tag_name.split("_", 2)
+            labels.append(f"cnaps.io/{label_name}={label_value}")
+    return labels
+
+
+def node_taints(tag_names):
+    """
+    Returns the Kubernetes node taints of the TAINT_<name>_<value>_<effect>
+    tags.
+    """
+    taints = []
+    for tag_name in tag_names:
+        if tag_name.startswith("TAINT_"):
+            _, taint_name, taint_value, taint_effect = tag_name.split("_", 3)
+            taints.append(f"cnaps.io/{taint_name}={taint_value}:{taint_effect}")
+    return taints
+
+
+def validate(document):
+    """
+    Checks that document is a cloud-config cloud-init will accept, and that
+    the YAML files it writes parse as well.
+
+    Raises:
+        CloudInitError: If it isn't.
+    """
+    if not document.startswith("#cloud-config\n"):
+        raise CloudInitError("user data must start with #cloud-config")
+    try:
+        config = yaml.safe_load(document)
+    except yaml.YAMLError as e:
+        raise CloudInitError(f"invalid cloud-config: {e}") from e
+    if not isinstance(config, dict):
+        raise CloudInitError("cloud-config must be a mapping")
+
+    for write_file in config.get("write_files") or []:
+        path = write_file.get("path", "")
+        if not path.endswith((".yaml", ".yml")):
+            continue
+        try:
+            content = yaml.safe_load(write_file.get("content") or "")
+        except yaml.YAMLError as e:
+            raise CloudInitError(f"invalid YAML in {path}: {e}") from e
+        if not isinstance(content, dict):
+            raise CloudInitError(f"{path} must be a mapping")
+
+
+def encode(document, compress=False):
+    """
+    Returns document base64 encoded for the MAAS deploy call, gzip
+    compressed first if compress is set. cloud-init detects and unpacks
+    compressed user data on its own.
+    """
+    data = document.encode("utf-8")
+    if compress:
+        # A fixed mtime keeps the payload of identical documents identical.
+        data = gzip.compress(data, mtime=0)
+    return base64.b64encode(data).decode("ascii")
+
+
+class Renderer:
+    """
+    Renders the cloud-init user data of every node of a cluster.
+
+    The cluster-wide parts of each role template are filled in once. Nodes
+    with the same role and tags get the same document, so it is rendered,
+    validated and encoded only for the first of them.
+
+    Args:
+        token (str): The RKE2 cluster token.
+        ip_addresses (list): The IP addresses of the cluster nodes, the
+            first being the primary server's.
+        compress (bool): Whether to gzip the user data.
+    """
+
+    def __init__(self, token, ip_addresses, compress=False):
+        self.compress = compress
+        self.templates = {
+            role: Template(
+                template.safe_substitute(
+                    token=json.dumps(token).replace("$", "$$"),
+                    primary=ip_addresses[0],
+                )
+            )
+            for role, template in TEMPLATES.items()
+        }
+        self._payloads = {}
+
+    def render(self, role, tag_names, labels=(), taints=()):
+        """
+        Returns the cloud-config document of a node with role and tags, and
+        any labels and taints given on top of those of its tags.
+        """
+        return self.templates[role].substitute(
+            labels=json.dumps(node_labels(tag_names) + list(labels)),
+            taints=json.dumps(node_taints(tag_names) + list(taints)),
+        )
+
+    def user_data(self, role, tags, labels=(), taints=()):
+        """
+        Returns the validated and encoded user data of a node with role and
+        tags.
+        """
+        key = (
+            role,
+            tuple(sorted(tag.name for tag in tags)),
+            tuple(labels),
+            tuple(taints),
+        )
+        if key not in self._payloads:
+            document = self.render(*key)
+            validate(document)
+            self._payloads[key] = encode(document, self.compress)
+        return self._payloads[key]
+
+    def render_nodes(self, servers, agents):
+        """
+        Renders the user data of every node before any of them is deployed,
+        so an invalid document fails the deployment up front.
+
+        Returns:
+            list: (machine, user_data) tuples, the primary server first.
+
+        Raises:
+            CloudInitError: If the user data of a node is not valid.
+        """
+        roles = (
+            [("primary", server) for server in servers[:1]]
+            + [("secondary", server) for server in servers[1:]]
+            + [("agent", agent) for agent in agents]
+        )
+        nodes = []
+        for role, machine in roles:
+            try:
+                nodes.append((machine, self.user_data(role, machine.tags)))
+            except CloudInitError as e:
+                raise CloudInitError(f"{machine.hostname}: {e}") from e
+        return nodes
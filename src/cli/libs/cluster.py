@@ -0,0 +1,323 @@
+import hashlib
+import re
+from collections import namedtuple
+
+import click
+import toml
+import yaml
+
+from cli.libs import catalog as query
+from cli.libs.catalog import MachineCatalog
+from cli.libs.cloud_init import Renderer
+from cli.libs.errors import CloudInitError, SpecError
+
+KINDS = ["server", "agent"]
+
+ROLE_KEYS = {"name", "kind", "count", "hostnames", "pool", "tags", "labels", "taints"}
+
+# Characters MAAS allows in a tag name.
+TAG_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Machines a role can use, by how much of the work is already done. Owned
+# statuses only count for machines of the current user that carry the tag
+# of the cluster.
+AVAILABLE_STATUSES = ["Ready", "Released"]
+OWNED_STATUSES = ["Deployed", "Failed deployment", "Allocated"]
+
+# What apply-cluster does with a machine in each status.
+ACTIONS = {
+    "Deployed": "keep",
+    "Failed deployment": "redeploy",
+    "Allocated": "deploy",
+    "Ready": "deploy",
+    "Released": "deploy",
+}
+
+# One role of a cluster spec. Machines are selected by hostnames, pool and
+# tags (all of them), labels and taints are added to those of their tags.
+Role = namedtuple(
+    "Role", ["name", "kind", "count", "hostnames", "pool", "tags", "labels", "taints"]
+)
+
+# A cluster spec. server is the address of an existing server to join, for
+# specs that don't deploy one. name is optional and names the tag that marks
+# the machines of the cluster.
+ClusterSpec = namedtuple("ClusterSpec", ["name", "token", "server", "roles"])
+
+# A machine of the planned cluster. user_data is None for kept machines.
+PlannedNode = namedtuple(
+    "PlannedNode", ["role", "machine", "action", "template", "user_data"]
+)
+
+# The nodes of a cluster, the primary first. primary is the server the other
+# nodes join, None when that server is not part of the spec. missing maps
+# roles to the number of machines that could not be found. tag is the MAAS
+# tag of the machines of the cluster.
+Plan = namedtuple("Plan", ["nodes", "primary", "missing", "tag"])
+
+
+def _list_of_strings(value, field):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise SpecError(f"{field} must be a string or a list of strings")
+    return value
+
+
+def parse_role(data, position):
+    if not isinstance(data, dict):
+        raise SpecError(f"role {position} must be a mapping")
+    name = data.get("name") or f"role-{position}"
+    unknown = set(data) - ROLE_KEYS
+    if unknown:
+        raise SpecError(f"{name}: unknown keys {', '.join(sorted(unknown))}")
+
+    kind = data.get("kind", "agent")
+    if kind not in KINDS:
+        raise SpecError(f"{name}: kind must be one of {', '.join(KINDS)}")
+
+    hostnames = _list_of_strings(data.get("hostnames"), f"{name}: hostnames")
+    count = data.get("count", len(hostnames) or None)
+    if not isinstance(count, int) or count < 1:
+        raise SpecError(f"{name}: count must be a positive number")
+
+    labels = data.get("labels") or {}
+    if not isinstance(labels, dict):
+        raise SpecError(f"{name}: labels must be a mapping")
+    taints = _list_of_strings(data.get("taints"), f"{name}: taints")
+    for taint in taints:
+        if "=" not in taint or ":" not in taint:
+            raise SpecError(f"{name}: taint {taint!r} must be key=value:effect")
+
+    return Role(
+        name=name,
+        kind=kind,
+        count=count,
+        hostnames=hostnames,
+        pool=data.get("pool"),
+        tags=_list_of_strings(data.get("tags"), f"{name}: tags"),
+        labels=[f"{key}={value}" for key, value in labels.items()],
+        taints=taints,
+    )
+
+
+def parse_spec(data):
+    """
+    Returns the ClusterSpec described by data.
+
+    Raises:
+        SpecError: If data is not a valid cluster spec.
+    """
+    if not isinstance(data, dict):
+        raise SpecError("a cluster spec must be a mapping")
+    if not isinstance(data.get("token"), str) or not data["token"]:
+        raise SpecError("token is required")
+    roles = data.get("roles")
+    if not isinstance(roles, list) or not roles:
+        raise SpecError("at least one role is required")
+
+    roles = [parse_role(role, i) for i, role in enumerate(roles, 1)]
+    names = [role.name for role in roles]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise SpecError(f"duplicate roles: {', '.join(sorted(duplicates))}")
+    server = data.get("server")
+    if server is None and not any(role.kind == "server" for role in roles):
+        raise SpecError(
+            "a server role or the address of an existing server is required"
+        )
+    name = data.get("name")
+    if name is not None and (not isinstance(name, str) or not TAG_NAME.match(name)):
+        raise SpecError("name may only contain letters, digits, - and _")
+
+    return ClusterSpec(name=name, token=data["token"], server=server, roles=roles)
+
+
+def member_tag(spec):
+    """
+    Returns the MAAS tag that apply-cluster puts on the machines of the
+    cluster. Machines the user already owns are only reused for the cluster
+    if they have it, so another deployment's machines are never taken over.
+    Without a name in the spec the tag is derived from the token, which is
+    what identifies the cluster the nodes join.
+    """
+    if spec.name:
+        return f"mctl-cluster-{spec.name}"
+    return "mctl-cluster-" + hashlib.sha256(spec.token.encode()).hexdigest()[:12]
+
+
+def load_spec(path):
+    """
+    Reads a cluster spec from a YAML or, if path ends in .toml, a TOML file.
+
+    Raises:
+        SpecError: If the file is not a valid cluster spec.
+    """
+    with open(path) as f:
+        try:
+            data = toml.load(f) if path.endswith(".toml") else yaml.safe_load(f)
+        except (toml.TomlDecodeError, yaml.YAMLError) as e:
+            raise SpecError(f"{path}: {e}") from e
+    try:
+        return parse_spec(data)
+    except SpecError as e:
+        raise SpecError(f"{path}: {e}") from e
+
+
+def _selector(role):
+    selector = query.Query(lambda catalog: set(range(len(catalog))))
+    if role.hostnames:
+        selector = query.hostname(*role.hostnames)
+    if role.pool:
+        selector = selector & query.pool(role.pool)
+    for tag in role.tags:
+        selector = selector & query.tag(tag)
+    return selector
+
+
+def _preference(machine, username, tag):
+    """
+    Returns how early machine should be picked for a role, or None if it
+    can't be used.
+    """
+    if machine.status_name in AVAILABLE_STATUSES:
+        return len(OWNED_STATUSES)
+    if (
+        machine.status_name in OWNED_STATUSES
+        and machine.owner_name == username
+        and tag.lower() in {name.lower() for name in machine.tag_names}
+    ):
+        return OWNED_STATUSES.index(machine.status_name)
+    return None
+
+
+def _select(spec, machines, username):
+    """
+    Returns (role, machine) pairs for every role and the number of machines
+    missing per role. Machines of the cluster that are already deployed are
+    picked first, and no machine is picked for more than one role.
+    """
+    tag = member_tag(spec)
+    catalog = MachineCatalog(machines)
+    taken = set()
+    selected = []
+    missing = {}
+    for role in spec.roles:
+        candidates = [
+            machine
+            for machine in catalog.select(_selector(role))
+            if machine.system_id not in taken
+            and _preference(machine, username, tag) is not None
+        ]
+        candidates.sort(
+            key=lambda machine: (_preference(machine, username, tag), machine.hostname)
+        )
+        chosen = candidates[: role.count]
+        if len(chosen) < role.count:
+            missing[role.name] = role.count - len(chosen)
+        taken.update(machine.system_id for machine in chosen)
+        selected.extend((role, machine) for machine in chosen)
+    return selected, missing
+
+
+def plan(spec, machines, username, compress=False):
+    """
+    Resolves spec against one listing of the fleet.
+
+    Only Ready and Released machines, and machines of the user that carry
+    the tag of the cluster, are used. New nodes join the first server that
+    is already deployed, so re-applying a spec never replaces a running
+    primary. Without one the first selected server is deployed as the
+    primary, unless the spec names an existing server to join. The user data
+    of every node to deploy is rendered and validated here, before anything
+    is changed.
+
+    Args:
+        spec (ClusterSpec): The desired cluster.
+        machines (list): MachineRecords of the whole fleet.
+        username (str): The current user, whose machines can be reused.
+        compress (bool): Whether to gzip the cloud-init user data.
+
+    Returns:
+        Plan: The nodes of the cluster and what to do with each.
+
+    Raises:
+        SpecError: If the address of the server to join is unknown.
+        CloudInitError: If the user data of a node is not valid.
+    """
+    selected, missing = _select(spec, machines, username)
+    servers = sorted(
+        (pair for pair in selected if pair[0].kind == "server"),
+        key=lambda pair: ACTIONS[pair[1].status_name] != "keep",
+    )
+    joined = servers[0] if servers and spec.server is None else None
+    if joined is not None:
+        if not joined[1].ip_addresses:
+            raise SpecError(f"{joined[1].hostname} has no IP address to join")
+        address = joined[1].ip_addresses[0]
+    else:
+        address = spec.server
+
+    renderer = Renderer(spec.token, [address], compress)
+    primary = None
+    nodes = []
+    for role, machine in selected:
+        action = ACTIONS[machine.status_name]
+        if (role, machine) == joined:
+            template = "primary"
+        else:
+            template = "secondary" if role.kind == "server" else "agent"
+        user_data = None
+        if action != "keep":
+            try:
+                user_data = renderer.user_data(
+                    template, machine.tags, role.labels, role.taints
+                )
+            except CloudInitError as e:
+                raise CloudInitError(f"{machine.hostname}: {e}") from e
+        node = PlannedNode(role.name, machine, action, template, user_data)
+        if template == "primary":
+            primary = node
+            nodes.insert(0, node)
+        else:
+            nodes.append(node)
+
+    return Plan(nodes=nodes, primary=primary, missing=missing, tag=member_tag(spec))
+
+
+def echo_plan(cluster_plan):
+    """
+    Prints every node of the plan with its current status and what
+    apply-cluster will do with it.
+    """
+    nodes = cluster_plan.nodes
+    role_width = max([len("ROLE")] + [len(node.role) for node in nodes])
+    host_width = max([len("HOSTNAME")] + [len(node.machine.hostname) for node in nodes])
+    status_width = max(
+        [len("STATUS")] + [len(node.machine.status_name) for node in nodes]
+    )
+    click.echo(
+        f"{'ROLE':<{role_width}}  {'HOSTNAME':<{host_width}}  "
+        f"{'STATUS':<{status_width}}  ACTION"
+    )
+    for node in nodes:
+        action = node.action
+        if node is cluster_plan.primary:
+            action += " (primary)"
+        click.echo(
+            f"{node.role:<{role_width}}  {node.machine.hostname:<{host_width}}  "
+            f"{node.machine.status_name:<{status_width}}  {action}"
+        )
+    for role, count in cluster_plan.missing.items():
+        click.echo(f"{role}: {count} more machines are needed than are available")
+
+    counts = {
+        action: sum(1 for node in nodes if node.action == action)
+        for action in ["deploy", "redeploy", "keep"]
+    }
+    click.echo(
+        f"Plan: {counts['deploy']} to deploy, {counts['redeploy']} to redeploy, "
+        f"{counts['keep']} unchanged, tagged {cluster_plan.tag}"
+    )
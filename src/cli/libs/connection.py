@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urlparse
+
+import click
+import toml
+
+from cli.libs import transport
+
+# python-libmaas is imported when a client is connected, so the cache and
+# credential helpers can be used by commands that never talk to MAAS.
+
+CACHE_DIR = "~/.cache/mctl"
+DESCRIPTION_CACHE_TTL = 24 * 60 * 60
+
+
+def load_credentials(config):
+    """
+    Sets config.maas_url and config.maas_api_key from the MAAS_SERVER and
+    MAAS_API_KEY environment variables or, if they are not set, from the
+    credential file at config.profile.
+    """
+    maas_url = os.environ.get("MAAS_SERVER")
+    maas_api_key = os.environ.get("MAAS_API_KEY")
+    profile = os.path.expanduser(config.profile)
+
+    if not all([maas_url, maas_api_key]) and not os.path.exists(profile):
+        raise Exception(
+            "MAAS_SERVER and MAAS_API_KEY environment variables are not set and maas credential file does not exist."
+        )
+
+    if all([maas_url, maas_api_key]):
+        config.maas_url = maas_url
+        config.maas_api_key = maas_api_key
+    else:
+        try:
+            with open(profile) as f:
+                credentials = toml.load(f)
+                config.maas_url = credentials["maas"]["url"]
+                config.maas_api_key = credentials["maas"]["api_key"]
+        except (FileNotFoundError, KeyError) as err:
+            click.echo(err)
+
+
+def cache_path(kind, url):
+    """
+    Returns the path of the cache file of the given kind for a MAAS server.
+    """
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.expanduser(CACHE_DIR), f"{kind}-{digest}.json")
+
+
+def read_cache(path, url, ttl):
+    """
+    Returns the data cached at path for url, or None if there is no such
+    cache or it is older than ttl seconds.
+    """
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cached.get("url") != url:
+        return None
+    if time.time() - cached.get("fetched_at", 0) > ttl:
+        return None
+    return cached.get("data")
+
+
+def write_cache(path, url, data):
+    """
+    Atomically writes data for url to the cache file at path.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"url": url, "fetched_at": time.time(), "data": data}, f)
+    os.replace(tmp_path, path)
+
+
+def connect_cached(url, api_key):
+    """
+    Connects to MAAS using an API description cached on disk.
+
+    The API description is fetched and cached on the first connection and
+    reused for DESCRIPTION_CACHE_TTL seconds, which saves a round trip to
+    the region controller on every invocation.
+    """
+    from maas.client.bones import SessionAPI
+    from maas.client.facade import Client
+    from maas.client.utils import api_url
+    from maas.client.utils.creds import Credentials
+    from maas.client.viscera import Origin
+
+    url = api_url(url)
+    credentials = Credentials.parse(api_key)
+    path = cache_path("api-description", url)
+    description = read_cache(path, url, DESCRIPTION_CACHE_TTL)
+    if description is None:
+        session = SessionAPI.fromURL(url, credentials=credentials)
+        write_cache(path, url, session.description)
+    else:
+        session = SessionAPI(description, credentials)
+        session.scheme = urlparse(url).scheme
+    return Client(Origin(session))
+
+
+def load_transport_settings(config):
+    """
+    Returns the HTTP transport settings from the [transport] table of the
+    credential file at config.profile and the MCTL_HTTP_* environment
+    variables.
+    """
+    try:
+        with open(os.path.expanduser(config.profile)) as f:
+            profile = toml.load(f)
+    except FileNotFoundError:
+        profile = None
+    return transport.load_settings(profile)
+
+
+def connect(config):
+    """
+    Returns a MAAS client for the credentials of config.
+    """
+    from maas.client import connect as maas_connect
+
+    if config.maas_url is None or config.maas_api_key is None:
+        load_credentials(config)
+    transport.configure(load_transport_settings(config))
+
+    if config.cache_api_description:
+        client = connect_cached(config.maas_url, config.maas_api_key)
+    else:
+        client = maas_connect(url=config.maas_url, apikey=config.maas_api_key)
+
+    if client is None:
+        click.echo("Could not load credentials from file")
+    return client
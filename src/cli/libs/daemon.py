@@ -0,0 +1,172 @@
+import contextlib
+import io
+import os
+import socket
+import socketserver
+import time
+
+import click
+
+from cli.libs import daemon_client, inventory
+from cli.main import cli
+
+REFRESH_INTERVAL = 30
+
+# Config fields set from the options of every command, which must not leak
+# from one forwarded command into the next.
+REQUEST_FIELDS = [
+    "verbose",
+    "profile",
+    "cache_api_description",
+    "cache_ttl",
+    "no_cache",
+    "refresh",
+    "poll_strategy",
+    "api_rate",
+]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = daemon_client.receive(self.connection)
+        daemon_client.send(self.connection, self.server.run(request))
+
+
+class Daemon(socketserver.UnixStreamServer):
+    """
+    Runs forwarded mctl commands with one connected MAAS client and a machine
+    inventory held in memory.
+
+    Requests are handled one at a time in the serving thread, which is also
+    the thread of the event loop python-libmaas runs on. Between requests
+    the inventory is refreshed every `refresh_interval` seconds, and right
+    after a command that changed machines invalidated it, which local
+    commands do with an `{"invalidate": true}` request.
+
+    Args:
+        path (str): The path of the Unix socket to listen on.
+        config (Config): The configuration shared by every command.
+        refresh_interval (int): Seconds between inventory refreshes.
+    """
+
+    def __init__(self, path, config, refresh_interval=REFRESH_INTERVAL):
+        self.config = config
+        self.refresh_interval = refresh_interval
+        self.refreshed_at = None
+        self.requests = 0
+        super().__init__(path, _RequestHandler)
+        os.chmod(path, 0o600)
+
+    def refresh(self):
+        start = time.monotonic()
+        try:
+            records = inventory.warm(self.config)
+        except Exception as e:
+            click.echo(f"Failed to refresh the inventory: {e}", err=True)
+            return
+        finally:
+            self.refreshed_at = time.monotonic()
+        if self.config.verbose:
+            click.echo(
+                f"Refreshed {len(records)} machines in "
+                f"{self.refreshed_at - start:.2f}s",
+                err=True,
+            )
+
+    def service_actions(self):
+        if (
+            self.refreshed_at is None
+            or self.config.inventory is None
+            or time.monotonic() - self.refreshed_at >= self.refresh_interval
+        ):
+            self.refresh()
+
+    def run(self, request):
+        """
+        Runs the command line of request and returns its output and exit
+        code, or an error if this daemon can't run it. An invalidate request
+        drops the inventory instead.
+        """
+        if request.get("maas_server") != self.config.maas_url:
+            return {"error": f"the daemon serves {self.config.maas_url}"}
+        if request.get("invalidate"):
+            self.config.inventory = None
+            return {"invalidated": True}
+        argv = request.get("argv") or []
+        if not daemon_client.forwardable(argv):
+            return {"error": "command can't be run by the daemon"}
+
+        self.requests += 1
+        stdout, stderr = io.StringIO(), io.StringIO()
+        cwd = os.getcwd()
+        defaults = {field: getattr(self.config, field) for field in REQUEST_FIELDS}
+        try:
+            os.chdir(request.get("cwd") or cwd)
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                exit_code = cli.main(
+                    args=argv,
+                    prog_name="mctl",
+                    obj=self.config,
+                    standalone_mode=False,
+                )
+        except click.ClickException as e:
+            e.show(file=stderr)
+            exit_code = e.exit_code
+        except click.Abort:
+            exit_code = 1
+        except SystemExit as e:
+            exit_code = e.code
+        except Exception as e:
+            stderr.write(f"An error occurred: {e}\n")
+            exit_code = 1
+        finally:
+            os.chdir(cwd)
+            for field, value in defaults.items():
+                setattr(self.config, field, value)
+
+        return {
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+            "exit_code": exit_code if isinstance(exit_code, int) else 0,
+        }
+
+
+def _in_use(path):
+    """
+    Returns whether a daemon is listening on the socket at path.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(config, path=None, refresh_interval=REFRESH_INTERVAL):
+    """
+    Connects to MAAS, loads the inventory and serves forwarded commands on
+    the Unix socket at path until interrupted.
+    """
+    path = path or daemon_client.socket_path()
+    if os.path.exists(path):
+        if _in_use(path):
+            raise click.ClickException(f"A daemon is already listening on {path}")
+        os.remove(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    config.client  # connect before the first request
+    with Daemon(path, config, refresh_interval) as daemon:
+        daemon.refresh()
+        click.echo(
+            f"Serving {config.maas_url} on {path} "
+            f"({len(config.inventory or [])} machines)",
+            err=True,
+        )
+        try:
+            daemon.serve_forever(poll_interval=0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+    click.echo(f"Served {daemon.requests} commands", err=True)
@@ -0,0 +1,119 @@
+# The client side of `mctl serve`. It is imported by the launcher before
+# anything else, so it must only use the standard library, python-dotenv and
+# toml: a command that the daemon answers never imports click or
+# python-libmaas.
+
+import json
+import os
+import socket
+import sys
+
+SOCKET_PATH = "~/.cache/mctl/mctl.sock"
+PROFILE = "~/.maas/credentials"
+CONNECT_TIMEOUT = 1
+
+# Commands sent to a running daemon. They only read machines, so they can be
+# answered from its inventory and rerun locally if the daemon goes away.
+FORWARDED_COMMANDS = [
+    ["machines", "ls"],
+    ["machines", "get-ip-address"],
+    ["machines", "summary"],
+]
+
+
+def socket_path():
+    return os.path.expanduser(os.environ.get("MCTL_SOCKET", SOCKET_PATH))
+
+
+def forwardable(argv):
+    """
+    Returns whether the command line argv can be run by the daemon. Commands
+    reading from a file or stdin are run locally.
+    """
+    return argv[:2] in FORWARDED_COMMANDS and "--file" not in argv
+
+
+def send(sock, message):
+    sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def receive(sock):
+    with sock.makefile("rb") as f:
+        return json.loads(f.readline())
+
+
+def maas_url():
+    """
+    Returns the URL of the MAAS server a command run locally would connect
+    to, from the environment, a .env file or the credential file, like
+    connection.load_credentials. Returns None if there is none.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    url = os.environ.get("MAAS_SERVER")
+    if url and os.environ.get("MAAS_API_KEY"):
+        return url
+
+    try:
+        from tomllib import loads
+    except ImportError:  # Python 3.10
+        from toml import loads
+    try:
+        with open(os.path.expanduser(PROFILE)) as f:
+            return loads(f.read())["maas"]["url"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def request(message, timeout=None):
+    """
+    Sends message to a running daemon and returns its reply. timeout limits
+    the whole exchange, not only connecting.
+
+    Raises:
+        OSError: If no daemon answers.
+        ValueError: If the reply is not valid.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(socket_path())
+        sock.settimeout(timeout)
+        send(sock, message)
+        return receive(sock)
+
+
+def invalidate(url):
+    """
+    Tells a running daemon serving url to drop its inventory, because a
+    command changed machines. Does nothing if no daemon answers.
+    """
+    try:
+        request({"invalidate": True, "maas_server": url}, timeout=CONNECT_TIMEOUT)
+    except (OSError, ValueError):
+        pass
+
+
+def forward(argv):
+    """
+    Runs the command line argv on a running daemon and prints its output.
+
+    Returns:
+        int: The exit code of the command, or None if there is no daemon, it
+            serves another MAAS server, or argv can't be forwarded.
+    """
+    if os.environ.get("MCTL_NO_DAEMON") or not forwardable(argv):
+        return None
+    url = maas_url()
+    if url is None:
+        return None
+    try:
+        reply = request({"argv": argv, "cwd": os.getcwd(), "maas_server": url})
+    except (OSError, ValueError):
+        return None
+    if "error" in reply:
+        return None
+
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    return reply["exit_code"]
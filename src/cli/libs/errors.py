@@ -0,0 +1,30 @@
+class MachineNotFoundError(Exception):
+    """
+    Exception raised when a machine is not found.
+    """
+
+    pass
+
+
+class MachineAvailabilityError(Exception):
+    """
+    Exception raised when not enough machines are available to allocate.
+    """
+
+    pass
+
+
+class CloudInitError(Exception):
+    """
+    Exception raised when rendered cloud-init user data is not valid.
+    """
+
+    pass
+
+
+class SpecError(Exception):
+    """
+    Exception raised when a cluster spec is not valid.
+    """
+
+    pass
@@ -0,0 +1,361 @@
+import asyncio
+import contextlib
+import json
+import sys
+import time
+from collections import namedtuple
+
+import click
+from maas.client.bones import CallAPI, CallError, helpers
+from maas.client.utils.maas_async import asynchronous
+
+from cli.libs import transport
+
+# One MAAS API request. `endpoint` is the libmaas action such as
+# "Machines.read", `start` is relative to when profiling started and `status`
+# is None when no HTTP response was received.
+Call = namedtuple(
+    "Call", ["endpoint", "method", "start", "duration", "sent", "received", "status"]
+)
+
+# Time spent waiting in a polling or retry loop.
+Sleep = namedtuple("Sleep", ["label", "start", "duration"])
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, float("inf")]
+
+# The profiler that is recording, if any.
+_active = None
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _busy_time(intervals):
+    """
+    Returns the time covered by at least one of the (start, duration)
+    intervals, so concurrent calls aren't counted twice.
+    """
+    busy = 0
+    end = float("-inf")
+    for start, duration in sorted(intervals):
+        busy += max(0, start + duration - max(start, end))
+        end = max(end, start + duration)
+    return busy
+
+
+class Profiler:
+    """
+    Records every MAAS API request made through python-libmaas, and the time
+    spent sleeping in wait loops, while it is active.
+
+    Requests are captured by wrapping ``CallAPI.dispatch``, which every
+    libmaas call goes through, so no command needs to be changed to be
+    profiled.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.calls = []
+        self.sleeps = []
+        self.started = clock()
+        self.stopped = None
+        self._dispatch = None
+        self._fetch_api_description = None
+
+    def now(self):
+        return self.clock() - self.started
+
+    def record_call(self, endpoint, method, start, sent, received, status):
+        self.calls.append(
+            Call(endpoint, method, start, self.now() - start, sent, received, status)
+        )
+
+    def record_sleep(self, label, start):
+        self.sleeps.append(Sleep(label, start, self.now() - start))
+
+    def start(self):
+        global _active
+
+        profiler = self
+        dispatch = self._dispatch = CallAPI.dispatch
+
+        @asynchronous
+        async def profiled_dispatch(call, uri, body, headers):
+            start = profiler.now()
+            endpoint = call.action.fullname
+            method = call.action.method
+            sent = len(body or b"")
+            try:
+                result = await dispatch(call, uri, body, headers)
+            except CallError as e:
+                profiler.record_call(
+                    endpoint, method, start, sent, len(e.content), e.status
+                )
+                raise
+            except Exception:
+                profiler.record_call(endpoint, method, start, sent, 0, None)
+                raise
+            profiler.record_call(
+                endpoint,
+                method,
+                start,
+                sent,
+                len(result.content),
+                result.response.status,
+            )
+            return result
+
+        fetch_api_description = self._fetch_api_description = (
+            helpers.fetch_api_description
+        )
+
+        async def profiled_fetch_api_description(url, insecure=False):
+            start = profiler.now()
+            description = await fetch_api_description(url, insecure)
+            profiler.record_call(
+                "describe", "GET", start, 0, len(json.dumps(description)), 200
+            )
+            return description
+
+        CallAPI.dispatch = profiled_dispatch
+        helpers.fetch_api_description = profiled_fetch_api_description
+        _active = self
+
+    def stop(self):
+        global _active
+
+        if self._dispatch is not None:
+            CallAPI.dispatch = self._dispatch
+            helpers.fetch_api_description = self._fetch_api_description
+            self._dispatch = None
+        if _active is self:
+            _active = None
+        self.stopped = self.now()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def elapsed(self):
+        return self.stopped if self.stopped is not None else self.now()
+
+    def endpoints(self):
+        """
+        Returns the call count, errors, latency statistics, latency
+        histogram and bytes of every endpoint, busiest first.
+        """
+        by_endpoint = {}
+        for call in self.calls:
+            by_endpoint.setdefault((call.endpoint, call.method), []).append(call)
+
+        stats = []
+        for (endpoint, method), calls in by_endpoint.items():
+            latencies = [call.duration * 1000 for call in calls]
+            stats.append(
+                {
+                    "endpoint": endpoint,
+                    "method": method,
+                    "calls": len(calls),
+                    "errors": sum(
+                        1 for call in calls if call.status is None or call.status >= 400
+                    ),
+                    "total_ms": sum(latencies),
+                    "mean_ms": sum(latencies) / len(latencies),
+                    "p50_ms": _percentile(latencies, 0.5),
+                    "p95_ms": _percentile(latencies, 0.95),
+                    "max_ms": max(latencies),
+                    "histogram": {
+                        str(bucket): sum(
+                            1
+                            for latency in latencies
+                            if latency <= bucket
+                            and (i == 0 or latency > BUCKETS[i - 1])
+                        )
+                        for i, bucket in enumerate(BUCKETS)
+                    },
+                    "sent_bytes": sum(call.sent for call in calls),
+                    "received_bytes": sum(call.received for call in calls),
+                }
+            )
+        return sorted(stats, key=lambda stat: stat["total_ms"], reverse=True)
+
+    def totals(self):
+        """
+        Returns where the wall time went: waiting on the API, sleeping in
+        wait loops, and everything else.
+        """
+        api = _busy_time((call.start, call.duration) for call in self.calls)
+        sleeping = _busy_time((sleep.start, sleep.duration) for sleep in self.sleeps)
+        return {
+            "wall_s": self.elapsed,
+            "api_s": api,
+            "sleep_s": sleeping,
+            "other_s": max(0, self.elapsed - api - sleeping),
+            "calls": len(self.calls),
+            "sent_bytes": sum(call.sent for call in self.calls),
+            "received_bytes": sum(call.received for call in self.calls),
+        }
+
+    def to_json(self):
+        sleeps = {}
+        for sleep in self.sleeps:
+            sleeps[sleep.label] = sleeps.get(sleep.label, 0) + sleep.duration
+        return {
+            "totals": self.totals(),
+            "connections": transport.stats(),
+            "endpoints": self.endpoints(),
+            "sleeps": sleeps,
+            "calls": [call._asdict() for call in self.calls],
+        }
+
+    def to_chrome_trace(self):
+        """
+        Returns the calls and sleeps in the Chrome trace event format, for
+        chrome://tracing or Perfetto. Overlapping calls are put on separate
+        rows so concurrent requests are visible.
+        """
+        events = []
+        lanes = []
+        for call in sorted(self.calls, key=lambda call: call.start):
+            lane = next(
+                (i for i, end in enumerate(lanes) if end <= call.start), len(lanes)
+            )
+            if lane == len(lanes):
+                lanes.append(0)
+            lanes[lane] = call.start + call.duration
+            events.append(
+                {
+                    "name": call.endpoint,
+                    "cat": "api",
+                    "ph": "X",
+                    "ts": call.start * 1e6,
+                    "dur": call.duration * 1e6,
+                    "pid": 1,
+                    "tid": f"api {lane}",
+                    "args": {
+                        "method": call.method,
+                        "status": call.status,
+                        "sent": call.sent,
+                        "received": call.received,
+                    },
+                }
+            )
+        for sleep in self.sleeps:
+            events.append(
+                {
+                    "name": sleep.label,
+                    "cat": "sleep",
+                    "ph": "X",
+                    "ts": sleep.start * 1e6,
+                    "dur": sleep.duration * 1e6,
+                    "pid": 1,
+                    "tid": "sleep",
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def now():
+    """
+    Returns the time since the active profiler started, or None.
+    """
+    return _active.now() if _active else None
+
+
+def record_call(endpoint, method, start, sent, received, status):
+    """
+    Records a request made outside python-libmaas, such as an upload chunk,
+    with the active profiler. start is the value of now() before the request.
+    """
+    if _active and start is not None:
+        _active.record_call(endpoint, method, start, sent, received, status)
+
+
+async def sleep(seconds, label):
+    """
+    Like asyncio.sleep, and recorded by the active profiler as time spent
+    waiting for label.
+    """
+    if seconds <= 0:
+        return
+    start = _active.now() if _active else None
+    await asyncio.sleep(seconds)
+    if _active and start is not None:
+        _active.record_sleep(label, start)
+
+
+def sleep_sync(seconds, label="status poll"):
+    """
+    Like time.sleep, and recorded by the active profiler as time spent
+    waiting for label.
+    """
+    if seconds <= 0:
+        return
+    start = _active.now() if _active else None
+    time.sleep(seconds)
+    if _active and start is not None:
+        _active.record_sleep(label, start)
+
+
+def echo_report(profiler, file=None):
+    """
+    Prints where the wall time went and a table of the API endpoints called,
+    to stderr unless another file is given.
+    """
+
+    def echo(message):
+        click.echo(message, file=file, err=True)
+
+    totals = profiler.totals()
+    echo(
+        f"\nwall {totals['wall_s']:.2f}s: api {totals['api_s']:.2f}s "
+        f"({totals['calls']} calls, {totals['sent_bytes']} bytes sent, "
+        f"{totals['received_bytes']} bytes received), "
+        f"sleeping {totals['sleep_s']:.2f}s, other {totals['other_s']:.2f}s"
+    )
+    connections = transport.stats()
+    if connections:
+        echo(
+            f"connections: {connections['connections_opened']} opened, "
+            f"{connections['connections_reused']} reused, "
+            f"{connections['queued']} requests waited for a free connection"
+        )
+    endpoints = profiler.endpoints()
+    if not endpoints:
+        return
+
+    width = max(len(f"{s['method']} {s['endpoint']}") for s in endpoints)
+    echo(
+        f"{'ENDPOINT':<{width}}  CALLS  ERRORS  TOTAL(ms)  P50(ms)  P95(ms)  "
+        f"MAX(ms)  RECEIVED"
+    )
+    for stat in endpoints:
+        name = f"{stat['method']} {stat['endpoint']}"
+        echo(
+            f"{name:<{width}}  {stat['calls']:>5}  {stat['errors']:>6}  "
+            f"{stat['total_ms']:>9.1f}  {stat['p50_ms']:>7.1f}  {stat['p95_ms']:>7.1f}  "
+            f"{stat['max_ms']:>7.1f}  {stat['received_bytes']:>8}"
+        )
+
+
+def write_report(profiler, output_format, path=None):
+    """
+    Writes the profile as a table, JSON or a Chrome trace to path, or to
+    stderr when no path is given.
+    """
+    with open(path, "w") if path else contextlib.nullcontext(sys.stderr) as f:
+        if output_format == "table":
+            echo_report(profiler, f)
+        elif output_format == "json":
+            json.dump(profiler.to_json(), f, indent=2)
+        else:
+            json.dump(profiler.to_chrome_trace(), f)
+    if path:
+        click.echo(f"API profile written to {path}", err=True)
@@ -0,0 +1,71 @@
+import asyncio
+from collections import namedtuple
+
+import click
+
+# Interfaces tagged CAPTURE_TAG are named CAPTURE_NAME before deployment.
+CAPTURE_TAG = "capture"
+CAPTURE_NAME = "capture0"
+
+# One interface update. fields are the parameters sent to MAAS.
+InterfaceChange = namedtuple(
+    "InterfaceChange", ["system_id", "hostname", "interface_id", "fields"]
+)
+
+
+def desired_changes(machine):
+    """
+    Returns the interface updates machine needs, if any.
+
+    The first interface tagged "capture" is renamed to capture0, unless an
+    interface of that name already exists. MAAS clears the tags of an
+    interface that is updated without them, so they are sent along with the
+    new name instead of being restored by a second update.
+    """
+    interfaces = machine._data.get("interface_set") or []
+    if any(interface["name"] == CAPTURE_NAME for interface in interfaces):
+        return []
+    for interface in interfaces:
+        if CAPTURE_TAG in interface["tags"]:
+            fields = {"name": CAPTURE_NAME, "tags": ",".join(interface["tags"])}
+            return [
+                InterfaceChange(
+                    machine.system_id, machine.hostname, interface["id"], fields
+                )
+            ]
+    return []
+
+
+async def reconcile(machines, parallelism=10):
+    """
+    Brings the interfaces of all machines to their desired state, updating
+    at most `parallelism` interfaces at the same time and skipping those
+    that are already as desired.
+
+    The desired state is computed from the interface data that came with
+    the machines, so no interface is read before it is updated.
+
+    Returns:
+        tuple: The number of API writes made, and the error of every machine
+            whose interfaces could not be updated, keyed by hostname.
+    """
+    changes = [change for machine in machines for change in desired_changes(machine)]
+    if not changes:
+        return 0, {}
+
+    handler = machines[0]._origin.Interface._handler
+    semaphore = asyncio.Semaphore(parallelism)
+    errors = {}
+
+    async def apply(change):
+        async with semaphore:
+            try:
+                await handler.update(
+                    system_id=change.system_id, id=change.interface_id, **change.fields
+                )
+            except Exception as e:
+                click.echo(f"Error renaming interfaces of {change.hostname}: {e}")
+                errors[change.hostname] = str(e)
+
+    await asyncio.gather(*(apply(change) for change in changes))
+    return len(changes), errors
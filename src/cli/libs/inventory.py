@@ -0,0 +1,250 @@
+import functools
+import os
+from types import SimpleNamespace
+
+from cli.libs import connection, daemon_client
+
+
+class MachineRecord:
+    """
+    The fields of a machine used by the read-only commands.
+
+    Records are plain data, so they can be cached on disk, but they expose the
+    same attributes as libmaas machines for the get_machines_by_* selectors.
+    """
+
+    FIELDS = [
+        "hostname",
+        "system_id",
+        "status_name",
+        "status_message",
+        "pool_name",
+        "owner_name",
+        "tag_names",
+        "ip_addresses",
+    ]
+
+    def __init__(
+        self,
+        hostname,
+        system_id,
+        status_name,
+        status_message,
+        pool_name,
+        owner_name,
+        tag_names,
+        ip_addresses,
+    ):
+        self.hostname = hostname
+        self.system_id = system_id
+        self.status_name = status_name
+        self.status_message = status_message
+        self.pool_name = pool_name
+        self.owner_name = owner_name
+        self.tag_names = tag_names
+        self.ip_addresses = ip_addresses
+
+    @classmethod
+    def from_machine(cls, machine):
+        return cls(
+            hostname=machine.hostname,
+            system_id=machine.system_id,
+            status_name=machine.status_name,
+            status_message=machine.status_message,
+            pool_name=machine.pool.name if machine.pool else None,
+            owner_name=machine.owner.username if machine.owner else None,
+            tag_names=[tag.name for tag in machine.tags],
+            ip_addresses=list(machine.ip_addresses),
+        )
+
+    @classmethod
+    def from_api(cls, data):
+        """
+        Builds a record from a machine as returned by the MAAS API, which is
+        much cheaper than building a libmaas Machine first.
+        """
+        pool = data.get("pool") or {}
+        return cls(
+            hostname=data["hostname"],
+            system_id=data["system_id"],
+            status_name=data.get("status_name"),
+            status_message=data.get("status_message"),
+            pool_name=pool.get("name"),
+            owner_name=data.get("owner"),
+            tag_names=list(data.get("tag_names") or []),
+            ip_addresses=list(data.get("ip_addresses") or []),
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data.get(field) for field in cls.FIELDS})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @property
+    def pool(self):
+        return SimpleNamespace(name=self.pool_name) if self.pool_name else None
+
+    @property
+    def owner(self):
+        return SimpleNamespace(username=self.owner_name) if self.owner_name else None
+
+    @property
+    def tags(self):
+        return [SimpleNamespace(name=name) for name in self.tag_names]
+
+
+def _cache_path(config):
+    return connection.cache_path("machines", config.maas_url)
+
+
+def _save(config, records):
+    if config.cache_ttl > 0 and not config.no_cache:
+        connection.write_cache(
+            _cache_path(config),
+            config.maas_url,
+            [record.to_dict() for record in records],
+        )
+
+
+def _read_cached(config):
+    if config.maas_url is None:
+        connection.load_credentials(config)
+    if config.no_cache or config.refresh:
+        return None
+    if config.inventory is not None:
+        return list(config.inventory)
+    if config.cache_ttl <= 0:
+        return None
+
+    cached = connection.read_cache(
+        _cache_path(config), config.maas_url, config.cache_ttl
+    )
+    if cached is None:
+        return None
+    return [MachineRecord.from_dict(data) for data in cached]
+
+
+def _read(config, **params):
+    """
+    Reads machines from MAAS as plain API data, skipping libmaas objects.
+    """
+    return config.client._origin.Machines._handler.read(**params)
+
+
+def _fetch(config):
+    records = [MachineRecord.from_api(data) for data in _read(config)]
+    _save(config, records)
+    return records
+
+
+def list_machines(config):
+    """
+    Returns a MachineRecord for every machine registered with MAAS.
+
+    When config.cache_ttl is set the listing is served from the on-disk cache
+    while it is younger than the TTL, unless --no-cache or --refresh is
+    given. A fresh listing is written back to the cache.
+    """
+    records = _read_cached(config)
+    if records is None:
+        records = _fetch(config)
+    return records
+
+
+def iter_machines(config):
+    """
+    Yields a MachineRecord for every machine registered with MAAS, like
+    list_machines, building each record only when it is consumed.
+
+    Unless the listing has to be written to the cache, no list of records is
+    kept, so consumers that write each record out as it arrives use memory
+    for the API response only.
+    """
+    records = _read_cached(config)
+    if records is not None:
+        yield from records
+        return
+
+    data = _read(config)
+    if config.cache_ttl <= 0 or config.no_cache:
+        for item in data:
+            yield MachineRecord.from_api(item)
+        return
+
+    records = []
+    for item in data:
+        record = MachineRecord.from_api(item)
+        records.append(record)
+        yield record
+    _save(config, records)
+
+
+def list_machines_by_names(config, names):
+    """
+    Returns the records of the machines with the given hostnames.
+
+    Without a cache only the named machines are read from MAAS. Hostnames
+    that are missing from a cached listing are read from MAAS and merged
+    into the cache, instead of downloading the whole inventory again.
+    """
+    records = _read_cached(config)
+    if records is None and (config.cache_ttl <= 0 or config.no_cache):
+        # nothing will be cached, so only the named machines are read
+        records = [
+            MachineRecord.from_api(data) for data in _read(config, hostname=names)
+        ]
+    elif records is None:
+        records = _fetch(config)
+    else:
+        known = {record.hostname.lower() for record in records}
+        missing = [name for name in names if name.lower() not in known]
+        if missing:
+            fetched = _read(config, hostname=missing)
+            records.extend(MachineRecord.from_api(data) for data in fetched)
+            _save(config, records)
+
+    name_set = {name.lower() for name in names}
+    return [record for record in records if record.hostname.lower() in name_set]
+
+
+def warm(config):
+    """
+    Reads the whole inventory and keeps it in memory on config, where every
+    later listing is served from until it is invalidated. Used by the
+    daemon, which refreshes it in the background.
+    """
+    config.inventory = [MachineRecord.from_api(data) for data in _read(config)]
+    return config.inventory
+
+
+def invalidate(config):
+    """
+    Removes the cached inventory, e.g. after a command changed machines,
+    including the one of a running daemon.
+    """
+    config.inventory = None
+    if config.maas_url is None:
+        return
+    try:
+        os.remove(_cache_path(config))
+    except FileNotFoundError:
+        pass
+    daemon_client.invalidate(config.maas_url)
+
+
+def invalidates_cache(f):
+    """
+    Decorator for commands that change machines, so later invocations don't
+    read stale state from the cache. It must be applied below @pass_config.
+    """
+
+    @functools.wraps(f)
+    def wrapper(config, *args, **kwargs):
+        try:
+            return f(config, *args, **kwargs)
+        finally:
+            invalidate(config)
+
+    return wrapper
@@ -0,0 +1,92 @@
+import contextlib
+import os
+import time
+
+from cli.libs import connection
+
+JOURNAL_TTL = 30 * 24 * 60 * 60
+
+# The phases of a node in a deployment, in order. "ready" is only reached by
+# the primary server, once its SSH and Kubernetes API ports answer.
+PHASES = ["pending", "deploying", "deployed", "ready", "failed"]
+
+
+class DeployJournal:
+    """
+    A record on disk of a deploy-cluster run: the cluster token, the role
+    and phase of every node, and when each phase was reached.
+
+    The journal is rewritten atomically on every change, so an interrupted
+    run always leaves a consistent journal to resume from.
+
+    Args:
+        url (str): The MAAS server the cluster is deployed with.
+        servers (list): The hostnames of the servers, the primary first.
+        agents (list): The hostnames of the agents.
+    """
+
+    def __init__(self, url, servers, agents):
+        self.url = url
+        self.path = connection.cache_path(
+            "deploy", f"{url}|{','.join(servers)}|{','.join(agents)}"
+        )
+        self.servers = list(servers)
+        self.agents = list(agents)
+        self.data = None
+
+    def load(self):
+        """
+        Reads the journal of an earlier run of the same deployment and
+        returns whether there was one.
+        """
+        self.data = connection.read_cache(self.path, self.url, JOURNAL_TTL)
+        return self.data is not None
+
+    def start(self, token):
+        """
+        Starts a new journal for a deployment with token.
+        """
+        now = time.time()
+        roles = {hostname: "primary" for hostname in self.servers[:1]}
+        roles.update((hostname, "secondary") for hostname in self.servers[1:])
+        roles.update((hostname, "agent") for hostname in self.agents)
+        nodes = {
+            hostname: {"role": role, "phase": "pending", "since": now}
+            for hostname, role in roles.items()
+        }
+        self.data = {"token": token, "started_at": now, "nodes": nodes}
+        self.save()
+
+    @property
+    def token(self):
+        return self.data["token"]
+
+    def phase(self, hostname):
+        return self.data["nodes"][hostname]["phase"]
+
+    def mark(self, hostnames, phase, status=None):
+        """
+        Records that the nodes with hostnames reached phase, with the MAAS
+        status or error that got them there.
+        """
+        now = time.time()
+        for hostname in hostnames:
+            node = self.data["nodes"][hostname]
+            node.update(phase=phase, since=now)
+            if status is not None:
+                node["status"] = status
+        self.save()
+
+    def record(self, hostname, status):
+        """
+        Records the final MAAS status, or error, of a node's deployment.
+        """
+        phase = "deployed" if status == "Deployed" else "failed"
+        self.mark([hostname], phase, status)
+
+    def save(self):
+        connection.write_cache(self.path, self.url, self.data)
+
+    def clear(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
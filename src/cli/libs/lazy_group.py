@@ -0,0 +1,56 @@
+import importlib
+
+import click
+
+
+class LazyGroup(click.Group):
+    """
+    A command group whose subcommands are imported only when they are
+    invoked or listed in the help, on the pattern of Click's LazyGroup.
+
+    Importing a command group pulls in everything its commands use, such as
+    python-libmaas, aiohttp or paramiko, so `mctl --help` and every command
+    would otherwise pay for all of them at startup.
+
+    Args:
+        lazy_subcommands (dict): The import path of every lazily loaded
+            subcommand, as "module:attribute", and the short help shown for
+            it in the help of the group, by subcommand name.
+    """
+
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        return sorted([*super().list_commands(ctx), *self.lazy_subcommands])
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands:
+            return self._load(cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        """
+        Lists the subcommands with the short help given for the lazily loaded
+        ones, so the help of the group doesn't import them.
+        """
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.lazy_subcommands:
+                rows.append((name, self.lazy_subcommands[name][1]))
+                continue
+            command = super().get_command(ctx, name)
+            if command is not None and not command.hidden:
+                rows.append((name, command.get_short_help_str(formatter.width)))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+    def _load(self, cmd_name):
+        import_path = self.lazy_subcommands[cmd_name][0]
+        module_name, attribute = import_path.split(":")
+        command = getattr(importlib.import_module(module_name), attribute)
+        if not isinstance(command, click.Command):
+            raise ValueError(f"{import_path} is not a click command")
+        return command
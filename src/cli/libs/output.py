@@ -0,0 +1,102 @@
+import csv
+import itertools
+import json
+
+import click
+
+# Output field names and the MachineRecord attributes they are read from.
+FIELDS = {
+    "hostname": "hostname",
+    "system_id": "system_id",
+    "status": "status_name",
+    "status_message": "status_message",
+    "pool": "pool_name",
+    "owner": "owner_name",
+    "tags": "tag_names",
+    "ips": "ip_addresses",
+}
+
+
+def parse_fields(ctx, param, value):
+    """
+    Click callback that turns a comma separated list of FIELDS into a list.
+    """
+    if value is None:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise click.BadParameter(
+            f"unknown fields {', '.join(unknown)}, choose from {', '.join(FIELDS)}"
+        )
+    return fields
+
+
+def _row(record, fields):
+    return {field: getattr(record, FIELDS[field]) for field in fields}
+
+
+def _flatten(value):
+    if isinstance(value, list):
+        return ",".join(value)
+    return "" if value is None else str(value)
+
+
+def write_records(records, output_format="text", fields=None):
+    """
+    Writes machine records to stdout one at a time, so a listing is never
+    held in memory as a whole document.
+
+    Args:
+        records: An iterable of MachineRecord.
+        output_format (str): text (tab separated), json, ndjson or csv.
+        fields (list): The FIELDS to write. text defaults to the hostname,
+            the other formats to every field.
+    """
+    if fields is None:
+        fields = ["hostname"] if output_format == "text" else list(FIELDS)
+
+    # read the first record before writing anything, so an error connecting
+    # to MAAS doesn't leave a csv header or an opening bracket on stdout
+    records = iter(records)
+    first = next(records, None)
+    if first is not None:
+        records = itertools.chain([first], records)
+
+    if output_format == "csv":
+        writer = csv.writer(click.get_text_stream("stdout"), lineterminator="\n")
+        writer.writerow(fields)
+        for record in records:
+            writer.writerow(_flatten(value) for value in _row(record, fields).values())
+    elif output_format == "ndjson":
+        for record in records:
+            click.echo(json.dumps(_row(record, fields)))
+    elif output_format == "json":
+        click.echo("[", nl=False)
+        for i, record in enumerate(records):
+            click.echo(
+                ("," if i else "") + "\n  " + json.dumps(_row(record, fields)), nl=False
+            )
+        click.echo("\n]")
+    else:
+        for record in records:
+            click.echo(
+                "\t".join(_flatten(value) for value in _row(record, fields).values())
+            )
+
+
+def write_addresses(addresses, output_format="text"):
+    """
+    Writes hostname to IP address mappings, as returned by
+    utils.get_ip_addresses, as tab separated text, a JSON object or csv.
+    """
+    if output_format == "json":
+        click.echo(json.dumps(addresses, indent=2))
+    elif output_format == "csv":
+        writer = csv.writer(click.get_text_stream("stdout"), lineterminator="\n")
+        writer.writerow(["hostname", "ips"])
+        for hostname, address in addresses.items():
+            writer.writerow([hostname, _flatten(address)])
+    else:
+        for hostname, address in addresses.items():
+            click.echo(f"{hostname}\t{_flatten(address)}")
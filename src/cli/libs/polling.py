@@ -0,0 +1,122 @@
+import random
+import time
+
+
+class FixedInterval:
+    """
+    Polls every `interval` seconds.
+    """
+
+    def __init__(self, interval=5):
+        self.interval = interval
+
+    def delay(self, attempt, statuses):
+        return self.interval
+
+
+class ExponentialBackoff:
+    """
+    Starts polling quickly and backs off exponentially while nothing changes.
+
+    Args:
+        initial (float): Delay after a change, in seconds.
+        maximum (float): Upper bound of the delay, in seconds.
+        factor (float): Multiplier applied for each poll without a change.
+        jitter (float): Fraction of the delay added or removed at random, so
+            many pollers don't hit the API in lockstep.
+        rng: A random.Random compatible source, for reproducible delays.
+    """
+
+    def __init__(self, initial=1, maximum=30, factor=2, jitter=0.1, rng=None):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt, statuses):
+        try:
+            delay = min(self.maximum, self.initial * self.factor**attempt)
+        except OverflowError:
+            # after enough attempts factor**attempt no longer fits a float
+            delay = self.maximum
+        return delay * (1 + self.jitter * self.rng.uniform(-1, 1))
+
+
+class StateAwareInterval:
+    """
+    Picks the delay from the statuses being waited on: slow while a machine
+    is in a long phase such as installing the OS, fast once it is close to
+    an end state. With several machines the shortest delay wins.
+
+    Args:
+        intervals (dict): Delay in seconds by status message.
+        default (float): Delay for statuses not in intervals.
+    """
+
+    INTERVALS = {
+        "Deploying": 30,
+        "Performing PXE boot": 20,
+        "Loading ephemeral": 20,
+        "Installing OS": 15,
+        "Configuring OS": 5,
+        "Rebooting": 5,
+        "Releasing": 5,
+        "Powering off": 5,
+    }
+
+    def __init__(self, intervals=None, default=5):
+        self.intervals = self.INTERVALS if intervals is None else intervals
+        self.default = default
+
+    def delay(self, attempt, statuses):
+        return min(
+            (self.intervals.get(status, self.default) for status in statuses),
+            default=self.default,
+        )
+
+
+STRATEGIES = {
+    "fixed": FixedInterval,
+    "backoff": ExponentialBackoff,
+    "adaptive": StateAwareInterval,
+}
+
+
+def make_strategy(name):
+    """
+    Returns a new polling strategy by name: fixed, backoff or adaptive.
+    """
+    return STRATEGIES[name]()
+
+
+class RequestBudget:
+    """
+    A token bucket limiting how many status requests are made per second,
+    shared by every watcher in the process.
+
+    Args:
+        rate (float): Average number of requests per second.
+        burst (int): Number of requests that can be made back to back.
+        clock (callable): Returns the current time in seconds.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = burst
+        self._updated = clock()
+
+    def reserve(self):
+        """
+        Takes one token and returns how many seconds to wait before the
+        request may be made.
+        """
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0
+        return -self._tokens / self.rate
@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import ssl
+import statistics
+import time
+from collections import namedtuple
+
+import click
+
+from cli.libs import instrumentation
+from cli.libs.polling import ExponentialBackoff
+
+# A target to probe. `check` is one of CHECKS, `timeout` the number of
+# seconds to keep trying before giving up.
+Endpoint = namedtuple("Endpoint", ["host", "port", "check", "timeout"])
+
+# The outcome of probing an endpoint. `elapsed` is the time until it became
+# ready (or was given up on) and `latencies` the duration of every attempt.
+ProbeResult = namedtuple(
+    "ProbeResult", ["endpoint", "ready", "elapsed", "latencies", "error"]
+)
+
+
+async def _read_line(reader, timeout):
+    """
+    Reads one line, failing like a refused connection when the line is
+    longer than the stream's buffer limit.
+    """
+    try:
+        return await asyncio.wait_for(reader.readline(), timeout)
+    except (ValueError, asyncio.LimitOverrunError) as e:
+        raise ConnectionError(f"line too long: {e}") from e
+
+
+async def check_tcp(host, port, timeout):
+    """
+    Succeeds when a TCP connection to host:port can be opened.
+    """
+    _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    writer.close()
+
+
+async def check_ssh(host, port, timeout):
+    """
+    Succeeds when host:port answers with an SSH protocol banner, which means
+    sshd is accepting sessions rather than just the port being open.
+    """
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port), timeout
+    )
+    try:
+        banner = await _read_line(reader, timeout)
+    finally:
+        writer.close()
+    if not banner.startswith(b"SSH-"):
+        raise ConnectionError(f"unexpected banner {banner[:32]!r}")
+
+
+async def check_rke2(host, port, timeout):
+    """
+    Succeeds when the Kubernetes API server on host:port reports ready on
+    its /readyz endpoint. The cluster CA isn't known yet, so the server
+    certificate is not verified.
+    """
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=context), timeout
+    )
+    try:
+        writer.write(
+            f"GET /readyz HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode()
+        )
+        status_line = await _read_line(reader, timeout)
+    finally:
+        writer.close()
+    parts = status_line.split()
+    if len(parts) < 2 or parts[1] != b"200":
+        raise ConnectionError(f"/readyz returned {status_line.strip()!r}")
+
+
+CHECKS = {"tcp": check_tcp, "ssh": check_ssh, "rke2": check_rke2}
+
+
+async def wait_ready(endpoint, strategy=None, attempt_timeout=2):
+    """
+    Probes an endpoint until its check succeeds or it times out.
+
+    Returns:
+        ProbeResult: The outcome of probing the endpoint.
+    """
+    check = CHECKS[endpoint.check]
+    strategy = strategy or ExponentialBackoff(initial=0.5, maximum=5)
+    latencies = []
+    error = None
+    start = time.monotonic()
+    for attempt in itertools.count():
+        attempt_start = time.monotonic()
+        remaining = endpoint.timeout - (attempt_start - start)
+        try:
+            await check(
+                endpoint.host, endpoint.port, max(0, min(attempt_timeout, remaining))
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+        else:
+            latencies.append(time.monotonic() - attempt_start)
+            return ProbeResult(
+                endpoint, True, time.monotonic() - start, latencies, None
+            )
+        latencies.append(time.monotonic() - attempt_start)
+
+        remaining = endpoint.timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return ProbeResult(
+                endpoint, False, time.monotonic() - start, latencies, error
+            )
+        await instrumentation.sleep(
+            min(remaining, strategy.delay(attempt, [])), "readiness probe"
+        )
+
+
+async def probe_all(endpoints):
+    """
+    Probes all endpoints concurrently and reports each one as soon as it is
+    ready or has timed out.
+
+    Returns:
+        list: A ProbeResult for every endpoint, in the order given.
+    """
+
+    async def probe(endpoint):
+        result = await wait_ready(endpoint)
+        target = f"{endpoint.host}:{endpoint.port} ({endpoint.check})"
+        if result.ready:
+            click.echo(f"{target} ready after {result.elapsed:.1f}s")
+        else:
+            click.echo(
+                f"{target} not ready after {result.elapsed:.1f}s: {result.error}"
+            )
+        return result
+
+    return await asyncio.gather(*(probe(endpoint) for endpoint in endpoints))
+
+
+def echo_probe_results(results):
+    """
+    Prints a table with the outcome and attempt latencies of every endpoint.
+    """
+    targets = [f"{r.endpoint.host}:{r.endpoint.port}" for r in results]
+    width = max([len("TARGET")] + [len(target) for target in targets])
+    click.echo(
+        f"{'TARGET':<{width}}  CHECK  READY  ELAPSED  ATTEMPTS  MIN(ms)  AVG(ms)  MAX(ms)"
+    )
+    for target, result in zip(targets, results):
+        latencies = [latency * 1000 for latency in result.latencies]
+        click.echo(
+            f"{target:<{width}}  {result.endpoint.check:<5}  "
+            f"{'yes' if result.ready else 'no':<5}  {result.elapsed:>6.1f}s  "
+            f"{len(latencies):>8}  {min(latencies):>7.1f}  "
+            f"{statistics.mean(latencies):>7.1f}  {max(latencies):>7.1f}"
+        )
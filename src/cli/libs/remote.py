@@ -0,0 +1,142 @@
+import io
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import paramiko
+
+# The outcome of fetching one remote file. `host` is the name of the
+# machine, `size` the number of bytes written to local_path and `error` the
+# reason the fetch failed.
+FetchResult = namedtuple(
+    "FetchResult", ["host", "remote_path", "local_path", "size", "error"]
+)
+
+
+def load_private_key(ssh_key):
+    """
+    Loads an RSA private key from a file or from the key itself.
+
+    Returns:
+        paramiko.RSAKey: The key, or None to use the SSH agent and the keys
+            in ~/.ssh.
+    """
+    if ssh_key is None:
+        return None
+    if os.path.isfile(ssh_key):
+        return paramiko.RSAKey.from_private_key_file(ssh_key)
+    if ssh_key.startswith("-----BEGIN"):
+        return paramiko.RSAKey.from_private_key(io.StringIO(ssh_key))
+    raise ValueError("ssh key must be a private key or the path to one")
+
+
+class SSHPool:
+    """
+    Keeps one SSH connection per host open so any number of transfers to the
+    same host share a single handshake. Every transfer opens its own SFTP
+    channel on the shared connection, so they can run in parallel threads.
+
+    Args:
+        username (str): The user to log in as.
+        ssh_key (str): A private key or the path to one, loaded once for all
+            connections. Without one the SSH agent and ~/.ssh keys are used.
+    """
+
+    def __init__(self, username="ubuntu", ssh_key=None):
+        self.username = username
+        self.key = load_private_key(ssh_key)
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def client(self, host):
+        """
+        Returns the connection to host, connecting on first use or if the
+        previous connection was dropped.
+        """
+        with self._lock:
+            host_lock = self._locks.setdefault(host, threading.Lock())
+
+        with host_lock:
+            client = self._clients.get(host)
+            transport = client.get_transport() if client else None
+            if transport is None or not transport.is_active():
+                client = paramiko.SSHClient()
+                client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                client.connect(
+                    hostname=host,
+                    username=self.username,
+                    allow_agent=True,
+                    look_for_keys=True,
+                    pkey=self.key,
+                )
+                self._clients[host] = client
+            return client
+
+    def get(self, host, remote_path, local_path):
+        """
+        Copies remote_path on host to local_path and returns its size.
+        """
+        with self.client(host).open_sftp() as sftp:
+            sftp.get(remote_path, local_path)
+        return os.path.getsize(local_path)
+
+    def close(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def fetch_files(pool, transfers, parallelism=10):
+    """
+    Fetches remote files from many hosts in parallel.
+
+    Args:
+        pool (SSHPool): The connections to fetch over.
+        transfers (list): ((hostname, address), remote_path, local_path)
+            tuples. Files are fetched from the address and reported by the
+            hostname.
+        parallelism (int): The maximum number of concurrent transfers.
+
+    Returns:
+        list: A FetchResult for every transfer, in the order given.
+    """
+
+    def fetch(host, remote_path, local_path):
+        hostname, address = host
+        try:
+            os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+            size = pool.get(address, remote_path, local_path)
+        except Exception as e:
+            click.echo(f"Failed to fetch {remote_path} from {hostname}: {e}")
+            return FetchResult(hostname, remote_path, local_path, None, str(e))
+        click.echo(f"Fetched {remote_path} from {hostname}")
+        return FetchResult(hostname, remote_path, local_path, size, None)
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        return list(executor.map(lambda transfer: fetch(*transfer), transfers))
+
+
+def echo_fetch_results(results):
+    """
+    Prints a table with the local path, size or error of every fetch.
+    """
+    width = max([len("HOST")] + [len(result.host) for result in results])
+    click.echo(f"{'HOST':<{width}}  {'SIZE':>10}  FILE")
+    for result in results:
+        if result.error:
+            click.echo(
+                f"{result.host:<{width}}  {'failed':>10}  {result.remote_path}: {result.error}"
+            )
+        else:
+            click.echo(
+                f"{result.host:<{width}}  {result.size:>10}  {result.local_path}"
+            )
@@ -0,0 +1,244 @@
+import json
+from array import array
+from collections import Counter
+
+import click
+
+from cli.libs.cluster import AVAILABLE_STATUSES
+
+# The dimensions machines are counted by.
+DIMENSIONS = ["pool", "status", "tag", "owner"]
+
+
+class _Dictionary:
+    """
+    Interns the values of a column as small integer codes.
+    """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def matching(self, names):
+        """
+        Returns the codes of the values equal to any of names,
+        case-insensitive.
+        """
+        wanted = {name.lower() for name in names}
+        return {
+            code
+            for code, value in enumerate(self.values)
+            if value is not None and value.lower() in wanted
+        }
+
+
+class FleetSummary:
+    """
+    Machine counts by resource pool, status, tag and owner, aggregated in one
+    pass over a listing.
+
+    Machines with the same pool, status, owner and set of tags are counted as
+    one group. Every group is a row of integer codes in a few arrays, and the
+    names behind the codes are kept once per distinct value, so a summary
+    stays small however many machines were counted and no machine is kept
+    once it has been added.
+    """
+
+    def __init__(self):
+        self.pools = _Dictionary()
+        self.statuses = _Dictionary()
+        self.owners = _Dictionary()
+        self.tags = _Dictionary()
+        self.tag_sets = _Dictionary()
+        self.columns = {
+            name: array("I") for name in ["pool", "status", "owner", "tags", "count"]
+        }
+        self._groups = {}
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Returns the summary of an iterable of MachineRecords.
+        """
+        summary = cls()
+        for record in records:
+            summary.add(record)
+        return summary
+
+    def add(self, record):
+        tag_set = tuple(sorted({self.tags.code(name) for name in record.tag_names}))
+        key = (
+            self.pools.code(record.pool_name),
+            self.statuses.code(record.status_name),
+            self.owners.code(record.owner_name),
+            self.tag_sets.code(tag_set),
+        )
+        position = self._groups.get(key)
+        if position is None:
+            position = self._groups[key] = len(self.columns["count"])
+            for name, code in zip(["pool", "status", "owner", "tags"], key):
+                self.columns[name].append(code)
+            self.columns["count"].append(0)
+        self.columns["count"][position] += 1
+
+    def __len__(self):
+        return sum(self.columns["count"])
+
+    def select(self, pools=None, statuses=None, owners=None, tags=None):
+        """
+        Returns the positions of the groups in any of the pools, statuses and
+        owners given, with at least one of the tags given.
+        """
+        filters = []
+        for column, dictionary, names in [
+            ("pool", self.pools, pools),
+            ("status", self.statuses, statuses),
+            ("owner", self.owners, owners),
+        ]:
+            if names:
+                filters.append((self.columns[column], dictionary.matching(names)))
+        if tags:
+            tag_codes = self.tags.matching(tags)
+            filters.append(
+                (
+                    self.columns["tags"],
+                    {
+                        code
+                        for code, tag_set in enumerate(self.tag_sets.values)
+                        if tag_codes.intersection(tag_set)
+                    },
+                )
+            )
+        return [
+            position
+            for position in range(len(self.columns["count"]))
+            if all(column[position] in codes for column, codes in filters)
+        ]
+
+    def count(self, positions):
+        return sum(self.columns["count"][position] for position in positions)
+
+    def _names(self, position, dimension, tag_codes):
+        if dimension == "pool":
+            return [self.pools.values[self.columns["pool"][position]]]
+        if dimension == "status":
+            return [self.statuses.values[self.columns["status"][position]]]
+        if dimension == "owner":
+            return [self.owners.values[self.columns["owner"][position]]]
+        tag_set = self.tag_sets.values[self.columns["tags"][position]]
+        names = [
+            self.tags.values[code]
+            for code in tag_set
+            if tag_codes is None or code in tag_codes
+        ]
+        return names or [None]
+
+    def rows(self, positions, by=("pool", "status"), tags=None):
+        """
+        Returns the machine counts of the groups at positions by the
+        dimensions in by, sorted by name.
+
+        A machine is counted once for every tag it has, so counts by tag
+        don't add up to the number of machines. When tags are given only
+        those tags are counted.
+        """
+        tag_codes = self.tags.matching(tags) if tags else None
+        counts = Counter()
+        for position in positions:
+            keys = [()]
+            for dimension in by:
+                keys = [
+                    key + (name,)
+                    for key in keys
+                    for name in self._names(position, dimension, tag_codes)
+                ]
+            for key in keys:
+                counts[key] += self.columns["count"][position]
+        return [
+            {**dict(zip(by, key)), "count": count}
+            for key, count in sorted(
+                counts.items(),
+                key=lambda item: [name or "" for name in item[0]],
+            )
+        ]
+
+
+def summarize(summary, by, pools=None, statuses=None, owners=None, tags=None):
+    """
+    Returns the report of the machines matching the selectors: their total,
+    how many of them can be allocated, and their counts by the dimensions in
+    by.
+    """
+    positions = summary.select(pools, statuses, owners, tags)
+    matching = set(positions)
+    available = [
+        position
+        for position in summary.select(pools, AVAILABLE_STATUSES, owners, tags)
+        if position in matching
+    ]
+    return {
+        "total": summary.count(positions),
+        "available": summary.count(available),
+        "by": list(by),
+        "rows": summary.rows(positions, by, tags),
+    }
+
+
+def parse_dimensions(ctx, param, value):
+    """
+    Click callback that turns a comma separated list of DIMENSIONS into a
+    list.
+    """
+    dimensions = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in dimensions if name not in DIMENSIONS]
+    if unknown:
+        raise click.BadParameter(
+            f"unknown dimensions {', '.join(unknown)}, choose from {', '.join(DIMENSIONS)}"
+        )
+    return dimensions
+
+
+def write_report(report, output_format="table"):
+    """
+    Writes a report returned by summarize as a table or JSON.
+    """
+    if output_format == "json":
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    headers = [dimension.upper() for dimension in report["by"]] + ["COUNT"]
+    rows = [
+        [
+            "-" if row[dimension] is None else row[dimension]
+            for dimension in report["by"]
+        ]
+        + [str(row["count"])]
+        for row in report["rows"]
+    ]
+    widths = [
+        max([len(header)] + [len(row[i]) for row in rows])
+        for i, header in enumerate(headers)
+    ]
+    click.echo("  ".join(f"{header:<{widths[i]}}" for i, header in enumerate(headers)))
+    for row in rows:
+        click.echo(
+            "  ".join(
+                (
+                    f"{value:>{widths[i]}}"
+                    if i == len(row) - 1
+                    else f"{value:<{widths[i]}}"
+                )
+                for i, value in enumerate(row)
+            )
+        )
+    click.echo(
+        f"\n{report['total']} machines, {report['available']} available "
+        f"({' or '.join(AVAILABLE_STATUSES)})"
+    )
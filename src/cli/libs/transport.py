@@ -0,0 +1,265 @@
+import json
+import os
+from collections import namedtuple
+
+# aiohttp and python-libmaas are imported once the transport starts, on the
+# first connection, so installing it costs nothing for --help.
+
+# How MAAS API requests are sent. pool_size bounds the open connections and
+# so the requests in flight, keepalive is how long an idle connection is
+# kept open (0 closes every connection after its request), gzip asks for
+# compressed responses and timeout bounds each request (0 is unlimited).
+TransportSettings = namedtuple(
+    "TransportSettings", ["pool_size", "keepalive", "gzip", "timeout"]
+)
+
+DEFAULT_SETTINGS = TransportSettings(pool_size=20, keepalive=30, gzip=True, timeout=0)
+
+# The environment variable of each setting. They override the [transport]
+# table of the credentials profile.
+ENVIRONMENT = {
+    "pool_size": "MCTL_HTTP_POOL_SIZE",
+    "keepalive": "MCTL_HTTP_KEEPALIVE",
+    "gzip": "MCTL_HTTP_GZIP",
+    "timeout": "MCTL_HTTP_TIMEOUT",
+}
+
+
+def _parse(name, value):
+    if name == "gzip":
+        if isinstance(value, bool):
+            return value
+        return str(value).lower() not in ["0", "false", "no", "off"]
+    number = float(value)
+    if number < 0:
+        raise ValueError(f"transport setting {name} must not be negative")
+    return number if name == "timeout" else int(number)
+
+
+def load_settings(profile=None):
+    """
+    Returns the transport settings from the [transport] table of the
+    credentials profile, overridden by the MCTL_HTTP_* environment
+    variables.
+
+    Args:
+        profile (dict): The parsed credentials profile, if there is one.
+    """
+    values = DEFAULT_SETTINGS._asdict()
+    values.update((profile or {}).get("transport", {}))
+    for name, variable in ENVIRONMENT.items():
+        if os.environ.get(variable):
+            values[name] = os.environ[variable]
+    return TransportSettings(
+        **{name: _parse(name, values[name]) for name in TransportSettings._fields}
+    )
+
+
+class Transport:
+    """
+    Sends the requests of python-libmaas over a shared pool of keep-alive
+    connections.
+
+    libmaas opens a new HTTP session, and so a new connection, for every
+    request. Once installed, every ``CallAPI`` goes through one
+    ``aiohttp.ClientSession`` per event loop instead, so concurrent and
+    consecutive requests to the region controller reuse connections.
+
+    The counters in ``stats`` come from aiohttp's tracing hooks.
+    """
+
+    def __init__(self, settings=DEFAULT_SETTINGS):
+        self.settings = settings
+        self._sessions = {}
+        self._dispatch = None
+        self.requests = 0
+        self.opened = 0
+        self.reused = 0
+        self.queued = 0
+
+    def configure(self, settings):
+        """
+        Changes the settings used by sessions created from now on.
+        """
+        self.settings = settings
+
+    def _trace_config(self):
+        import aiohttp
+
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.requests += 1
+
+        async def on_connection_create_end(session, context, params):
+            self.opened += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.reused += 1
+
+        async def on_connection_queued_start(session, context, params):
+            self.queued += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        return trace_config
+
+    def session(self, insecure=False):
+        """
+        Returns the session of the running event loop, creating it on first
+        use.
+        """
+        import asyncio
+
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        key = (loop, insecure)
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            settings = self.settings
+            connector = aiohttp.TCPConnector(
+                ssl=False if insecure else None,
+                limit=settings.pool_size,
+                keepalive_timeout=settings.keepalive or None,
+                force_close=not settings.keepalive,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=settings.timeout or None),
+                auto_decompress=True,
+                trace_configs=[self._trace_config()],
+            )
+            self._sessions[key] = session
+        return session
+
+    async def request(self, call, uri, body, headers):
+        """
+        Sends the request of call, handling the response like libmaas does.
+        """
+        from maas.client.bones import CallError, CallResult
+
+        headers = dict(headers)
+        if not any(header.lower() == "accept" for header in headers):
+            headers["Accept"] = "application/json,*/*;q=0.9"
+        if not self.settings.gzip:
+            headers["Accept-Encoding"] = "identity"
+
+        session = self.session(call.action.handler.session.insecure)
+        async with session.request(
+            call.action.method, uri, data=body, headers=headers
+        ) as response:
+            content = await response.read()
+            if response.status // 100 != 2:
+                request = {
+                    "body": body,
+                    "headers": headers,
+                    "method": call.action.method,
+                    "uri": uri,
+                }
+                raise CallError(request, response, content, call)
+
+            if response.content_type and response.content_type.endswith("/json"):
+                data = json.loads(content.decode("utf-8"))
+            else:
+                data = content
+            return CallResult(response, content, data)
+
+    def start(self):
+        """
+        Sends libmaas's requests through this transport, if it doesn't yet.
+        """
+        from maas.client.bones import CallAPI
+        from maas.client.utils.maas_async import asynchronous
+
+        if self._dispatch is not None:
+            return
+        transport = self
+        self._dispatch = CallAPI.dispatch
+
+        @asynchronous
+        async def dispatch(call, uri, body, headers):
+            return await transport.request(call, uri, body, headers)
+
+        CallAPI.dispatch = dispatch
+
+    def stop(self):
+        """
+        Restores libmaas's dispatch and closes the open connections.
+        """
+        if self._dispatch is not None:
+            from maas.client.bones import CallAPI
+
+            CallAPI.dispatch = self._dispatch
+            self._dispatch = None
+        for (loop, _), session in self._sessions.items():
+            if not session.closed and not loop.is_closed() and not loop.is_running():
+                loop.run_until_complete(session.close())
+        self._sessions.clear()
+
+    def stats(self):
+        """
+        Returns the requests sent, connections opened and reused, and how
+        often a request waited for a free connection.
+        """
+        return {
+            "requests": self.requests,
+            "connections_opened": self.opened,
+            "connections_reused": self.reused,
+            "queued": self.queued,
+        }
+
+
+# The transport MAAS requests go through, if one is installed.
+_active = None
+
+
+def install(settings=DEFAULT_SETTINGS):
+    """
+    Sends all MAAS API requests of the process through a pooled Transport,
+    which starts when the client is connected and calls configure.
+
+    Returns:
+        bool: Whether a transport was installed, False if one already was.
+    """
+    global _active
+
+    if _active is not None:
+        return False
+    _active = Transport(settings)
+    return True
+
+
+def configure(settings):
+    """
+    Applies settings to the installed transport and starts it, before its
+    first request.
+    """
+    if _active:
+        _active.configure(settings)
+        _active.start()
+
+
+def start():
+    """
+    Starts the installed transport now instead of on the first connection.
+    """
+    if _active:
+        _active.start()
+
+
+def stats():
+    """
+    Returns the connection counters of the installed transport, or None.
+    """
+    return _active.stats() if _active else None
+
+
+def uninstall():
+    global _active
+
+    if _active:
+        _active.stop()
+        _active = None
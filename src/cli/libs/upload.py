@@ -0,0 +1,229 @@
+import contextlib
+import hashlib
+import os
+from urllib.parse import urlparse
+
+import aiohttp
+from maas.client import utils as maas_utils
+from maas.client.bones import CallError
+from maas.client.viscera.boot_resources import BootResourceFileType
+from tqdm import tqdm
+
+from cli.libs import connection, instrumentation
+
+DEFAULT_CHUNK_SIZE = 8 << 20
+UPLOAD_STATE_TTL = 7 * 24 * 60 * 60
+
+
+def hash_file(path, chunk_size=DEFAULT_CHUNK_SIZE, progress=True):
+    """
+    Reads path once in chunks and returns its size and SHA256 hex digest.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f, tqdm(
+        total=size,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        desc="Hashing",
+        disable=not progress,
+    ) as bar:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+            bar.update(len(chunk))
+    return size, digest.hexdigest()
+
+
+def state_path(url, path, name, architecture):
+    """
+    Returns the path of the resume state of uploading path as name and
+    architecture to the MAAS server at url.
+    """
+    return connection.cache_path(
+        "upload", f"{url}|{os.path.abspath(path)}|{name}|{architecture}"
+    )
+
+
+def load_state(url, path, name, architecture):
+    """
+    Returns the resume state of an earlier upload of path, or None if there
+    is none or the file has changed since.
+    """
+    state = connection.read_cache(
+        state_path(url, path, name, architecture), url, UPLOAD_STATE_TTL
+    )
+    if state is None:
+        return None
+
+    stat = os.stat(path)
+    if state.get("size") != stat.st_size or state.get("mtime") != stat.st_mtime:
+        return None
+    return state
+
+
+def save_state(url, path, name, architecture, state):
+    connection.write_cache(state_path(url, path, name, architecture), url, state)
+
+
+def clear_state(url, path, name, architecture):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(state_path(url, path, name, architecture))
+
+
+async def put_chunk(session, upload_uri, buf, credentials=None):
+    """
+    Appends one chunk to a boot resource file being uploaded.
+    """
+    headers = {
+        "Content-Type": "application/octet-stream",
+        "Content-Length": str(len(buf)),
+    }
+    if credentials is not None:
+        maas_utils.sign(upload_uri, headers, credentials)
+
+    start = instrumentation.now()
+    async with session.put(upload_uri, data=buf, headers=headers) as response:
+        content = await response.read()
+        instrumentation.record_call(
+            "BootResourceFile.upload",
+            "PUT",
+            start,
+            len(buf),
+            len(content),
+            response.status,
+        )
+        if response.status != 200:
+            request = {"headers": headers, "method": "PUT", "uri": upload_uri}
+            raise CallError(request, response, content, None)
+
+
+async def put_file(
+    upload_uri,
+    path,
+    offset=0,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    credentials=None,
+    insecure=False,
+    progress=True,
+    on_chunk=None,
+):
+    """
+    Streams path from offset to upload_uri one chunk at a time, so only a
+    single chunk is held in memory however large the file is.
+
+    Args:
+        on_chunk (callable): Called with the new offset after every chunk the
+            server has confirmed.
+    """
+    size = os.path.getsize(path)
+    connector = aiohttp.TCPConnector(ssl=False if insecure else None)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        with open(path, "rb") as f, tqdm(
+            total=size,
+            initial=offset,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            desc="Uploading",
+            disable=not progress,
+        ) as bar:
+            f.seek(offset)
+            while offset < size:
+                buf = f.read(chunk_size)
+                await put_chunk(session, upload_uri, buf, credentials)
+                offset += len(buf)
+                bar.update(len(buf))
+                if on_chunk is not None:
+                    on_chunk(offset)
+    return offset
+
+
+def uploaded_bytes(rfile, state):
+    """
+    Returns how many bytes of a boot resource file the server already has.
+
+    MAAS reports the progress of an incomplete file as a fraction of its
+    size. The locally recorded offset is used when it doesn't.
+    """
+    progress = rfile._data.get("progress")
+    if progress is None:
+        return state.get("offset", 0)
+    return round(progress * rfile.size)
+
+
+async def upload_boot_resource(
+    client,
+    path,
+    name,
+    architecture,
+    title="",
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    resume=True,
+    progress=True,
+):
+    """
+    Uploads a boot resource in chunks and resumes an interrupted upload of
+    the same file from the last chunk the server confirmed.
+
+    MAAS needs the size and SHA256 of the file before the first chunk is
+    sent, so the file is hashed once up front. The hash is kept in the
+    resume state with the confirmed offset, so resuming doesn't read the
+    file again. Re-creating the resource with the same hash makes MAAS hand
+    back the partially uploaded file.
+
+    Returns:
+        BootResource: The uploaded boot resource.
+    """
+    origin = client._origin
+    handler = origin.BootResources._handler
+    url = handler.uri
+
+    state = load_state(url, path, name, architecture) if resume else None
+    if state is None:
+        size, sha256 = hash_file(path, chunk_size, progress)
+        stat = os.stat(path)
+        state = {
+            "size": size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+            "offset": 0,
+        }
+        save_state(url, path, name, architecture, state)
+
+    resource = origin.BootResource(
+        await handler.create(
+            name=name,
+            architecture=architecture,
+            title=title,
+            filetype=BootResourceFileType.TGZ.value,
+            size=str(state["size"]),
+            sha256=state["sha256"],
+        )
+    )
+    resource_set = resource.sets[max(resource.sets)]
+    rfile = list(resource_set.files.values())[0]
+
+    if not rfile.complete:
+        offset = uploaded_bytes(rfile, state)
+        upload_uri = (
+            urlparse(handler.uri)._replace(path=rfile._data["upload_uri"]).geturl()
+        )
+
+        def confirm(offset):
+            state["offset"] = offset
+            save_state(url, path, name, architecture, state)
+
+        await put_file(
+            upload_uri,
+            path,
+            offset,
+            chunk_size,
+            handler.session.credentials,
+            handler.session.insecure,
+            progress,
+            confirm,
+        )
+
+    clear_state(url, path, name, architecture)
+    return await origin.BootResource.read(resource.id)
@@ -1,38 +1,31 @@
-import base64
-import contextlib
-import json
-import os
 import random
-import socket
 import string
-import sys
-import time
+from http import HTTPStatus
 
 import click
-import paramiko
+from maas.client.bones import CallError
 
+from cli.libs import aio
+from cli.libs import catalog as query
+from cli.libs import cloud_init, inventory, probe
+from cli.libs.catalog import MachineCatalog
 from cli.libs.click_config import pass_config
+from cli.libs.errors import MachineNotFoundError
+from cli.libs.watcher import (
+    DEPLOY_END_STATES,
+    MachineStatusWatcher,
+    echo_transition,
+)
 
 
 @pass_config
-def _get_client(config):
-    return config.client
-
-
-class MachineNotFoundError(Exception):
-    """
-    Exception raised when a machine is not found.
-    """
-
-    pass
-
+def _get_config(config):
+    return config
 
-class MachineAvailabilityError(Exception):
-    """
-    Exception raised when a machine is not found.
-    """
 
-    pass
+@pass_config
+def _get_client(config):
+    return config.client
 
 
 def select_random_machines(n, machines):
@@ -54,32 +47,29 @@ def select_random_machines(n, machines):
     return random.sample(machines, n)
 
 
+def _as_catalog(machines):
+    if isinstance(machines, MachineCatalog):
+        return machines
+    return MachineCatalog(machines)
+
+
 def get_machines_by_tags(machines, tags):
     """
     Returns machines that match the tags provided.
-    """
-    # Create a set of tags to match against
-    tag_set = {tag.lower() for tag in tags}
 
-    # Find machines matching the tags
-    matching_machines = [
-        machine
-        for machine in machines
-        if {t.name.lower() for t in machine.tags}.intersection(tag_set)
-    ]
-
-    return matching_machines
+    machines can be a list or a MachineCatalog; pass a catalog when selecting
+    from the same listing more than once so it is only indexed once.
+    """
+    catalog = _as_catalog(machines)
+    return catalog.select(query.tag(*tags))
 
 
 def get_machines_by_owner(machines, name):
     """
     Returns machines that match the names provided in a case-insensitive fashion.
     """
-    matching_machines = [
-        machine
-        for machine in machines
-        if machine.owner and machine.owner.username.lower() == name.lower()
-    ]
+    catalog = _as_catalog(machines)
+    matching_machines = catalog.select(query.owner(name))
 
     # Check if all names were found
     if len(matching_machines) == 0:
@@ -92,18 +82,12 @@ def get_machines_by_pool_name(machines, names):
     """
     Returns machines that match the names provided in a case-insensitive fashion.
     """
-    # Create a set of lowercased names to match against
-    name_set = {name.lower() for name in names}
-
-    # Find machines matching the names
-    matching_machines = [
-        machine for machine in machines if machine.pool.name.lower() in name_set
-    ]
+    catalog = _as_catalog(machines)
+    matching_machines = catalog.select(query.pool(*names))
 
     # Check if all names were found
-    found_names = {machine.pool.name.lower() for machine in matching_machines}
-    if found_names != name_set:
-        missing_names = name_set - found_names
+    missing_names = {name.lower() for name in names} - catalog.keys("pool")
+    if missing_names:
         raise MachineNotFoundError(
             f"Could not find machines with names: {', '.join(missing_names)}"
         )
@@ -115,18 +99,12 @@ def get_machines_by_names(machines, names):
     """
     Returns machines that match the names provided in a case-insensitive fashion.
     """
-    # Create a set of lowercased names to match against
-    name_set = {name.lower() for name in names}
-
-    # Find machines matching the names
-    matching_machines = [
-        machine for machine in machines if machine.hostname.lower() in name_set
-    ]
+    catalog = _as_catalog(machines)
+    matching_machines = catalog.select(query.hostname(*names))
 
     # Check if all names were found
-    found_names = {machine.hostname.lower() for machine in matching_machines}
-    if found_names != name_set:
-        missing_names = name_set - found_names
+    missing_names = {name.lower() for name in names} - catalog.keys("hostname")
+    if missing_names:
         raise MachineNotFoundError(
             f"Could not find machines with names: {', '.join(missing_names)}"
         )
@@ -135,218 +113,428 @@ def get_machines_by_names(machines, names):
 
 
 def get_machine(system_id):
+    """
+    Returns the machine with the given system_id.
+
+    The machine is read directly instead of listing the whole fleet, so the
+    cost of a lookup does not grow with the number of machines in MAAS.
+    """
     client = _get_client()
-    machines = client.machines.list()
+    try:
+        return client.machines.get(system_id=system_id)
+    except CallError as e:
+        if e.status == HTTPStatus.NOT_FOUND:
+            raise ValueError(f"No machine found with system ID '{system_id}'")
+        raise
 
-    filtered_machines = list(
-        filter(lambda machine: machine.system_id == system_id, machines)
-    )
 
-    if len(filtered_machines) == 0:
-        raise ValueError(f"No machine found with system ID '{system_id}'")
-    elif len(filtered_machines) > 1:
-        raise ValueError(f"Multiple machines found with system ID '{system_id}'")
-    else:
-        machine = filtered_machines[0]
+def get_machines_by_system_ids(system_ids):
+    """
+    Returns the machines with the given system_ids using a single API call.
+
+    The listing is filtered by MAAS (``machines.list(id=[...])``) so only the
+    requested machines are transferred.
+
+    Args:
+        system_ids (list): The system IDs of the machines to read.
 
-    return machine
+    Returns:
+        list: The machines, in the order MAAS returned them.
+    """
+    system_ids = list(system_ids)
+    if not system_ids:
+        return []
 
+    origin = _get_client()._origin
+    data = origin.Machines._handler.read(id=system_ids)
+    machines = [origin.Machine(item) for item in data]
+
+    found_ids = {machine.system_id for machine in machines}
+    missing_ids = set(system_ids) - found_ids
+    if missing_ids:
+        raise MachineNotFoundError(
+            f"Could not find machines with system IDs: {', '.join(sorted(missing_ids))}"
+        )
 
-def to_base64(input_str):
-    input_bytes = input_str.encode("ascii")
-    encoded_bytes = base64.b64encode(input_bytes)
-    encoded_str = encoded_bytes.decode("ascii")
-    return encoded_str
+    return machines
 
 
 def get_rke_token():
     return "".join(random.choices(string.ascii_lowercase + string.digits, k=20))
 
 
-def get_server_cloud_init(token, ip_addresses, node_labels, node_taints):
-    primary_server_cloud_init = f"""
-#cloud-config
-write_files:
-  - path: /etc/rancher/rke2/config.yaml
-    owner: root:root
-    permissions: 0600
-    defer: true
-    content: |
-      bind-address: {ip_addresses[0]}
-      token: {token}
-      disable-cloud-controller: true
-      write-kubeconfig-mode: 644
-      node-label: {json.dumps(node_labels)}
-      node-taint: {json.dumps(node_taints)}
-      disable:
-        - "rke2-ingress-nginx"
-
-runcmd:
- - 'sudo bash -c "/opt/setup.sh server | tee /tmp/setup.log"'
-"""
-
-    secondary_server_cloud_init = f"""
-#cloud-config
-write_files:
-  - path: /etc/rancher/rke2/config.yaml
-    owner: root:root
-    permissions: 0600
-    defer: true
-    content: |
-      server: https://{ip_addresses[0]}:9345
-      token: {token}
-      disable-cloud-controller: true
-      write-kubeconfig-mode: 644
-      node-label: {json.dumps(node_labels)}
-      node-taint: {json.dumps(node_taints)}
-      disable:
-        - "rke2-ingress-nginx"
-
-runcmd:
- - 'sudo bash -c "/opt/setup.sh server | tee /tmp/setup.log"'
-"""
-    return primary_server_cloud_init, secondary_server_cloud_init
-
-
-def get_agent_cloud_init(token, ip_addresses, node_labels, node_taints):
-    agent_cloud_init = f"""
-#cloud-config
-write_files:
-  - path: /etc/rancher/rke2/config.yaml
-    owner: root:root
-    permissions: 0600
-    defer: true
-    content: |
-      server: https://{ip_addresses[0]}:9345
-      token: {token}
-      write-kubeconfig-mode: 644
-      node-label: {json.dumps(node_labels)}
-      node-taint: {json.dumps(node_taints)}
-
-runcmd:
- - 'sudo bash -c "/opt/setup.sh agent | tee /tmp/setup.log"'
-"""
-    return agent_cloud_init
-
-
-def wait_for_machine_status(machine, end_state):
-    status = machine.status_message
-    while status not in end_state:
-        time.sleep(5)
-        cur_machine = get_machine(machine.system_id)
-        if status != cur_machine.status_message:
-            click.echo(f"{status} {machine.hostname}...")
-        status = cur_machine.status_message
-
-    click.echo(f"{status} {machine.hostname}")
+def wait_for_machine_status(machine, end_state, timeout=None):
+    return wait_for_machines_status([machine], end_state, timeout)[0]
+
+
+def wait_for_machines_status(machines, end_state, timeout=None):
+    """
+    Waits until every machine has a status in end_state.
+
+    All machines are watched together and refreshed with a single API call
+    per tick, regardless of how many there are.
+
+    Returns:
+        list: The refreshed machines, in the order they were given.
+    """
+    watcher = MachineStatusWatcher(
+        get_machines_by_system_ids, **_get_config().status_poll_settings(timeout)
+    )
+    for machine in machines:
+        watcher.add(machine, end_state)
+        if watcher.is_done(machine.system_id):
+            click.echo(f"{machine.status_message} {machine.hostname}")
+
+    for transition in watcher.watch():
+        echo_transition(transition)
+
+    return [watcher.machines[machine.system_id] for machine in machines]
 
 
 def wait_for_port(host, port, timeout=60):
-    start_time = time.monotonic()
-    click.echo(f"Waiting for port {port} connection...")
-    while True:
-        with contextlib.suppress(OSError), socket.create_connection(
-            (host, port), timeout=1
-        ):
-            click.echo(f"Port {port} connection succeeded!")
-            return True
+    return aio.run(aio.wait_for_port(host, port, timeout))
 
-        if time.monotonic() - start_time >= timeout:
-            click.echo(f"Port {port} connection failed!")
-            return False
 
-        time.sleep(1)
+def wait_until_ready(endpoints):
+    """
+    Probes all endpoints concurrently until each one is ready or times out.
 
+    Returns:
+        list: A probe.ProbeResult for every endpoint.
+    """
+    return aio.run(probe.probe_all(endpoints))
 
-def allocate_machines(machines):
-    try:
-        client = _get_client()
-        for machine in machines:
-            client.machines.allocate(hostname=machine.hostname)
-    except Exception as e:
-        click.echo(f"Error allocating machine {machine.hostname}: {e}")
-        sys.exit(1)
 
+def allocate_from_pool(pool_name, count, tags=None, retries=3, dry_run=False):
+    """
+    Allocates count machines from a resource pool using the MAAS allocator.
+
+    The pool and tag constraints are evaluated by MAAS, which picks and
+    acquires a matching Ready machine atomically, so the fleet is never
+    downloaded and concurrent jobs cannot be handed the same machine. When
+    MAAS reports that no machine matches (HTTP 409) because another job just
+    took it, the request is retried with a jittered backoff; when the pool
+    has no matching Ready machine left it fails right away. If count
+    machines cannot be allocated, the machines allocated so far are released
+    again.
+
+    Args:
+        pool_name (str): The resource pool to allocate from.
+        count (int): Number of machines to allocate.
+        tags (list): Machines must have at least one of these tags.
+        retries (int): Retries per machine after a conflict.
+        dry_run (bool): Return count matching Ready machines without
+            acquiring them.
+
+    Returns:
+        list: The allocated machines.
+    """
+    client = _get_client()
+    return aio.run(
+        aio.allocate_from_pool(client, pool_name, count, tags, retries, dry_run)
+    )
+
+
+def deploy_machines(nodes, parallelism=1, timeout=None, journal=None):
+    """
+    Deploys machines with at most `parallelism` deployments in progress.
+
+    Args:
+        nodes (list): (machine, user_data) tuples, started in order, with the
+            user data encoded by cloud_init.Renderer.
+        parallelism (int): The maximum number of concurrent deployments.
+        timeout (float): Seconds after which a deployment is given up on.
+        journal (DeployJournal): Records the phase of every machine as its
+            deployment starts and ends.
+
+    Returns:
+        dict: The final status of each machine, keyed by hostname. Machines
+            whose deployment could not be started map to the error message.
+    """
+    client = _get_client()
+    poller = aio.StatusPoller(client, **_get_config().status_poll_settings(timeout))
+    on_result = None
+    if journal is not None:
+        journal.mark([machine.hostname for machine, _ in nodes], "deploying")
+        on_result = journal.record
+    return aio.run(aio.deploy_machines(client, nodes, parallelism, poller, on_result))
 
-def _get_node_labels(tags):
-    label_strings = []
-    for tag in tags:
-        tag_name = tag.name
-        if tag_name.startswith("LABEL_"):
-            _, label_name, label_value = tag_name.split("_", 2)
-            label_string = f"cnaps.io/{label_name}={label_value}"
-            label_strings.append(label_string)
-    return label_strings
 
+def release_machines(machines, parallelism=50, timeout=None):
+    """
+    Releases machines with at most `parallelism` releases in progress and
+    waits until all of them are released.
 
-def _get_node_taints(tags):
-    taint_strings = []
+    Returns:
+        dict: The final status, or error message, of each machine keyed by
+            hostname.
+    """
+    client = _get_client()
+    poller = aio.StatusPoller(client, **_get_config().status_poll_settings(timeout))
+    click.echo(f"Releasing {len(machines)} machines...")
+    return aio.run(aio.release_machines(client, machines, parallelism, poller))
 
-    for tag in tags:
-        tag_name = tag.name
-        if tag_name.startswith("TAINT_"):
-            _, taint_name, taint_value, taint_effect = tag_name.split("_", 3)
-            taint_string = f"cnaps.io/{taint_name}={taint_value}:{taint_effect}"
-            taint_strings.append(taint_string)
 
-    return taint_strings
+def echo_release_results(results):
+    """
+    Prints a table with the outcome of releasing each machine.
+    """
+    width = max([len("HOSTNAME")] + [len(hostname) for hostname in results])
+    click.echo(f"{'HOSTNAME':<{width}}  RESULT  REASON")
+    for hostname, status in sorted(results.items()):
+        if status in ["Ready", "Released"]:
+            click.echo(f"{hostname:<{width}}  ok")
+        else:
+            click.echo(f"{hostname:<{width}}  failed  {status}")
 
+    failed = [
+        status for status in results.values() if status not in ["Ready", "Released"]
+    ]
+    click.echo(
+        f"Released {len(results) - len(failed)} of {len(results)} machines, {len(failed)} failed"
+    )
 
-def deploy_servers(machines, token, ip_addresses):
-    if len(machines) < 1:
-        return
+
+def _wait_for_primary(primary, journal=None):
+    click.echo("Waiting for SSH and the Kubernetes API on the primary server...")
+    probes = wait_until_ready(
+        [
+            probe.Endpoint(primary.ip_addresses[0], 22, "ssh", 120),
+            probe.Endpoint(primary.ip_addresses[0], 6443, "tcp", 300),
+        ]
+    )
+    if journal is not None and all(result.ready for result in probes):
+        journal.mark([primary.hostname], "ready")
+
+
+def deploy_servers(nodes, timeout=None, journal=None):
+    """
+    Deploys the primary server and waits until its API is reachable.
+
+    Args:
+        nodes (list): The rendered (machine, user_data) tuples of the
+            servers, the primary first.
+        journal (DeployJournal): Records the progress of the primary.
+
+    Returns:
+        dict: The final status of the primary, keyed by hostname.
+    """
+    if len(nodes) < 1:
+        return {}
 
     click.echo("Deploying Servers:")
-    for primary in machines[:1]:
-        primary_labels = _get_node_labels(primary.tags)
-        primary_taints = _get_node_taints(primary.tags)
-        primary_cloud_init, _ = get_server_cloud_init(
-            token, ip_addresses, primary_labels, primary_taints
-        )
-        set_interface_names(primary)
-        primary.deploy(
-            user_data=to_base64(primary_cloud_init),
-            distro_series="rke2-ubuntu-2204",
-            hwe_kernel="generic",
-        )
-        wait_for_machine_status(primary, ["Deployed", "Failed deployment"])
-        wait_for_port(primary.ip_addresses[0], 22, 120)
-        wait_for_port(primary.ip_addresses[0], 6443, 300)
-
-    for secondary in machines[1:]:
-        secondary_labels = _get_node_labels(secondary.tags)
-        secondary_taints = _get_node_taints(secondary.tags)
-        _, secondary_cloud_init = get_server_cloud_init(
-            token, ip_addresses, secondary_labels, secondary_taints
-        )
-        set_interface_names(secondary)
-        secondary.deploy(
-            user_data=to_base64(secondary_cloud_init),
-            distro_series="rke2-ubuntu-2204",
-            hwe_kernel="generic",
+    primary = nodes[0][0]
+    results = deploy_machines(nodes[:1], timeout=timeout, journal=journal)
+    if results[primary.hostname] == "Deployed":
+        _wait_for_primary(primary, journal)
+    return results
+
+
+def _resume_nodes(nodes, journal, parallelism=1, timeout=None):
+    """
+    Picks up the nodes of an interrupted deployment where MAAS left them.
+
+    Deployments that are still in progress are waited on, and failed ones
+    are released so they can be deployed again.
+
+    Returns:
+        tuple: The (machine, user_data) tuples of the nodes that still have
+            to be deployed, and the final status of every other node keyed by
+            hostname.
+    """
+    statuses = {machine.hostname: machine.status_name for machine, _ in nodes}
+    deploying = [machine for machine, _ in nodes if machine.status_name == "Deploying"]
+    if deploying:
+        click.echo(f"Waiting for {len(deploying)} machines that are still deploying...")
+        for machine in wait_for_machines_status(deploying, DEPLOY_END_STATES, timeout):
+            statuses[machine.hostname] = machine.status_name
+
+    failed = [
+        machine
+        for machine, _ in nodes
+        if statuses[machine.hostname] == "Failed deployment"
+    ]
+    if failed:
+        statuses.update(release_machines(failed, parallelism, timeout))
+
+    remaining = []
+    results = {}
+    for machine, user_data in nodes:
+        status = statuses[machine.hostname]
+        if status in ["Ready", "Released", "Allocated"]:
+            remaining.append((machine, user_data))
+            continue
+        results[machine.hostname] = status
+        if journal.phase(machine.hostname) != "ready":
+            journal.record(machine.hostname, status)
+
+    if results:
+        click.echo(
+            f"Resuming: {sum(1 for status in results.values() if status == 'Deployed')} "
+            f"of {len(nodes)} nodes are already deployed"
         )
-        wait_for_machine_status(secondary, ["Deployed", "Failed deployment"])
+    return remaining, results
+
+
+def deploy_cluster(
+    servers,
+    agents,
+    token,
+    ip_addresses,
+    parallelism=1,
+    timeout=None,
+    compress=False,
+    journal=None,
+):
+    """
+    Deploys the primary server, then the secondary servers and agents.
 
+    The user data of every node is rendered and validated before the first
+    deployment starts. The primary has to be running before the other nodes
+    can join it, so it is always deployed on its own. Secondary servers and
+    agents are then deployed together with at most `parallelism` deployments
+    in progress.
 
-def deploy_agents(machines, token, ip_addresses):
-    if len(machines) < 1:
-        return
+    With a journal the phase of every node is recorded as the deployment
+    progresses, and nodes that an earlier run already deployed are skipped.
 
-    click.echo("Deploying Agents...")
-    # print(agent_cloud_init)
-    for machine in machines:
-        agent_labels = _get_node_labels(machine.tags)
-        agent_taints = _get_node_taints(machine.tags)
-        agent_cloud_init = get_agent_cloud_init(
-            token, ip_addresses, agent_labels, agent_taints
+    Args:
+        compress (bool): Whether to gzip the cloud-init user data.
+        journal (DeployJournal): The journal of this deployment.
+
+    Returns:
+        dict: The final status of every node, keyed by hostname.
+
+    Raises:
+        CloudInitError: If the user data of a node is not valid.
+    """
+    renderer = cloud_init.Renderer(token, ip_addresses, compress)
+    nodes = renderer.render_nodes(servers, agents)
+
+    results = {}
+    if journal is not None:
+        nodes, results = _resume_nodes(nodes, journal, parallelism, timeout)
+
+    if servers:
+        primary = servers[0]
+        if nodes and nodes[0][0] is primary:
+            results.update(deploy_servers(nodes[:1], timeout, journal))
+            nodes = nodes[1:]
+        elif results[primary.hostname] == "Deployed" and (
+            journal.phase(primary.hostname) != "ready"
+        ):
+            _wait_for_primary(primary, journal)
+
+        if results[primary.hostname] != "Deployed":
+            click.echo("Primary server failed to deploy, skipping remaining nodes")
+            return results
+
+    if nodes:
+        click.echo("Deploying Secondary Servers and Agents:")
+        results.update(deploy_machines(nodes, parallelism, timeout, journal))
+    return results
+
+
+def tag_machines(tag_name, machines, comment=""):
+    """
+    Adds a tag to machines with one API call, creating the tag if MAAS
+    doesn't have it yet.
+    """
+    origin = _get_client()._origin
+    try:
+        origin.Tag._handler.read(name=tag_name)
+    except CallError as e:
+        if e.status != HTTPStatus.NOT_FOUND:
+            raise
+        origin.Tags._handler.create(name=tag_name, comment=comment)
+    origin.Tag._handler.update_nodes(
+        name=tag_name, add=[machine.system_id for machine in machines]
+    )
+
+
+def apply_cluster_plan(cluster_plan, parallelism=10, timeout=None):
+    """
+    Brings the machines of a cluster plan to the desired state.
+
+    Machines that are already deployed are left alone, and every other one
+    is tagged with the tag of the cluster first, so later plans recognize
+    it. Failed deployments are released first. The primary server is
+    deployed on its own if it isn't running yet, then every other node is
+    deployed with at most `parallelism` deployments in progress, since none
+    of them depends on another.
+
+    Returns:
+        dict: The final status of every node that was changed, keyed by
+            hostname.
+    """
+    pending = [node for node in cluster_plan.nodes if node.action != "keep"]
+    if not pending:
+        return {}
+    machines = {
+        machine.system_id: machine
+        for machine in get_machines_by_system_ids(
+            node.machine.system_id for node in pending
         )
-        set_interface_names(machine)
-        machine.deploy(
-            user_data=to_base64(agent_cloud_init),
-            distro_series="rke2-ubuntu-2204",
-            hwe_kernel="generic",
+    }
+
+    tag_machines(cluster_plan.tag, machines.values(), "Machines of an mctl cluster")
+
+    results = {}
+    redeploy = [
+        machines[node.machine.system_id]
+        for node in pending
+        if node.action == "redeploy"
+    ]
+    if redeploy:
+        released = release_machines(redeploy, parallelism, timeout)
+        results.update(
+            (hostname, status)
+            for hostname, status in released.items()
+            if status not in ["Ready", "Released"]
         )
-        wait_for_machine_status(machine, ["Deployed", "Failed deployment"])
+        pending = [node for node in pending if node.machine.hostname not in results]
+
+    primary = cluster_plan.primary
+    if primary is not None and primary.action != "keep":
+        if primary in pending:
+            results.update(
+                deploy_servers(
+                    [(machines[primary.machine.system_id], primary.user_data)],
+                    timeout,
+                )
+            )
+        if results[primary.machine.hostname] != "Deployed":
+            click.echo("Primary server failed to deploy, skipping remaining nodes")
+            return results
+        pending = [node for node in pending if node is not primary]
+
+    if pending:
+        click.echo("Deploying Secondary Servers and Agents:")
+        results.update(
+            deploy_machines(
+                [
+                    (machines[node.machine.system_id], node.user_data)
+                    for node in pending
+                ],
+                parallelism,
+                timeout,
+            )
+        )
+    return results
+
+
+def echo_deploy_summary(results):
+    """
+    Prints how many nodes deployed successfully and why the others failed.
+    """
+    failed = {
+        hostname: status for hostname, status in results.items() if status != "Deployed"
+    }
+    click.echo(
+        f"Deployment summary: {len(results) - len(failed)} succeeded, {len(failed)} failed"
+    )
+    for hostname, status in failed.items():
+        click.echo(f"  {hostname}: {status}")
 
 
 def get_machines_ip_addresses(machines):
@@ -360,6 +548,20 @@ def get_machines_ip_addresses(machines):
     return ips
 
 
+def get_ip_addresses(machines, all_ips=False):
+    """
+    Returns the IP address of each machine keyed by hostname, or a list of
+    all its addresses with all_ips. Machines without an address map to None
+    or an empty list.
+    """
+    if all_ips:
+        return {machine.hostname: list(machine.ip_addresses) for machine in machines}
+    return {
+        machine.hostname: machine.ip_addresses[0] if machine.ip_addresses else None
+        for machine in machines
+    }
+
+
 def get_ip_address(machine_name):
     """
     Gets the IP address of the machine specified by the machine-name
@@ -368,8 +570,7 @@ def get_ip_address(machine_name):
         machine-name: The name of the machine to retrieve the ip address
     """
     try:
-        client = _get_client()
-        machines = client.machines.list()
+        machines = inventory.list_machines_by_names(_get_config(), [machine_name])
         machine = get_machines_by_names(machines, [machine_name])[0]
 
         if machine.ip_addresses:
@@ -383,42 +584,13 @@ def get_ip_address(machine_name):
 
 
 def get_kubeconfig(server, server_kubeconfig_file, local_kubeconfig_file, ssh_key=None):
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    # click.echo(os.environ.get("SSH_AUTH_SOCK"))
-
-    if ssh_key is None:
-        key = None
-    elif os.path.isfile(ssh_key):
-        key = paramiko.RSAKey.from_private_key_file(ssh_key)
-    elif ssh_key.startswith("-----BEGIN"):
-        key = paramiko.RSAKey.from_private_key(ssh_key)
-    svr = f"{server}"
-
-    ssh.connect(
-        hostname=f"{svr}",
-        username="ubuntu",
-        allow_agent=True,
-        look_for_keys=True,
-        pkey=key,
-    )
-
-    sftp = ssh.open_sftp()
-    sftp.get(server_kubeconfig_file, local_kubeconfig_file)
-    sftp.close()
+    # paramiko is only imported by the commands that use SSH
+    from cli.libs import remote
 
-    ssh.close()
+    with remote.SSHPool(ssh_key=ssh_key) as pool:
+        pool.get(server, server_kubeconfig_file, local_kubeconfig_file)
 
 
 def set_interface_names(machine):
-    for interface in machine.interfaces:
-        if "capture" in interface.tags:
-            # Get a copy of the tags because changing the name of the interface resets the tags
-            interface_tags = interface.tags[:]
-            interface.name = "capture0"
-            interface.save()
-
-            #  put the tags back
-            interface.tags = interface_tags
-            interface.save()
+    _get_client()  # connect before the event loop runs
+    aio.run(aio.set_interface_names(machine))
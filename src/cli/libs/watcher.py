@@ -0,0 +1,193 @@
+import time
+from collections import namedtuple
+
+import click
+
+from cli.libs import instrumentation
+from cli.libs.polling import FixedInterval
+
+DEPLOY_END_STATES = ["Deployed", "Failed deployment"]
+RELEASE_END_STATES = ["Ready", "Released", "Releasing failed"]
+
+# A status change of a watched machine. `done` is True when `status` is one
+# of the end states the machine is being watched for, or it timed out.
+Transition = namedtuple("Transition", ["machine", "previous", "status", "done"])
+
+
+class MachineStatusWatcher:
+    """
+    Watches the status of a set of machines until each reaches an end state.
+
+    All machines still in progress are refreshed with one batched query per
+    tick, so watching many machines costs about the same as watching one.
+
+    Args:
+        fetch (callable): Takes a list of system IDs and returns the current
+            machines for them, e.g. ``utils.get_machines_by_system_ids``. Use a
+            coroutine function together with poll_async.
+        interval (int): Seconds to wait between refreshes when no strategy
+            is given.
+        strategy: A polling strategy from cli.libs.polling.
+        budget (RequestBudget): Limits the rate of refreshes, optional.
+        timeout (float): Seconds after which a machine is given up on.
+        clock (callable): Returns the current time in seconds.
+        sleep (callable): Sleeps for the given number of seconds.
+    """
+
+    def __init__(
+        self,
+        fetch,
+        interval=5,
+        strategy=None,
+        budget=None,
+        timeout=None,
+        clock=time.monotonic,
+        sleep=instrumentation.sleep_sync,
+    ):
+        self.fetch = fetch
+        self.strategy = strategy or FixedInterval(interval)
+        self.budget = budget
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.machines = {}
+        self._end_states = {}
+        self._statuses = {}
+        self._deadlines = {}
+        self._expired = set()
+        self._attempt = 0
+
+    def add(self, machine, end_states):
+        """
+        Starts watching a machine until its status is one of end_states.
+        """
+        self.machines[machine.system_id] = machine
+        self._end_states[machine.system_id] = set(end_states)
+        self._statuses[machine.system_id] = machine.status_message
+        self._expired.discard(machine.system_id)
+        if self.timeout is not None:
+            self._deadlines[machine.system_id] = self.clock() + self.timeout
+        self._attempt = 0
+
+    def status(self, system_id):
+        return self._statuses[system_id]
+
+    def is_done(self, system_id):
+        return (
+            system_id in self._expired
+            or self._statuses[system_id] in self._end_states[system_id]
+        )
+
+    @property
+    def pending(self):
+        """
+        The system IDs of the machines that have not reached an end state.
+        """
+        return [system_id for system_id in self.machines if not self.is_done(system_id)]
+
+    def next_delay(self):
+        """
+        Returns how long to wait before the next refresh, according to the
+        polling strategy and capped at the nearest deadline.
+        """
+        pending = self.pending
+        delay = self.strategy.delay(
+            self._attempt, [self._statuses[system_id] for system_id in pending]
+        )
+        deadlines = [self._deadlines[s] for s in pending if s in self._deadlines]
+        if deadlines:
+            delay = min(delay, max(0, min(deadlines) - self.clock()))
+        return delay
+
+    def throttle_delay(self):
+        """
+        Returns how long to wait so the next refresh stays within the
+        request budget.
+        """
+        return self.budget.reserve() if self.budget else 0
+
+    def expire(self):
+        """
+        Gives up on pending machines that have passed their deadline.
+
+        Returns:
+            list: A Transition for every machine that timed out.
+        """
+        now = self.clock()
+        transitions = []
+        for system_id in self.pending:
+            deadline = self._deadlines.get(system_id)
+            if deadline is not None and now >= deadline:
+                previous = self._statuses[system_id]
+                self._statuses[system_id] = f"Timed out while {previous}"
+                self._expired.add(system_id)
+                transitions.append(
+                    Transition(
+                        self.machines[system_id],
+                        previous,
+                        self._statuses[system_id],
+                        True,
+                    )
+                )
+        return transitions
+
+    def poll(self):
+        """
+        Refreshes every pending machine with one API call.
+
+        Returns:
+            list: A Transition for every machine whose status changed.
+        """
+        pending = self.pending
+        if not pending:
+            return []
+        return self._update(self.fetch(pending))
+
+    async def poll_async(self):
+        """
+        Like poll, for use on an event loop with a fetch coroutine function.
+        """
+        pending = self.pending
+        if not pending:
+            return []
+        return self._update(await self.fetch(pending))
+
+    def _update(self, machines):
+        transitions = []
+        for machine in machines:
+            previous = self._statuses[machine.system_id]
+            self.machines[machine.system_id] = machine
+            self._statuses[machine.system_id] = machine.status_message
+            if machine.status_message != previous:
+                transitions.append(
+                    Transition(
+                        machine,
+                        previous,
+                        machine.status_message,
+                        self.is_done(machine.system_id),
+                    )
+                )
+
+        # backoff strategies start over whenever something changes
+        self._attempt = 0 if transitions else self._attempt + 1
+        return transitions + self.expire()
+
+    def watch(self):
+        """
+        Yields transitions as they happen and returns once every watched
+        machine has reached an end state or timed out.
+        """
+        while self.pending:
+            self.sleep(self.next_delay())
+            self.sleep(self.throttle_delay())
+            yield from self.poll()
+
+
+def echo_transition(transition):
+    """
+    Prints a transition in the format used by the deploy and release commands.
+    """
+    if transition.done:
+        click.echo(f"{transition.status} {transition.machine.hostname}")
+    else:
+        click.echo(f"{transition.status} {transition.machine.hostname}...")
@@ -1,19 +1,31 @@
-import os
-
 import click
-import toml
 from dotenv import load_dotenv
-from maas.client import connect
 
-from cli.cmds.group_one import group_one
-from cli.cmds.group_two import group_two
 from cli.libs.click_config import pass_config
+from cli.libs.lazy_group import LazyGroup
 
 load_dotenv()
 
 
-# this is the top level command group for the cli
-@click.group()  # type: ignore
+# this is the top level command group for the cli, its command groups are
+# only imported when they are run
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "machines": (
+            "cli.cmds.group_one:group_one",
+            "Actions for interacting with MAAS machines",
+        ),
+        "images": (
+            "cli.cmds.group_two:group_two",
+            "Actions for managing MAAS operating system images",
+        ),
+        "serve": (
+            "cli.cmds.serve:serve",
+            "Runs a local daemon that answers machine listings",
+        ),
+    },
+)  # type: ignore
 @click.option(
     "--verbose",
     "-v",
@@ -25,42 +37,102 @@ load_dotenv()
     default="~/.maas/credentials",
     help="Location of the MAAS credential file.",
 )
+@click.option(
+    "--cache-api-description",
+    is_flag=True,
+    envvar="MCTL_CACHE_API_DESCRIPTION",
+    help="Cache the MAAS API description on disk to speed up startup.",
+)
+@click.option(
+    "--cache-ttl",
+    type=click.IntRange(min=0),
+    default=0,
+    envvar="MCTL_CACHE_TTL",
+    help="Serve machine listings from a local cache for this many seconds (0 disables the cache).",
+)
+@click.option("--no-cache", is_flag=True, help="Don't read or write the machine cache.")
+@click.option(
+    "--refresh", is_flag=True, help="Refresh the machine cache before using it."
+)
+@click.option(
+    "--poll-strategy",
+    type=click.Choice(["fixed", "backoff", "adaptive"]),
+    default="adaptive",
+    envvar="MCTL_POLL_STRATEGY",
+    help="How often machine status is polled: every 5s, with exponential backoff, or based on the current status.",
+)
+@click.option(
+    "--api-rate",
+    type=click.FloatRange(min=0),
+    default=0,
+    envvar="MCTL_API_RATE",
+    help="Maximum status requests per second across all watched machines (0 is unlimited).",
+)
+@click.option(
+    "--profile-api",
+    type=click.Choice(["table", "json", "chrome"]),
+    default=None,
+    envvar="MCTL_PROFILE_API",
+    help="Report the MAAS API calls and wait time of the command as a table, JSON or a Chrome trace.",
+)
+@click.option(
+    "--profile-api-file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the API profile to this file instead of stderr.",
+)
 @pass_config
-def cli(config, verbose, profile):
+def cli(
+    config,
+    verbose,
+    profile,
+    cache_api_description,
+    cache_ttl,
+    no_cache,
+    refresh,
+    poll_strategy,
+    api_rate,
+    profile_api,
+    profile_api_file,
+):
+    # python-libmaas and aiohttp are only imported once a command connects,
+    # not for --help
+    from cli.libs import transport
+
     if verbose:
         config.verbose = verbose
         click.echo("Verbose mode...")
 
-    maas_url = os.environ.get("MAAS_SERVER")
-    maas_api_key = os.environ.get("MAAS_API_KEY")
+    # MAAS requests share a pool of keep-alive connections, which stays open
+    # between commands run by `mctl serve`
+    if transport.install():
+        click.get_current_context().call_on_close(transport.uninstall)
 
-    if not all([maas_url, maas_api_key]) and not os.path.exists(
-        os.path.expanduser(profile)
-    ):
-        raise Exception(
-            "MAAS_SERVER and MAAS_API_KEY environment variables are not set and maas credential file does not exist."
-        )
+    # verbose mode prints the API profile table unless another format is chosen
+    if profile_api or verbose:
+        from cli.libs import instrumentation
 
-    if all([maas_url, maas_api_key]):
-        config.maas_url = maas_url
-        config.maas_api_key = maas_api_key
-    elif os.path.exists(os.path.expanduser(profile)):
-        profile = os.path.expanduser(profile)
-        try:
-            with open(profile) as f:
-                credentials = toml.load(f)
-                config.maas_url = credentials["maas"]["url"]
-                config.maas_api_key = credentials["maas"]["api_key"]
-        except (FileNotFoundError, KeyError) as err:
-            click.echo(err)
+        # the profiler wraps the dispatch of the transport, so that starts first
+        transport.start()
+        profiler = instrumentation.Profiler()
+        profiler.start()
 
-    config.client = connect(url=config.maas_url, apikey=config.maas_api_key)
-    if config.client is None:
-        click.echo("Could not load credentials from file")
+        def report():
+            profiler.stop()
+            instrumentation.write_report(
+                profiler, profile_api or "table", profile_api_file
+            )
 
+        click.get_current_context().call_on_close(report)
 
-cli.add_command(group_one)
-cli.add_command(group_two)
+    # the MAAS client is only connected when a command first uses it
+    config.profile = profile
+    config.cache_api_description = cache_api_description
+    config.cache_ttl = cache_ttl
+    config.no_cache = no_cache
+    config.refresh = refresh
+    config.poll_strategy = poll_strategy
+    config.api_rate = api_rate
 
 
 if __name__ == "__main__":
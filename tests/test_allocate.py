@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from maas.client.bones import CallError
+
+from cli.libs import aio
+from cli.libs.errors import MachineAvailabilityError
+
+
+def conflict():
+    return CallError(
+        {"method": "POST", "uri": "/MAAS/api/2.0/machines/?op=allocate"},
+        SimpleNamespace(status=409, reason="Conflict"),
+        b"No machine matches the constraints",
+        None,
+    )
+
+
+class FakeMachines:
+    """
+    The machines handler of a pool of machines. The first `contended`
+    allocations fail as if another job had acquired the machine first.
+    """
+
+    def __init__(self, machines, contended=0):
+        self.machines = machines
+        self.contended = contended
+        self.allocations = 0
+        self.reads = 0
+
+    async def allocate(self, pool, tags=()):
+        self.allocations += 1
+        if self.contended:
+            self.contended -= 1
+            raise conflict()
+        for data in self.machines:
+            if (
+                data["status_name"] == "Ready"
+                and data["pool"]["name"] == pool
+                and set(tags) <= set(data["tag_names"])
+            ):
+                data["status_name"] = "Allocated"
+                return data
+        raise conflict()
+
+    async def read(self, pool):
+        self.reads += 1
+        return [dict(data) for data in self.machines if data["pool"]["name"] == pool]
+
+
+class FakeMachine:
+    def __init__(self, data):
+        self.data = data
+        self.system_id = data["system_id"]
+
+    async def release(self, comment=None):
+        self.data["status_name"] = "Ready"
+
+
+def fake_client(handler):
+    return SimpleNamespace(
+        _origin=SimpleNamespace(
+            Machines=SimpleNamespace(_handler=handler), Machine=FakeMachine
+        )
+    )
+
+
+def fleet(count, pool="dev", tags=("T1",)):
+    return [
+        {
+            "system_id": f"m{i}",
+            "status_name": "Ready",
+            "pool": {"name": pool},
+            "tag_names": list(tags),
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+
+    async def sleep(seconds, label):
+        slept.append(seconds)
+
+    monkeypatch.setattr(aio.instrumentation, "sleep", sleep)
+    return slept
+
+
+def test_allocates_count_machines(sleeps):
+    handler = FakeMachines(fleet(3))
+    machines = asyncio.run(aio.allocate_from_pool(fake_client(handler), "dev", 2))
+    assert len({machine.system_id for machine in machines}) == 2
+    assert sleeps == []
+
+
+def test_short_pool_fails_without_retrying_and_rolls_back(sleeps):
+    handler = FakeMachines(fleet(2))
+    with pytest.raises(MachineAvailabilityError):
+        asyncio.run(aio.allocate_from_pool(fake_client(handler), "dev", 3))
+    assert sleeps == []
+    assert all(data["status_name"] == "Ready" for data in handler.machines)
+
+
+def test_contention_is_retried_while_machines_are_ready(sleeps):
+    handler = FakeMachines(fleet(1), contended=1)
+    (machine,) = asyncio.run(aio.allocate_from_pool(fake_client(handler), "dev", 1))
+    assert machine.system_id == "m0"
+    assert len(sleeps) == 1
+
+
+def test_dry_run_returns_distinct_machines_without_acquiring(sleeps):
+    handler = FakeMachines(fleet(3))
+    machines = asyncio.run(
+        aio.allocate_from_pool(fake_client(handler), "dev", 3, ["t1"], dry_run=True)
+    )
+    assert sorted(machine.system_id for machine in machines) == ["m0", "m1", "m2"]
+    assert handler.allocations == 0
+    assert all(data["status_name"] == "Ready" for data in handler.machines)
+
+
+def test_dry_run_fails_when_the_pool_is_short(sleeps):
+    handler = FakeMachines(fleet(2, tags=("T2",)))
+    with pytest.raises(MachineAvailabilityError):
+        asyncio.run(
+            aio.allocate_from_pool(fake_client(handler), "dev", 1, ["T1"], dry_run=True)
+        )
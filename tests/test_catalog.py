@@ -0,0 +1,14 @@
+from cli.libs import catalog as query
+from cli.libs.catalog import MachineCatalog
+from cli.libs.inventory import MachineRecord
+
+
+def test_status_query_skips_machines_without_a_status():
+    machines = [
+        MachineRecord.from_api({"hostname": "a", "system_id": "1"}),
+        MachineRecord.from_api(
+            {"hostname": "b", "system_id": "2", "status_name": "Ready"}
+        ),
+    ]
+    selected = MachineCatalog(machines).select(query.status("ready"))
+    assert [machine.hostname for machine in selected] == ["b"]
@@ -0,0 +1,62 @@
+import pytest
+
+from cli.libs import cluster
+from cli.libs.errors import SpecError
+from cli.libs.inventory import MachineRecord
+
+SPEC = {
+    "token": "secret",
+    "name": "demo",
+    "roles": [{"name": "cp", "kind": "server", "count": 1, "pool": "dev"}],
+}
+
+
+def record(hostname, status="Ready", owner=None, tags=()):
+    return MachineRecord(
+        hostname=hostname,
+        system_id=f"id-{hostname}",
+        status_name=status,
+        status_message=status,
+        pool_name="dev",
+        owner_name=owner,
+        tag_names=list(tags),
+        ip_addresses=["10.0.0.1"],
+    )
+
+
+def test_member_tag_uses_the_name_or_the_token():
+    assert cluster.member_tag(cluster.parse_spec(SPEC)) == "mctl-cluster-demo"
+    unnamed = cluster.parse_spec({**SPEC, "name": None})
+    other = cluster.parse_spec({**SPEC, "name": None, "token": "other"})
+    assert cluster.member_tag(unnamed).startswith("mctl-cluster-")
+    assert cluster.member_tag(unnamed) != cluster.member_tag(other)
+
+
+def test_spec_names_must_be_valid_tag_names():
+    with pytest.raises(SpecError):
+        cluster.parse_spec({**SPEC, "name": "my cluster"})
+
+
+def test_owned_machines_of_other_deployments_are_not_members():
+    spec = cluster.parse_spec(SPEC)
+    machines = [
+        record("a", "Deployed", "admin"),
+        record("b", "Failed deployment", "admin", ["mctl-cluster-other"]),
+        record("c"),
+    ]
+    result = cluster.plan(spec, machines, "admin")
+    assert [(n.machine.hostname, n.action) for n in result.nodes] == [("c", "deploy")]
+    assert result.tag == "mctl-cluster-demo"
+
+
+def test_tagged_machines_of_the_user_are_kept():
+    spec = cluster.parse_spec(SPEC)
+    machines = [record("a", "Deployed", "admin", ["MCTL-CLUSTER-DEMO"]), record("b")]
+    result = cluster.plan(spec, machines, "admin")
+    assert [(n.machine.hostname, n.action) for n in result.nodes] == [("a", "keep")]
+
+
+def test_tagged_machines_of_other_users_are_not_members():
+    spec = cluster.parse_spec(SPEC)
+    machines = [record("a", "Deployed", "someone", ["mctl-cluster-demo"])]
+    assert cluster.plan(spec, machines, "admin").missing == {"cp": 1}
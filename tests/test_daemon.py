@@ -0,0 +1,91 @@
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from cli.libs import daemon, daemon_client
+from cli.libs.click_config import Config
+
+URL = "http://maas.example/MAAS/"
+
+
+class FakeMachines:
+    def __init__(self):
+        self.reads = 0
+        self.status = "Ready"
+
+    def read(self, **params):
+        self.reads += 1
+        return [{"hostname": "node1", "system_id": "abc", "status_name": self.status}]
+
+
+@pytest.fixture
+def served(monkeypatch):
+    """
+    A daemon serving URL from an inventory of one machine, in a thread.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mctl.sock")
+        monkeypatch.setenv("MCTL_SOCKET", path)
+        machines = FakeMachines()
+        config = Config()
+        config.maas_url = URL
+        config.cache_ttl = 60
+        config.client = SimpleNamespace(
+            _origin=SimpleNamespace(Machines=SimpleNamespace(_handler=machines))
+        )
+        with daemon.Daemon(path, config, refresh_interval=3600) as server:
+            server.refresh()
+            thread = threading.Thread(
+                target=server.serve_forever, kwargs={"poll_interval": 0.05}
+            )
+            thread.start()
+            try:
+                yield server, machines
+            finally:
+                server.shutdown()
+                thread.join()
+
+
+def test_invalidate_makes_the_daemon_refresh(served):
+    server, machines = served
+    assert machines.reads == 1
+
+    daemon_client.invalidate(URL)
+    daemon_client.invalidate("http://other.example/MAAS/")
+
+    reply = daemon_client.request(
+        {"argv": ["machines", "ls"], "cwd": os.getcwd(), "maas_server": URL}
+    )
+    assert "node1" in reply["stdout"]
+    assert machines.reads == 2
+
+
+def test_requests_for_another_server_are_refused(served):
+    reply = daemon_client.request(
+        {"argv": ["machines", "ls"], "cwd": os.getcwd(), "maas_server": None}
+    )
+    assert "error" in reply
+
+
+def test_command_options_dont_leak_into_the_daemon(served):
+    server, machines = served
+    reply = server.run(
+        {"argv": ["machines", "ls", "--help"], "cwd": os.getcwd(), "maas_server": URL}
+    )
+    assert reply["exit_code"] == 0
+    # the command's --cache-ttl default of 0 doesn't replace the daemon's
+    assert server.config.cache_ttl == 60
+
+
+def test_summary_reflects_changes_after_invalidation(served):
+    server, machines = served
+    summary = {"argv": ["machines", "summary"], "cwd": os.getcwd(), "maas_server": URL}
+    assert "1 available" in daemon_client.request(summary)["stdout"]
+
+    machines.status = "Allocated"
+    daemon_client.invalidate(URL)
+
+    assert "0 available" in daemon_client.request(summary)["stdout"]
@@ -0,0 +1,92 @@
+import os
+
+from click.testing import CliRunner
+
+from cli.libs import inventory, remote
+from cli.main import cli
+
+
+class FakePool:
+    """
+    An SSHPool that writes the address it was asked for into every file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.addresses = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def get(self, host, remote_path, local_path):
+        self.addresses.append(host)
+        with open(local_path, "w") as f:
+            f.write(host)
+        return len(host)
+
+
+def test_fetch_rejects_remote_files_with_the_same_name():
+    result = CliRunner().invoke(
+        cli,
+        [
+            "machines",
+            "fetch",
+            "/etc/rancher/rke2/config.yaml",
+            "/var/lib/x/config.yaml",
+            "--machine-names",
+            "node1",
+        ],
+    )
+    assert result.exit_code == 2
+    assert "config.yaml would overwrite each other" in result.output
+
+
+def test_echo_fetch_results_reports_failures(capsys):
+    remote.echo_fetch_results(
+        [
+            remote.FetchResult("node1", "/tmp/a", "out/node1/a", 12, None),
+            remote.FetchResult("node2", "/tmp/a", None, None, "no IP address"),
+        ]
+    )
+    output = capsys.readouterr().out
+    assert "out/node1/a" in output
+    assert "node2" in output and "no IP address" in output
+
+
+def test_fetch_reports_every_machine_by_hostname(monkeypatch, tmp_path):
+    machines = [
+        inventory.MachineRecord.from_api(
+            {"hostname": "node1", "system_id": "a", "ip_addresses": ["10.0.0.1"]}
+        ),
+        inventory.MachineRecord.from_api({"hostname": "node2", "system_id": "b"}),
+    ]
+    monkeypatch.setattr(
+        inventory, "list_machines_by_names", lambda config, names: machines
+    )
+    monkeypatch.setattr(remote, "SSHPool", FakePool)
+    results = []
+    monkeypatch.setattr(remote, "echo_fetch_results", results.extend)
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "machines",
+            "fetch",
+            "/tmp/setup.log",
+            "--machine-names",
+            "node1,node2",
+            "--dest",
+            str(tmp_path),
+        ],
+    )
+
+    # node2 failed, so the command fails
+    assert result.exit_code == 1, result.output
+    assert [(r.host, r.error) for r in results] == [
+        ("node1", None),
+        ("node2", "no IP address"),
+    ]
+    with open(os.path.join(tmp_path, "node1", "setup.log")) as f:
+        assert f.read() == "10.0.0.1"
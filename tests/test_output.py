@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from cli.libs import output
+from cli.libs.inventory import MachineRecord
+
+
+def record(hostname):
+    return MachineRecord(
+        hostname, f"id-{hostname}", "Ready", "", "dev", None, ["T1"], ["10.0.0.1"]
+    )
+
+
+def failing_records():
+    raise ConnectionError("MAAS is unreachable")
+    yield
+
+
+@pytest.mark.parametrize("output_format", ["text", "json", "ndjson", "csv"])
+def test_nothing_is_written_when_the_listing_fails(capsys, output_format):
+    with pytest.raises(ConnectionError):
+        output.write_records(failing_records(), output_format)
+    assert capsys.readouterr().out == ""
+
+
+def test_json_is_a_valid_document(capsys):
+    output.write_records(iter([record("a"), record("b")]), "json", ["hostname"])
+    assert json.loads(capsys.readouterr().out) == [
+        {"hostname": "a"},
+        {"hostname": "b"},
+    ]
+
+
+def test_json_of_no_records_is_an_empty_list(capsys):
+    output.write_records(iter([]), "json")
+    assert json.loads(capsys.readouterr().out) == []
+
+
+def test_csv_has_a_header_and_flattened_lists(capsys):
+    output.write_records([record("a")], "csv", ["hostname", "tags", "owner"])
+    assert capsys.readouterr().out == "hostname,tags,owner\na,T1,\n"
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from cli.libs.polling import (
+    ExponentialBackoff,
+    FixedInterval,
+    RequestBudget,
+    StateAwareInterval,
+    make_strategy,
+)
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def test_fixed_interval_ignores_attempts_and_statuses():
+    strategy = FixedInterval(7)
+    assert strategy.delay(0, []) == 7
+    assert strategy.delay(10, ["Deploying"]) == 7
+
+
+def test_backoff_grows_by_factor_until_the_cap():
+    strategy = ExponentialBackoff(initial=1, maximum=30, factor=2, jitter=0)
+    delays = [strategy.delay(attempt, []) for attempt in range(8)]
+    assert delays == [1, 2, 4, 8, 16, 30, 30, 30]
+
+
+def test_backoff_stays_at_the_cap_after_many_attempts():
+    strategy = ExponentialBackoff(initial=0.5, maximum=5, jitter=0)
+    assert strategy.delay(5000, []) == 5
+
+
+def test_backoff_jitter_stays_within_its_fraction():
+    strategy = ExponentialBackoff(
+        initial=10, maximum=10, jitter=0.1, rng=random.Random(1)
+    )
+    delays = [strategy.delay(attempt, []) for attempt in range(200)]
+    assert all(9 <= delay <= 11 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_backoff_jitter_is_reproducible_with_a_seeded_rng():
+    first = ExponentialBackoff(rng=random.Random(42))
+    second = ExponentialBackoff(rng=random.Random(42))
+    assert [first.delay(i, []) for i in range(10)] == [
+        second.delay(i, []) for i in range(10)
+    ]
+
+
+def test_state_aware_interval_picks_the_delay_of_the_status():
+    strategy = StateAwareInterval()
+    assert strategy.delay(0, ["Deploying"]) == 30
+    assert strategy.delay(0, ["Installing OS"]) == 15
+    assert strategy.delay(0, ["Rebooting"]) == 5
+
+
+def test_state_aware_interval_uses_the_shortest_delay_of_all_statuses():
+    strategy = StateAwareInterval()
+    assert strategy.delay(0, ["Deploying", "Installing OS", "Configuring OS"]) == 5
+
+
+def test_state_aware_interval_defaults_for_unknown_and_no_statuses():
+    strategy = StateAwareInterval(intervals={"Deploying": 30}, default=3)
+    assert strategy.delay(0, ["Something new"]) == 3
+    assert strategy.delay(0, []) == 3
+
+
+def test_make_strategy_by_name():
+    assert isinstance(make_strategy("fixed"), FixedInterval)
+    assert isinstance(make_strategy("backoff"), ExponentialBackoff)
+    assert isinstance(make_strategy("adaptive"), StateAwareInterval)
+    with pytest.raises(KeyError):
+        make_strategy("nope")
+
+
+def test_request_budget_allows_a_burst_then_spaces_requests():
+    clock = FakeClock()
+    budget = RequestBudget(rate=2, burst=2, clock=clock)
+    assert budget.reserve() == 0
+    assert budget.reserve() == 0
+    assert budget.reserve() == pytest.approx(0.5)
+    assert budget.reserve() == pytest.approx(1.0)
+
+
+def test_request_budget_refills_with_time():
+    clock = FakeClock()
+    budget = RequestBudget(rate=4, burst=1, clock=clock)
+    assert budget.reserve() == 0
+    assert budget.reserve() == pytest.approx(0.25)
+
+    clock.advance(0.25)
+    assert budget.reserve() == pytest.approx(0.25)
+
+    clock.advance(10)
+    assert budget.reserve() == 0
+    assert budget.reserve() == pytest.approx(0.25)
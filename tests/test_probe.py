@@ -0,0 +1,35 @@
+import asyncio
+
+from cli.libs import probe
+
+
+async def probe_server(banner, endpoint_check, timeout=0.3):
+    async def handle(reader, writer):
+        writer.write(banner)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        return await probe.probe_all(
+            [probe.Endpoint("127.0.0.1", port, endpoint_check, timeout)]
+        )
+
+
+def test_ssh_banner_is_ready():
+    (result,) = asyncio.run(probe_server(b"SSH-2.0-OpenSSH_9.6\r\n", "ssh"))
+    assert result.ready
+    assert result.error is None
+
+
+def test_unexpected_banner_is_not_ready():
+    (result,) = asyncio.run(probe_server(b"HTTP/1.1 400 Bad Request\r\n", "ssh"))
+    assert not result.ready
+    assert result.error
+
+
+def test_overlong_banner_fails_the_probe_instead_of_raising():
+    (result,) = asyncio.run(probe_server(b"SSH-" + b"x" * (1 << 17) + b"\r\n", "ssh"))
+    assert not result.ready
+    assert result.error
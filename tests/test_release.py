@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from cli.libs import aio
+
+
+class FailingMachines:
+    """
+    A machines handler whose bulk release fails with a connection error.
+    """
+
+    actions = [("release", None)]
+
+    async def release(self, machines):
+        raise ConnectionError("connection reset")
+
+
+class FakeMachine:
+    def __init__(self, system_id):
+        self.system_id = system_id
+        self.hostname = f"host-{system_id}"
+
+    async def release(self, comment=None):
+        pass
+
+
+def fake_client(handler):
+    return SimpleNamespace(
+        _origin=SimpleNamespace(Machines=SimpleNamespace(_handler=handler))
+    )
+
+
+def test_bulk_release_errors_reach_every_caller():
+    releaser = aio.BulkReleaser(fake_client(FailingMachines()))
+
+    async def release_all():
+        return await asyncio.gather(
+            releaser.release(FakeMachine("a")),
+            releaser.release(FakeMachine("b")),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(asyncio.wait_for(release_all(), timeout=5))
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+def test_release_machines_reports_bulk_release_errors():
+    async def no_wait(machine, end_states):
+        raise AssertionError("released machines are not waited on")
+
+    poller = SimpleNamespace(wait=no_wait)
+    machines = [FakeMachine("a"), FakeMachine("b")]
+
+    results = asyncio.run(
+        asyncio.wait_for(
+            aio.release_machines(
+                fake_client(FailingMachines()), machines, poller=poller
+            ),
+            timeout=5,
+        )
+    )
+    assert results == {"host-a": "connection reset", "host-b": "connection reset"}
+
+
+@pytest.mark.parametrize("count", [1, 2])
+def test_release_succeeds_when_the_batch_is_released(count):
+    releaser = aio.BulkReleaser(fake_client(SimpleNamespace(actions=[])))
+
+    async def release_all():
+        await asyncio.gather(
+            *(releaser.release(FakeMachine(str(i))) for i in range(count))
+        )
+
+    asyncio.run(asyncio.wait_for(release_all(), timeout=5))
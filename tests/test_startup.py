@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tools", "benchmarks"))
+
+import startup  # noqa: E402
+
+# Generous compared to the ~60ms the commands take, so a slow machine doesn't
+# fail the suite, but far below the ~500ms of importing python-libmaas
+BUDGET_MS = 250
+
+
+@pytest.fixture(scope="module")
+def home():
+    with tempfile.TemporaryDirectory() as path:
+        yield path
+
+
+@pytest.mark.parametrize(
+    "args, forbidden", startup.COMMANDS, ids=[" ".join(c[0]) for c in startup.COMMANDS]
+)
+def test_help_is_fast_and_imports_no_client(args, forbidden, home):
+    runs = [startup.measure(args, home) for _ in range(3)]
+    imported = min(run[1][0] for run in runs)
+    modules = runs[0][1][1]
+
+    assert [module for module in forbidden if module in modules] == []
+    assert imported < BUDGET_MS
@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from cli.libs import aio
+from cli.libs.errors import MachineNotFoundError
+from cli.libs.watcher import DEPLOY_END_STATES
+
+
+class FakeMachines:
+    """
+    A machines handler serving a script of statuses per read. Machines that
+    are not in `statuses` don't exist.
+    """
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    async def read(self, id):
+        return [
+            {
+                "system_id": system_id,
+                "hostname": f"host-{system_id}",
+                "status_message": (
+                    self.statuses[system_id].pop(0)
+                    if len(self.statuses[system_id]) > 1
+                    else self.statuses[system_id][0]
+                ),
+            }
+            for system_id in id
+            if system_id in self.statuses
+        ]
+
+
+def fake_client(handler):
+    return SimpleNamespace(
+        _origin=SimpleNamespace(
+            Machines=SimpleNamespace(_handler=handler),
+            Machine=lambda data: SimpleNamespace(**data),
+        )
+    )
+
+
+def machine(system_id, status="Deploying"):
+    return SimpleNamespace(
+        system_id=system_id, hostname=f"host-{system_id}", status_message=status
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    async def sleep(seconds, label):
+        await asyncio.sleep(0)
+
+    monkeypatch.setattr(aio.instrumentation, "sleep", sleep)
+
+
+def test_get_machines_by_system_ids_raises_for_missing_machines():
+    client = fake_client(FakeMachines({"a": ["Deployed"]}))
+    with pytest.raises(MachineNotFoundError, match="b"):
+        asyncio.run(aio.get_machines_by_system_ids(client, ["a", "b"]))
+
+
+def test_waiters_resolve_with_the_end_state():
+    client = fake_client(FakeMachines({"a": ["Installing OS", "Deployed"]}))
+
+    async def wait():
+        return await aio.StatusPoller(client).wait(machine("a"), DEPLOY_END_STATES)
+
+    assert asyncio.run(wait()) == "Deployed"
+
+
+def test_waiters_fail_when_a_machine_is_deleted():
+    client = fake_client(FakeMachines({"a": ["Installing OS"]}))
+
+    async def wait():
+        poller = aio.StatusPoller(client)
+        return await asyncio.gather(
+            poller.wait(machine("a"), DEPLOY_END_STATES),
+            poller.wait(machine("gone"), DEPLOY_END_STATES),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(asyncio.wait_for(wait(), timeout=5))
+    assert all(isinstance(result, MachineNotFoundError) for result in results)
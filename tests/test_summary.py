@@ -0,0 +1,36 @@
+import json
+
+from click.testing import CliRunner
+
+from cli.libs import inventory
+from cli.main import cli
+
+
+def records(config):
+    yield inventory.MachineRecord.from_api(
+        {"hostname": "node1", "system_id": "a", "status_name": "Ready"}
+    )
+    yield inventory.MachineRecord.from_api(
+        {"hostname": "node2", "system_id": "b", "status_name": "Deployed"}
+    )
+
+
+def test_summary_counts_the_fleet(monkeypatch):
+    monkeypatch.setattr(inventory, "iter_machines", records)
+    result = CliRunner().invoke(cli, ["machines", "summary", "--output", "json"])
+    assert result.exit_code == 0
+    report = json.loads(result.stdout)
+    assert report["total"] == 2
+    assert report["available"] == 1
+
+
+def test_summary_fails_when_the_listing_fails(monkeypatch):
+    def failing(config):
+        raise ConnectionError("MAAS is unreachable")
+        yield
+
+    monkeypatch.setattr(inventory, "iter_machines", failing)
+    result = CliRunner().invoke(cli, ["machines", "summary", "--output", "json"])
+    assert result.exit_code == 1
+    assert result.stdout == ""
+    assert "MAAS is unreachable" in result.stderr
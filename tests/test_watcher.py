@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+from cli.libs.polling import FixedInterval
+from cli.libs.watcher import DEPLOY_END_STATES, MachineStatusWatcher
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def machine(system_id, status):
+    return SimpleNamespace(
+        system_id=system_id, hostname=f"host-{system_id}", status_message=status
+    )
+
+
+class FakeFleet:
+    """
+    Serves the machines' statuses from a script of statuses per poll.
+    """
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.polls = 0
+
+    def fetch(self, system_ids):
+        self.polls += 1
+        return [
+            (
+                machine(system_id, self.statuses[system_id].pop(0))
+                if len(self.statuses[system_id]) > 1
+                else machine(system_id, self.statuses[system_id][0])
+            )
+            for system_id in system_ids
+        ]
+
+
+def make_watcher(fleet, clock, timeout=None):
+    return MachineStatusWatcher(
+        fleet.fetch,
+        strategy=FixedInterval(5),
+        timeout=timeout,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+
+def test_watch_yields_transitions_until_end_states():
+    clock = FakeClock()
+    fleet = FakeFleet({"a": ["Installing OS", "Deployed"], "b": ["Deployed"]})
+    watcher = make_watcher(fleet, clock)
+    watcher.add(machine("a", "Deploying"), DEPLOY_END_STATES)
+    watcher.add(machine("b", "Deploying"), DEPLOY_END_STATES)
+
+    transitions = list(watcher.watch())
+
+    assert [(t.machine.system_id, t.status, t.done) for t in transitions] == [
+        ("a", "Installing OS", False),
+        ("b", "Deployed", True),
+        ("a", "Deployed", True),
+    ]
+    assert fleet.polls == 2
+    assert clock.now == 10
+
+
+def test_expire_times_out_machines_past_their_deadline():
+    clock = FakeClock()
+    fleet = FakeFleet({"a": ["Deploying"]})
+    watcher = make_watcher(fleet, clock, timeout=12)
+    watcher.add(machine("a", "Deploying"), DEPLOY_END_STATES)
+
+    assert watcher.expire() == []
+    clock.sleep(12)
+    (transition,) = watcher.expire()
+
+    assert transition.previous == "Deploying"
+    assert transition.status == "Timed out while Deploying"
+    assert transition.done
+    assert watcher.pending == []
+    assert watcher.status("a") == "Timed out while Deploying"
+
+
+def test_watch_stops_at_the_deadline():
+    clock = FakeClock()
+    fleet = FakeFleet({"a": ["Deploying"], "b": ["Deployed"]})
+    watcher = make_watcher(fleet, clock, timeout=12)
+    watcher.add(machine("a", "Deploying"), DEPLOY_END_STATES)
+    watcher.add(machine("b", "Deploying"), DEPLOY_END_STATES)
+
+    transitions = list(watcher.watch())
+
+    assert [(t.machine.system_id, t.status) for t in transitions] == [
+        ("b", "Deployed"),
+        ("a", "Timed out while Deploying"),
+    ]
+    # the last delay is cut short at the deadline instead of a full interval
+    assert clock.now == 12
+
+
+def test_next_delay_is_capped_at_the_nearest_deadline():
+    clock = FakeClock()
+    watcher = make_watcher(FakeFleet({}), clock, timeout=3)
+    watcher.add(machine("a", "Deploying"), DEPLOY_END_STATES)
+    assert watcher.next_delay() == 3
+    clock.sleep(2)
+    assert watcher.next_delay() == 1
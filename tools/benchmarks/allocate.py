@@ -0,0 +1,74 @@
+"""
+Compares the API calls, response bytes and wall time of the legacy
+client-side allocate-from-pool selection with server-side allocation.
+
+Neither path acquires a machine: the legacy path uses MAAS's dry_run
+allocate flag, and a dry run of allocate_from_pool reads the Ready machines
+of the pool with one filtered listing.
+
+Usage:
+    MAAS_SERVER=... MAAS_API_KEY=... python tools/benchmarks/allocate.py POOL --count 3 --tags T1
+"""
+
+import os
+import random
+import time
+
+import click
+from api_counter import CallCounter
+from maas.client import connect
+
+import cli.libs.utils as utils
+from cli.libs.click_config import pass_config
+
+
+def legacy_allocate(client, pool_name, count, tags):
+    machines = client.machines.list()
+    pool_machines = utils.get_machines_by_pool_name(machines, [pool_name])
+    if tags:
+        pool_machines = utils.get_machines_by_tags(pool_machines, tags)
+    ready = [m for m in pool_machines if m.status_name in ["Ready", "Released"]]
+    for machine in random.sample(ready, count):
+        client.machines.allocate(hostname=machine.hostname, dry_run=True)
+
+
+def measure(label, rounds, allocate):
+    with CallCounter() as counter:
+        start = time.monotonic()
+        for _ in range(rounds):
+            allocate()
+        elapsed = time.monotonic() - start
+
+    click.echo(
+        f"{label:<24} {counter.calls / rounds:>8.1f} {counter.bytes / rounds:>14.0f} "
+        f"{elapsed / rounds * 1000:>10.1f}"
+    )
+
+
+@click.command()
+@click.argument("pool-name")
+@click.option("--count", default=1, help="Number of machines to allocate")
+@click.option("--tags", default=None, help="Comma-separated tags (any must match)")
+@click.option("--rounds", default=3, help="Number of runs to average over")
+@pass_config
+def main(config, pool_name, count, tags, rounds):
+    config.client = connect(
+        url=os.environ["MAAS_SERVER"], apikey=os.environ["MAAS_API_KEY"]
+    )
+    tag_list = tags.split(",") if tags else None
+
+    click.echo(f"{'allocation':<24} {'calls':>8} {'bytes':>14} {'ms':>10}")
+    measure(
+        "list + filter (legacy)",
+        rounds,
+        lambda: legacy_allocate(config.client, pool_name, count, tag_list),
+    )
+    measure(
+        "server-side constraints",
+        rounds,
+        lambda: utils.allocate_from_pool(pool_name, count, tag_list, dry_run=True),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Counts MAAS API calls and response bytes made through python-libmaas.
+"""
+
+from maas.client.bones import CallAPI
+from maas.client.utils.maas_async import asynchronous
+
+
+class CallCounter:
+    """
+    Counts API calls and response bytes by wrapping ``CallAPI.dispatch``.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self._dispatch = CallAPI.dispatch
+
+    def __enter__(self):
+        counter = self
+        dispatch = self._dispatch
+
+        @asynchronous
+        async def counting_dispatch(call, uri, body, headers):
+            result = await dispatch(call, uri, body, headers)
+            counter.calls += 1
+            counter.bytes += len(result.content)
+            return result
+
+        CallAPI.dispatch = counting_dispatch
+        return self
+
+    def __exit__(self, *exc_info):
+        CallAPI.dispatch = self._dispatch
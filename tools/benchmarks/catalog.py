@@ -0,0 +1,121 @@
+"""
+Micro-benchmark of the machine selectors on a synthetic fleet.
+
+Compares a linear scan per selector, which is how the get_machines_by_*
+helpers used to work, with queries against a MachineCatalog that is indexed
+once. No MAAS server is needed.
+
+Usage:
+    python tools/benchmarks/catalog.py --fleet-size 10000
+"""
+
+import random
+import timeit
+
+import click
+
+from cli.libs import catalog as query
+from cli.libs.catalog import MachineCatalog
+from cli.libs.inventory import MachineRecord
+
+POOLS = [f"pool-{i}" for i in range(20)]
+TAGS = [f"T{i}" for i in range(50)]
+OWNERS = [None] + [f"user-{i}" for i in range(10)]
+STATUSES = ["Ready", "Allocated", "Deployed", "Deploying", "Failed deployment"]
+
+
+def synthetic_fleet(size, seed=0):
+    rng = random.Random(seed)
+    return [
+        MachineRecord(
+            hostname=f"node-{i:05d}",
+            system_id=f"{i:06x}",
+            status_name=rng.choice(STATUSES),
+            status_message=None,
+            pool_name=rng.choice(POOLS),
+            owner_name=rng.choice(OWNERS),
+            tag_names=rng.sample(TAGS, 3),
+            ip_addresses=[f"10.{i // 65536}.{i // 256 % 256}.{i % 256}"],
+        )
+        for i in range(size)
+    ]
+
+
+def linear_allocate_selection(machines, pool_name, tags):
+    tag_set = {tag.lower() for tag in tags}
+    pool_machines = [
+        machine for machine in machines if machine.pool.name.lower() == pool_name
+    ]
+    tagged = [
+        machine
+        for machine in pool_machines
+        if {t.name.lower() for t in machine.tags}.intersection(tag_set)
+    ]
+    return [
+        machine for machine in tagged if machine.status_name in ["Ready", "Released"]
+    ]
+
+
+def catalog_allocate_selection(catalog, pool_name, tags):
+    return catalog.select(
+        query.pool(pool_name) & query.tag(*tags) & query.status("Ready", "Released")
+    )
+
+
+def report(label, number, statement):
+    seconds = min(timeit.repeat(statement, number=number, repeat=3)) / number
+    click.echo(f"{label:<40} {seconds * 1000:>10.3f} ms")
+
+
+@click.command()
+@click.option("--fleet-size", default=10000, help="Number of synthetic machines")
+@click.option("--number", default=20, help="Iterations per measurement")
+def main(fleet_size, number):
+    machines = synthetic_fleet(fleet_size)
+    catalog = MachineCatalog(machines)
+    names = [machine.hostname for machine in machines[:: max(1, fleet_size // 50)]]
+    name_set = set(names)
+
+    # warm all indexes so the query timings exclude the one-off build
+    for field in MachineCatalog.FIELDS:
+        catalog.index(field)
+
+    assert linear_allocate_selection(
+        machines, "pool-3", ["T1", "T2"]
+    ) == catalog_allocate_selection(catalog, "pool-3", ["T1", "T2"])
+
+    click.echo(f"Fleet size: {fleet_size} machines")
+    report(
+        "build catalog (all indexes)",
+        number,
+        lambda: [MachineCatalog(machines).index(f) for f in MachineCatalog.FIELDS],
+    )
+    report(
+        "pool & tags & status (linear scans)",
+        number,
+        lambda: linear_allocate_selection(machines, "pool-3", ["T1", "T2"]),
+    )
+    report(
+        "pool & tags & status (catalog)",
+        number,
+        lambda: catalog_allocate_selection(catalog, "pool-3", ["T1", "T2"]),
+    )
+    report(
+        f"{len(names)} hostnames (linear scan)",
+        number,
+        lambda: [m for m in machines if m.hostname.lower() in name_set],
+    )
+    report(
+        f"{len(names)} hostnames (catalog)",
+        number,
+        lambda: catalog.select(query.hostname(*names)),
+    )
+    report(
+        "owner | tag (catalog)",
+        number,
+        lambda: catalog.select(query.owner("user-1") | query.tag("T7")),
+    )
+
+
+if __name__ == "__main__":
+    main()
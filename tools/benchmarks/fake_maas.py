@@ -0,0 +1,487 @@
+"""
+A local stand-in for the parts of the MAAS 2.0 API that mctl uses.
+
+It serves a synthetic fleet and simulates the status transitions of
+deployments and releases, so the CLI can be driven end to end without a
+MAAS server. Every request is counted together with the bytes sent and
+received; /_bench/stats returns the counters and POST /_bench/reset builds a
+new fleet and clears them.
+
+Usage:
+    python tools/benchmarks/fake_maas.py --fleet-size 1000 --port 5240
+    MAAS_SERVER=http://127.0.0.1:5240/MAAS/ MAAS_API_KEY=a:b:c mctl machines ls
+"""
+
+import hashlib
+import json
+import random
+import time
+
+import click
+from aiohttp import web
+
+API_PATH = "/MAAS/api/2.0/"
+USERNAME = "admin"
+POOLS = [f"pool-{i}" for i in range(10)]
+TAGS = [f"T{i}" for i in range(20)]
+
+# Handler name, path relative to API_PATH, URI params and actions as
+# (name, op, method). Restful actions have no op.
+HANDLERS = [
+    (
+        "MachinesHandler",
+        "machines/",
+        [],
+        [
+            ("read", None, "GET"),
+            ("allocate", "allocate", "POST"),
+            ("release", "release", "POST"),
+        ],
+    ),
+    (
+        "MachineHandler",
+        "machines/{system_id}/",
+        ["system_id"],
+        [
+            ("read", None, "GET"),
+            ("deploy", "deploy", "POST"),
+            ("release", "release", "POST"),
+        ],
+    ),
+    (
+        "InterfaceHandler",
+        "nodes/{system_id}/interfaces/{id}/",
+        ["system_id", "id"],
+        [("update", None, "PUT")],
+    ),
+    ("TagsHandler", "tags/", [], [("create", None, "POST")]),
+    (
+        "TagHandler",
+        "tags/{name}/",
+        ["name"],
+        [("read", None, "GET"), ("update_nodes", "update_nodes", "POST")],
+    ),
+    ("UsersHandler", "users/", [], [("whoami", "whoami", "GET")]),
+    ("BootResourcesHandler", "boot-resources/", [], [("create", None, "POST")]),
+    ("BootResourceHandler", "boot-resources/{id}/", ["id"], [("read", None, "GET")]),
+]
+
+
+def describe(base_url):
+    """
+    Returns an API description in the format of MAAS's describe/ endpoint.
+    """
+    resources = []
+    for name, path, params, actions in HANDLERS:
+        handler = {
+            "name": name,
+            "doc": "",
+            "path": API_PATH + path,
+            "uri": base_url + API_PATH + path,
+            "params": params,
+            "actions": [
+                {
+                    "name": action,
+                    "op": op,
+                    "method": method,
+                    "restful": op is None,
+                    "doc": "",
+                }
+                for action, op, method in actions
+            ],
+        }
+        resources.append({"name": name, "anon": None, "auth": handler})
+    return {"doc": "MAAS API", "hash": "fake", "resources": resources}
+
+
+class FakeMAAS:
+    """
+    The fleet, boot resources and request counters of the fake server.
+
+    Args:
+        deploy_seconds (float): How long a simulated deployment takes.
+        release_seconds (float): How long a simulated release takes.
+    """
+
+    def __init__(self, deploy_seconds=3, release_seconds=1):
+        self.deploy_seconds = deploy_seconds
+        self.release_seconds = release_seconds
+        self.reset(0)
+
+    def reset(self, fleet_size, deployed=0, seed=0):
+        """
+        Builds a fleet of fleet_size Ready machines, the first `deployed` of
+        which are deployed by USERNAME, and clears the counters.
+        """
+        rng = random.Random(seed)
+        self.machines = {}
+        for i in range(fleet_size):
+            system_id = f"{i:06x}"
+            self.machines[system_id] = {
+                "system_id": system_id,
+                "hostname": f"node-{i:05d}",
+                "fqdn": f"node-{i:05d}.maas",
+                "status_name": "Ready",
+                "status_message": "Ready",
+                "owner": None,
+                "pool": {"id": i % len(POOLS), "name": rng.choice(POOLS)},
+                "tag_names": rng.sample(TAGS, 3),
+                "ip_addresses": [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}"],
+                "interface_set": [
+                    {"id": 2 * i, "name": "eth0", "tags": []},
+                    {"id": 2 * i + 1, "name": "eth1", "tags": ["capture"]},
+                ],
+            }
+            if i < deployed:
+                self._set_status(self.machines[system_id], "Deployed")
+                self.machines[system_id]["owner"] = USERNAME
+        self.tags = set(TAGS)
+        self.schedules = {}
+        self.boot_resources = {}
+        self.uploads = {}
+        self.requests = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+        }
+
+    @staticmethod
+    def _set_status(machine, status_name, status_message=None):
+        machine["status_name"] = status_name
+        machine["status_message"] = status_message or status_name
+
+    def _schedule(self, machine, steps):
+        """
+        Sets the machine to the first step and queues the rest as
+        (seconds from now, status_name, status_message) transitions.
+        """
+        now = time.monotonic()
+        self._set_status(machine, *steps[0][1:])
+        self.schedules[machine["system_id"]] = [
+            (now + delay, *status) for delay, *status in steps[1:]
+        ]
+
+    def machine(self, system_id):
+        """
+        Returns a machine with the transitions that are due applied.
+        """
+        machine = self.machines[system_id]
+        schedule = self.schedules.get(system_id)
+        now = time.monotonic()
+        while schedule and schedule[0][0] <= now:
+            _, status_name, status_message = schedule.pop(0)
+            self._set_status(machine, status_name, status_message)
+        return machine
+
+    def deploy(self, system_id):
+        seconds = self.deploy_seconds
+        machine = self.machines[system_id]
+        machine["owner"] = USERNAME
+        self._schedule(
+            machine,
+            [
+                (0, "Deploying", "Deploying"),
+                (seconds * 0.2, "Deploying", "Performing PXE boot"),
+                (seconds * 0.4, "Deploying", "Installing OS"),
+                (seconds * 0.8, "Deploying", "Configuring OS"),
+                (seconds, "Deployed", "Deployed"),
+            ],
+        )
+        return machine
+
+    def release(self, system_id):
+        machine = self.machines[system_id]
+        machine["owner"] = None
+        self._schedule(
+            machine,
+            [(0, "Releasing", "Releasing"), (self.release_seconds, "Ready", "Ready")],
+        )
+        return machine
+
+    def allocate(self, pool=None, tags=()):
+        for system_id in self.machines:
+            machine = self.machine(system_id)
+            if machine["status_name"] != "Ready":
+                continue
+            if pool and machine["pool"]["name"] != pool:
+                continue
+            if not set(tags) <= set(machine["tag_names"]):
+                continue
+            self._set_status(machine, "Allocated")
+            machine["owner"] = USERNAME
+            return machine
+        return None
+
+    def create_boot_resource(self, name, architecture, size, sha256):
+        resource_id = len(self.boot_resources) + 1
+        self.boot_resources[resource_id] = {
+            "id": resource_id,
+            "type": "Uploaded",
+            "name": name,
+            "architecture": architecture,
+            "subarches": "generic",
+        }
+        self.uploads[resource_id] = {
+            "size": size,
+            "sha256": sha256,
+            "received": 0,
+            "digest": hashlib.sha256(),
+        }
+        return resource_id
+
+    def boot_resource(self, resource_id):
+        """
+        Returns a boot resource with one file, which has an upload_uri and
+        its progress while it is incomplete.
+        """
+        resource = self.boot_resources[resource_id]
+        upload = self.uploads[resource_id]
+        complete = upload["received"] == upload["size"]
+        rfile = {
+            "filename": "root-tgz",
+            "filetype": "root-tgz",
+            "size": upload["size"],
+            "sha256": upload["sha256"],
+            "complete": complete,
+        }
+        if not complete:
+            rfile["progress"] = upload["received"] / upload["size"]
+            rfile["upload_uri"] = f"{API_PATH}boot-resources/{resource_id}/upload/1/"
+        return {
+            **resource,
+            "sets": {
+                "20260101": {
+                    "version": "20260101",
+                    "size": upload["size"],
+                    "label": "uploaded",
+                    "complete": complete,
+                    "files": {"root-tgz": rfile},
+                }
+            },
+        }
+
+
+def json_response(data, status=200):
+    return web.Response(
+        body=json.dumps(data).encode(), status=status, content_type="application/json"
+    )
+
+
+routes = web.RouteTableDef()
+
+
+@web.middleware
+async def count(request, handler):
+    response = await handler(request)
+    if not request.path.startswith("/_bench/"):
+        maas = request.app["maas"]
+        maas.requests += 1
+        maas.request_bytes += request.content_length or 0
+        maas.response_bytes += len(response.body or b"")
+    return response
+
+
+@routes.get(API_PATH + "describe/")
+async def get_describe(request):
+    return json_response(describe(f"{request.scheme}://{request.host}"))
+
+
+@routes.get(API_PATH + "users/")
+async def get_users(request):
+    return json_response(
+        {"username": USERNAME, "email": "admin@example.com", "is_superuser": True}
+    )
+
+
+@routes.get(API_PATH + "machines/")
+async def list_machines(request):
+    maas = request.app["maas"]
+    ids = request.query.getall("id", None)
+    hostnames = request.query.getall("hostname", None)
+    pools = request.query.getall("pool", None)
+    machines = [maas.machine(system_id) for system_id in ids or maas.machines]
+    if hostnames:
+        wanted = set(hostnames)
+        machines = [m for m in machines if m["hostname"] in wanted]
+    if pools:
+        machines = [m for m in machines if m["pool"]["name"] in pools]
+    return json_response(machines)
+
+
+@routes.post(API_PATH + "machines/")
+async def machines_op(request):
+    maas = request.app["maas"]
+    op = request.query.get("op")
+    data = await request.post()
+    if op == "allocate":
+        machine = maas.allocate(data.get("pool"), data.getall("tags", []))
+        if machine is None:
+            return json_response("No machine matches the constraints", 409)
+        if data.get("dry_run"):
+            maas._set_status(machine, "Ready")
+            machine["owner"] = None
+        return json_response(machine)
+    if op == "release":
+        return json_response(
+            [maas.release(system_id) for system_id in data.getall("machines", [])]
+        )
+    return json_response(f"Unknown op {op}", 400)
+
+
+@routes.get(API_PATH + "machines/{system_id}/")
+async def get_machine(request):
+    maas = request.app["maas"]
+    system_id = request.match_info["system_id"]
+    if system_id not in maas.machines:
+        return json_response("Not Found", 404)
+    return json_response(maas.machine(system_id))
+
+
+@routes.post(API_PATH + "machines/{system_id}/")
+async def machine_op(request):
+    maas = request.app["maas"]
+    system_id = request.match_info["system_id"]
+    op = request.query.get("op")
+    await request.post()
+    if system_id not in maas.machines:
+        return json_response("Not Found", 404)
+    if op == "deploy":
+        return json_response(maas.deploy(system_id))
+    if op == "release":
+        return json_response(maas.release(system_id))
+    return json_response(f"Unknown op {op}", 400)
+
+
+@routes.post(API_PATH + "tags/")
+async def create_tag(request):
+    maas = request.app["maas"]
+    data = await request.post()
+    maas.tags.add(data["name"])
+    return json_response({"name": data["name"], "comment": data.get("comment", "")})
+
+
+@routes.get(API_PATH + "tags/{name}/")
+async def get_tag(request):
+    name = request.match_info["name"]
+    if name not in request.app["maas"].tags:
+        return json_response("Not Found", 404)
+    return json_response({"name": name, "comment": ""})
+
+
+@routes.post(API_PATH + "tags/{name}/")
+async def tag_op(request):
+    maas = request.app["maas"]
+    name = request.match_info["name"]
+    op = request.query.get("op")
+    data = await request.post()
+    if name not in maas.tags:
+        return json_response("Not Found", 404)
+    if op != "update_nodes":
+        return json_response(f"Unknown op {op}", 400)
+    added = 0
+    for system_id in data.getall("add", []):
+        tag_names = maas.machines[system_id]["tag_names"]
+        if name not in tag_names:
+            tag_names.append(name)
+            added += 1
+    return json_response({"added": added, "removed": 0})
+
+
+@routes.put(API_PATH + "nodes/{system_id}/interfaces/{id}/")
+async def update_interface(request):
+    maas = request.app["maas"]
+    system_id = request.match_info["system_id"]
+    data = await request.post()
+    if system_id not in maas.machines:
+        return json_response("Not Found", 404)
+    for interface in maas.machines[system_id]["interface_set"]:
+        if interface["id"] == int(request.match_info["id"]):
+            interface["name"] = data.get("name", interface["name"])
+            # like MAAS, an update without tags clears them
+            tags = data.get("tags", "")
+            interface["tags"] = tags.split(",") if tags else []
+            return json_response(interface)
+    return json_response("Not Found", 404)
+
+
+@routes.post(API_PATH + "boot-resources/")
+async def create_boot_resource(request):
+    maas = request.app["maas"]
+    data = await request.post()
+    for resource_id, upload in maas.uploads.items():
+        if upload["sha256"] == data["sha256"]:
+            return json_response(maas.boot_resource(resource_id))
+
+    resource_id = maas.create_boot_resource(
+        data["name"], data["architecture"], int(data["size"]), data["sha256"]
+    )
+    return json_response(maas.boot_resource(resource_id), 201)
+
+
+@routes.get(API_PATH + "boot-resources/{id}/")
+async def get_boot_resource(request):
+    maas = request.app["maas"]
+    return json_response(maas.boot_resource(int(request.match_info["id"])))
+
+
+@routes.put(API_PATH + "boot-resources/{id}/upload/{file_id}/")
+async def upload_chunk(request):
+    upload = request.app["maas"].uploads[int(request.match_info["id"])]
+    async for chunk in request.content.iter_chunked(1 << 16):
+        upload["digest"].update(chunk)
+        upload["received"] += len(chunk)
+    if upload["received"] > upload["size"]:
+        return json_response("Too much content", 400)
+    if (
+        upload["received"] == upload["size"]
+        and upload["digest"].hexdigest() != upload["sha256"]
+    ):
+        return json_response("SHA256 mismatch", 400)
+    return web.Response()
+
+
+@routes.get("/_bench/stats")
+async def get_stats(request):
+    return json_response(request.app["maas"].stats())
+
+
+@routes.post("/_bench/reset")
+async def post_reset(request):
+    maas = request.app["maas"]
+    maas.reset(
+        int(request.query.get("fleet_size", 0)),
+        int(request.query.get("deployed", 0)),
+    )
+    return json_response(maas.stats())
+
+
+def make_app(maas):
+    app = web.Application(middlewares=[count], client_max_size=1 << 30)
+    app["maas"] = maas
+    app.add_routes(routes)
+    return app
+
+
+def serve(port, fleet_size=0, deploy_seconds=3, release_seconds=1):
+    maas = FakeMAAS(deploy_seconds, release_seconds)
+    maas.reset(fleet_size)
+    web.run_app(make_app(maas), host="127.0.0.1", port=port, print=None)
+
+
+@click.command()
+@click.option("--port", default=5240, help="Port to listen on")
+@click.option("--fleet-size", default=1000, help="Number of machines to serve")
+@click.option("--deploy-seconds", default=3.0, help="Duration of a deployment")
+@click.option("--release-seconds", default=1.0, help="Duration of a release")
+def main(port, fleet_size, deploy_seconds, release_seconds):
+    click.echo(f"Serving {fleet_size} machines on http://127.0.0.1:{port}/MAAS/")
+    serve(port, fleet_size, deploy_seconds, release_seconds)
+
+
+if __name__ == "__main__":
+    main()
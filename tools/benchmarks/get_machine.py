@@ -0,0 +1,71 @@
+"""
+Measures the cost of one machine status poll against a live MAAS server.
+
+Compares the legacy lookup, which listed every machine and filtered the
+result in Python, with the direct read used by ``utils.get_machine`` and the
+filtered listing used by ``utils.get_machines_by_system_ids``.
+
+Usage:
+    MAAS_SERVER=... MAAS_API_KEY=... python tools/benchmarks/get_machine.py
+"""
+
+import os
+import time
+
+import click
+from api_counter import CallCounter
+from maas.client import connect
+
+import cli.libs.utils as utils
+from cli.libs.click_config import pass_config
+
+
+def legacy_get_machine(client, system_id):
+    machines = client.machines.list()
+    return [machine for machine in machines if machine.system_id == system_id][0]
+
+
+def measure(label, rounds, lookup):
+    with CallCounter() as counter:
+        start = time.monotonic()
+        for _ in range(rounds):
+            lookup()
+        elapsed = time.monotonic() - start
+
+    click.echo(
+        f"{label:<28} {counter.calls / rounds:>8.1f} {counter.bytes / rounds:>14.0f} "
+        f"{elapsed / rounds * 1000:>10.1f}"
+    )
+
+
+@click.command()
+@click.option("--rounds", default=5, help="Number of polls to average over")
+@click.option("--batch", default=10, help="Number of machines in the batched poll")
+@pass_config
+def main(config, rounds, batch):
+    config.client = connect(
+        url=os.environ["MAAS_SERVER"], apikey=os.environ["MAAS_API_KEY"]
+    )
+    machines = config.client.machines.list()
+    if not machines:
+        raise click.ClickException("The MAAS server has no machines")
+    system_id = machines[0].system_id
+    system_ids = [machine.system_id for machine in machines[:batch]]
+
+    click.echo(f"Fleet size: {len(machines)} machines, {rounds} rounds")
+    click.echo(f"{'lookup':<28} {'calls':>8} {'bytes':>14} {'ms':>10}")
+    measure(
+        "list + filter (legacy)",
+        rounds,
+        lambda: legacy_get_machine(config.client, system_id),
+    )
+    measure("get_machine", rounds, lambda: utils.get_machine(system_id))
+    measure(
+        f"get_machines_by_system_ids({len(system_ids)})",
+        rounds,
+        lambda: utils.get_machines_by_system_ids(system_ids),
+    )
+
+
+if __name__ == "__main__":
+    main()
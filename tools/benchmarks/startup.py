@@ -0,0 +1,122 @@
+"""
+Measures the startup cost of mctl with ``python -X importtime`` and fails
+when it is over budget.
+
+Every command line runs in a fresh interpreter, without a MAAS server. The
+script reports how long the cli package and everything it imported took to
+import, and the wall time of the process. It exits with status 1 when the
+imports of a command exceed the budget, or when it imports a module it
+shouldn't: none of them needs python-libmaas, aiohttp or paramiko to print
+its help.
+
+Usage:
+    PYTHONPATH=src python tools/benchmarks/startup.py --budget-ms 150
+"""
+
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+# Modules that only commands talking to MAAS or to machines import
+CLIENT_MODULES = ["maas.client", "aiohttp", "paramiko", "cryptography"]
+
+# (mctl arguments, top level modules the command must not import)
+COMMANDS = [
+    (["--help"], CLIENT_MODULES + ["toml"]),
+    (["images", "upload", "--help"], CLIENT_MODULES + ["tqdm"]),
+    (["machines", "--help"], CLIENT_MODULES),
+    (["machines", "ls", "--help"], CLIENT_MODULES),
+]
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_times(stderr):
+    """
+    Returns the time in milliseconds the cli package took to import,
+    including everything it imported, and the names of all the imported
+    modules, from the -X importtime output.
+    """
+    cli_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        modules.add(name)
+        if len(match.group(3)) == 1 and (name == "cli" or name.startswith("cli.")):
+            cli_us += int(match.group(2))
+    return cli_us / 1000, modules
+
+
+def measure(args, home):
+    env = {
+        **os.environ,
+        "HOME": home,
+        "MCTL_NO_DAEMON": "1",
+        "MAAS_SERVER": "http://127.0.0.1:1/MAAS/",
+        "MAAS_API_KEY": "bench:bench:bench",
+    }
+    start = time.monotonic()
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "from cli.launcher import main; main()",
+            *args,
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    elapsed = time.monotonic() - start
+    if process.returncode != 0:
+        raise click.ClickException(
+            f"mctl {' '.join(args)} failed:\n{process.stderr[-2000:]}"
+        )
+    return elapsed, import_times(process.stderr)
+
+
+@click.command()
+@click.option("--rounds", default=5, help="Runs per command, the fastest is kept")
+@click.option(
+    "--budget-ms",
+    type=float,
+    default=150,
+    help="Maximum import time of the cli package for each command",
+)
+def main(rounds, budget_ms):
+    failed = False
+    click.echo(f"{'command':<28} {'imports(ms)':>12} {'wall(ms)':>9}  ok")
+    with tempfile.TemporaryDirectory() as home:
+        for args, forbidden in COMMANDS:
+            runs = [measure(args, home) for _ in range(rounds)]
+            elapsed = min(run[0] for run in runs)
+            imported = min(run[1][0] for run in runs)
+            modules = runs[0][1][1]
+            unwanted = [module for module in forbidden if module in modules]
+            over_budget = imported > budget_ms
+
+            ok = not over_budget and not unwanted
+            failed = failed or not ok
+            click.echo(
+                f"{' '.join(args):<28} {imported:>12.1f} {elapsed * 1000:>9.1f}  "
+                f"{'yes' if ok else 'no'}"
+            )
+            if over_budget:
+                click.echo(f"  over the {budget_ms:.0f}ms budget")
+            if unwanted:
+                click.echo(f"  imported {', '.join(unwanted)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
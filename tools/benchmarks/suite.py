@@ -0,0 +1,219 @@
+"""
+End-to-end benchmarks of mctl's hot paths against the fake MAAS server.
+
+For every fleet size, each command runs in-process against a freshly reset
+fake_maas server. The suite records the wall time, the number of API
+requests, and the bytes sent and received. Deployments and releases go
+through the simulated status transitions, so their time includes the status
+polling.
+
+deploy-cluster is run with agents only. A primary server would make it wait
+for SSH and the Kubernetes API, and no real host provides those here.
+
+Usage:
+    python tools/benchmarks/suite.py --fleet-sizes 100,1000,10000 --output results.json
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import click
+from click.testing import CliRunner
+from fake_maas import serve
+from upload import free_port
+
+from cli.main import cli
+
+
+def start_server(deploy_seconds, release_seconds):
+    port = free_port()
+    process = multiprocessing.Process(
+        target=serve,
+        args=(port, 0, deploy_seconds, release_seconds),
+        daemon=True,
+    )
+    process.start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{url}/_bench/stats")
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, url
+
+
+def bench_request(url, path, method="GET"):
+    request = urllib.request.Request(f"{url}/_bench/{path}", method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def scenarios(fleet_size, upload_file):
+    """
+    Returns (name, deployed machines at the start, mctl arguments) for each
+    benchmarked command.
+    """
+    deployed = min(20, fleet_size)
+    agents = ",".join(f"node-{i:05d}" for i in range(deployed, deployed + 5))
+    return [
+        ("machines ls", deployed, ["machines", "ls"]),
+        (
+            "machines allocate-from-pool",
+            deployed,
+            ["machines", "allocate-from-pool", "pool-1", "--count", "3"],
+        ),
+        (
+            "machines release",
+            deployed,
+            ["machines", "release", "--owner", "admin", "--parallelism", "50"],
+        ),
+        (
+            "machines deploy-cluster",
+            deployed,
+            ["machines", "deploy-cluster", "--agents", agents, "--parallelism", "5"],
+        ),
+        (
+            "images upload",
+            deployed,
+            [
+                "images",
+                "upload",
+                upload_file,
+                "--name",
+                "custom/bench",
+                "--architecture",
+                "amd64/generic",
+                "--title",
+                "bench",
+            ],
+        ),
+    ]
+
+
+def run_scenario(runner, url, fleet_size, deployed, args, poll_strategy):
+    bench_request(url, f"reset?fleet_size={fleet_size}&deployed={deployed}", "POST")
+    start = time.monotonic()
+    result = runner.invoke(cli, ["--poll-strategy", poll_strategy, *args])
+    elapsed = time.monotonic() - start
+    stats = bench_request(url, "stats")
+    failed = result.exit_code != 0 or "An error occurred" in result.output
+    return {**stats, "seconds": round(elapsed, 4), "ok": not failed}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option(
+    "--fleet-sizes",
+    default="100,1000,10000",
+    help="Comma-separated fleet sizes to benchmark",
+)
+@click.option("--rounds", default=1, help="Runs per command, the fastest is kept")
+@click.option("--upload-mib", default=32, help="Size of the uploaded image in MiB")
+@click.option("--deploy-seconds", default=3.0, help="Duration of a deployment")
+@click.option("--release-seconds", default=1.0, help="Duration of a release")
+@click.option(
+    "--poll-strategy",
+    type=click.Choice(["fixed", "backoff", "adaptive"]),
+    default="backoff",
+    help="Status polling strategy used by release and deploy-cluster",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the results as JSON to this file",
+)
+def main(
+    fleet_sizes,
+    rounds,
+    upload_mib,
+    deploy_seconds,
+    release_seconds,
+    poll_strategy,
+    output,
+):
+    process, url = start_server(deploy_seconds, release_seconds)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as home:
+            upload_file = os.path.join(home, "image.tgz")
+            with open(upload_file, "wb") as f:
+                for _ in range(upload_mib):
+                    f.write(os.urandom(1 << 20))
+
+            runner = CliRunner(
+                env={
+                    "HOME": home,
+                    "MAAS_SERVER": f"{url}/MAAS/",
+                    "MAAS_API_KEY": "bench:bench:bench",
+                }
+            )
+            click.echo(
+                f"{'command':<30} {'fleet':>6} {'seconds':>8} {'requests':>9} "
+                f"{'sent':>10} {'received':>10}  ok"
+            )
+            for fleet_size in (int(size) for size in fleet_sizes.split(",")):
+                for name, deployed, args in scenarios(fleet_size, upload_file):
+                    runs = [
+                        run_scenario(
+                            runner, url, fleet_size, deployed, args, poll_strategy
+                        )
+                        for _ in range(rounds)
+                    ]
+                    result = {
+                        "command": name,
+                        "fleet_size": fleet_size,
+                        **min(runs, key=lambda run: run["seconds"]),
+                    }
+                    results.append(result)
+                    click.echo(
+                        f"{name:<30} {fleet_size:>6} {result['seconds']:>8.2f} "
+                        f"{result['requests']:>9} {result['request_bytes']:>10} "
+                        f"{result['response_bytes']:>10}  "
+                        f"{'yes' if result['ok'] else 'no'}"
+                    )
+    finally:
+        process.terminate()
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(
+                {
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "commit": git_commit(),
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "settings": {
+                        "rounds": rounds,
+                        "upload_mib": upload_mib,
+                        "deploy_seconds": deploy_seconds,
+                        "release_seconds": release_seconds,
+                        "poll_strategy": poll_strategy,
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        click.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
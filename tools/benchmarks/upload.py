@@ -0,0 +1,154 @@
+"""
+Benchmarks the chunked boot resource upload against a local stub server.
+
+For every chunk size, a file of --size-mib MiB is hashed and streamed to a
+stub that accepts MAAS-style chunk PUTs, and the throughput and peak Python
+memory are reported. A second run fails the upload at --fail-at of the file
+and resumes it, to compare the bytes sent with starting over.
+
+No MAAS server is needed.
+
+Usage:
+    python tools/benchmarks/upload.py --size-mib 1024 --chunk-mib 1,4,8,16
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+import tracemalloc
+
+import click
+from aiohttp import web
+from maas.client.bones import CallError
+
+from cli.libs import upload
+
+
+def stub_server(port, fail_at):
+    """
+    Accepts chunk PUTs on /upload/ and answers 500 once the received bytes
+    would pass fail_at. GET /upload/ returns the number of bytes received.
+    """
+    received = 0
+    failed = False
+
+    async def put(request):
+        nonlocal received, failed
+        length = int(request.headers["Content-Length"])
+        if fail_at and not failed and received + length > fail_at:
+            failed = True
+            await request.read()
+            return web.Response(status=500, text="connection lost")
+        async for chunk in request.content.iter_chunked(1 << 16):
+            received += len(chunk)
+        return web.Response()
+
+    async def get(request):
+        return web.Response(text=str(received))
+
+    app = web.Application(client_max_size=1 << 30)
+    app.router.add_put("/upload/", put)
+    app.router.add_get("/upload/", get)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(fail_at=0):
+    port = free_port()
+    process = multiprocessing.Process(
+        target=stub_server, args=(port, fail_at), daemon=True
+    )
+    process.start()
+    for _ in range(100):
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                break
+        time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}/upload/"
+
+
+def run_upload(path, uri, chunk_size, offset=0):
+    return asyncio.run(upload.put_file(uri, path, offset, chunk_size, progress=False))
+
+
+def measure(path, chunk_size):
+    process, uri = start_stub()
+    try:
+        tracemalloc.start()
+        start = time.monotonic()
+        upload.hash_file(path, chunk_size, progress=False)
+        hashed = time.monotonic()
+        run_upload(path, uri, chunk_size)
+        uploaded = time.monotonic()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        process.terminate()
+
+    size_mib = os.path.getsize(path) / (1 << 20)
+    click.echo(
+        f"{chunk_size >> 20:>9} {size_mib / (hashed - start):>12.0f} "
+        f"{size_mib / (uploaded - hashed):>12.0f} {peak / (1 << 20):>12.1f}"
+    )
+
+
+def measure_resume(path, chunk_size, fail_at):
+    size = os.path.getsize(path)
+    process, uri = start_stub(int(size * fail_at))
+    try:
+        confirmed = 0
+
+        def confirm(offset):
+            nonlocal confirmed
+            confirmed = offset
+
+        try:
+            asyncio.run(
+                upload.put_file(
+                    uri, path, 0, chunk_size, progress=False, on_chunk=confirm
+                )
+            )
+        except CallError:
+            pass
+        run_upload(path, uri, chunk_size, confirmed)
+    finally:
+        process.terminate()
+
+    resent = size - confirmed
+    click.echo(
+        f"Interrupted at {fail_at:.0%}: resuming sent {resent / (1 << 20):.0f} MiB, "
+        f"starting over would send {size / (1 << 20):.0f} MiB"
+    )
+
+
+@click.command()
+@click.option("--size-mib", default=512, help="Size of the test file in MiB")
+@click.option(
+    "--chunk-mib", default="1,4,8,16", help="Comma-separated chunk sizes in MiB"
+)
+@click.option("--fail-at", default=0.9, help="Fraction of the upload to fail at")
+def main(size_mib, chunk_mib, fail_at):
+    with tempfile.NamedTemporaryFile() as f:
+        block = os.urandom(1 << 20)
+        for _ in range(size_mib):
+            f.write(block)
+        f.flush()
+
+        click.echo(
+            f"{'chunk MiB':>9} {'hash MiB/s':>12} {'put MiB/s':>12} {'peak MiB':>12}"
+        )
+        for chunk in chunk_mib.split(","):
+            measure(f.name, int(chunk) << 20)
+        measure_resume(f.name, upload.DEFAULT_CHUNK_SIZE, fail_at)
+
+
+if __name__ == "__main__":
+    main()